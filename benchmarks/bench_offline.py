@@ -0,0 +1,402 @@
+"""
+Offline benchmark of the parsing and matching stages of retrieve_songs.py
+
+Replays the recorded pages in benchmarks/fixtures/ (see labels.json)
+through the same functions the live run uses, without a browser or any
+network traffic:
+- spotify_parse: parse_song_details on the Spotify track pages
+- rendered_parse: video_list_from_rendered_page on the Chrome-rendered
+    youtube results pages (the selenium search backend)
+- initial_data_parse: parse_yt_initial_data and
+    video_list_from_initial_data on the raw results pages (the http
+    search backend)
+- match: parse_search_query and match_song_and_video on the videos
+    extracted from the rendered pages
+- match_batch: match_songs_and_videos on all tracks of a round at once,
+    reported per track. It must match the same videos as the "match"
+    stage, the benchmark fails with an AssertionError otherwise.
+and reports p50/p95 latency and throughput of each, together with the
+fraction of tracks whose matched video is one of the labeled answers.
+
+Only "recorded" tracks, real pages labeled by hand (see
+record_fixtures.py and fixtures/sample_tracks.txt), count towards the
+match accuracy. The "synthetic" tracks of make_fixtures.py are labeled by
+the same generator that wrote their pages, so the matcher agreeing with
+those labels says nothing about how it does on the live site. Their
+fraction is reported apart, as the "synthetic agreement", and serves as
+a regression check only. Tracks recorded without expected videos are
+left out of both. With --memory the peak memory of parsing a page is
+measured as well.
+
+Each stage's console output is discarded while it is timed, as in a
+--quiet run. Results can be saved with --json and a later run compared
+against them with --baseline, which exits with status 1 when a stage got
+slower than the tolerance allows, or the match accuracy or the synthetic
+agreement dropped.
+
+Usage:
+    python benchmarks/bench_offline.py [--repeat 20] [--pad-kb 400]
+        [--memory] [--json results.json] [--baseline results.json] [--tolerance 0.25]
+"""
+import argparse
+import collections
+import contextlib
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import retrieve_songs  # noqa: E402
+
+FIXTURES_DIR = os.path.join(BENCH_DIR, "fixtures")
+
+# Real rendered results pages carry a few hundred kB of styles, scripts and
+# templates around the result renderers, which the fixtures leave out
+_PAD_CHUNK = (
+    '<style>ytd-video-renderer[use-search-ui] #channel-info.'
+    'ytd-video-renderer{margin:8px 0 0}</style>'
+    '<dom-module id="ytd-fixture-pad"><template><div class="style-scope">'
+    '<span></span></div></template></dom-module>\n'
+)
+
+
+def load_corpus(fixtures_dir=FIXTURES_DIR):
+    """
+    Read labels.json and the pages it refers to
+
+    :return: List of label dictionaries, each with the page contents
+        under the keys of their paths
+    :rtype: list
+    """
+    with open(os.path.join(fixtures_dir, "labels.json"),
+              encoding="utf-8") as f:
+        labels = json.load(f)
+    for label in labels:
+        for key in ("spotify_page", "rendered_page", "raw_page"):
+            if not label.get(key):
+                label[key + "_source"] = None
+                continue
+            with open(os.path.join(fixtures_dir, label[key]),
+                      encoding="utf-8") as f:
+                label[key + "_source"] = f.read()
+    return labels
+
+
+def pad_page(page_source, pad_kb):
+    """
+    Insert roughly pad_kb kilobytes of inert markup in front of the
+    results, the way the site's own styles and templates precede them
+    """
+    if not pad_kb or page_source is None:
+        return page_source
+    padding = _PAD_CHUNK * (pad_kb * 1024 // len(_PAD_CHUNK) + 1)
+    at = page_source.find("<body>")
+    at = 0 if at == -1 else at + len("<body>")
+    return page_source[:at] + padding + page_source[at:]
+
+
+def timed(func, *args):
+    """
+    Call func(*args) with its prints discarded
+
+    :return: (result, seconds)
+    :rtype: tuple
+    """
+    with open(os.devnull, "w") as devnull, \
+            contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        result = func(*args)
+        return result, time.perf_counter() - start
+
+
+def peak_kb(func, *args):
+    """
+    Peak memory in kB python allocates while running func(*args)
+    """
+    with open(os.devnull, "w") as devnull, \
+            contextlib.redirect_stdout(devnull):
+        tracemalloc.start()
+        try:
+            func(*args)
+            return tracemalloc.get_traced_memory()[1] / 1024
+        finally:
+            tracemalloc.stop()
+
+
+def _percentile(sorted_values, q):
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    total = sum(samples)
+    return {
+        "count": len(samples),
+        "p50_ms": _percentile(samples, 0.50) * 1000,
+        "p95_ms": _percentile(samples, 0.95) * 1000,
+        "mean_ms": statistics.fmean(samples) * 1000,
+        "ops_per_s": len(samples) / total if total else float("inf"),
+    }
+
+
+def _initial_data_video_list(page_source):
+    return retrieve_songs.video_list_from_initial_data(
+        retrieve_songs.parse_yt_initial_data(page_source)
+        )
+
+
+def _search_query(song_data):
+    with open(os.devnull, "w") as devnull, \
+            contextlib.redirect_stdout(devnull):
+        return retrieve_songs.parse_search_query(dict(song_data))
+
+
+def _match(song_data, video_list):
+    song_data = dict(song_data)
+    song_data["search_query"] = retrieve_songs.parse_search_query(song_data)
+    return retrieve_songs.match_song_and_video(
+        song_data, video_list, single=False
+        )
+
+
+def measure_memory(corpus, pad_kb=0):
+    """
+    Largest peak memory of the page parsing stages over the corpus
+
+    :rtype: dict
+    """
+    peaks = {"rendered_parse": 0, "initial_data_parse": 0}
+    for label in corpus:
+        if label["rendered_page_source"] is not None:
+            peaks["rendered_parse"] = max(peaks["rendered_parse"], peak_kb(
+                retrieve_songs.video_list_from_rendered_page,
+                pad_page(label["rendered_page_source"], pad_kb)
+                ))
+        if label["raw_page_source"] is not None:
+            peaks["initial_data_parse"] = max(
+                peaks["initial_data_parse"],
+                peak_kb(_initial_data_video_list, label["raw_page_source"])
+                )
+    return peaks
+
+
+def run(corpus, repeat=1, pad_kb=0, memory=False):
+    """
+    Run every stage over the corpus, repeat times, and with memory
+    measure the peak memory of parsing the pages in one more pass
+
+    :return: Dictionary with the per-stage summaries under "stages",
+        the match accuracy of the recorded tracks under "accuracy" and
+        the agreement with the synthetic labels under
+        "synthetic_agreement", either None without such tracks
+    :rtype: dict
+    """
+    samples = {
+        "spotify_parse": [],
+        "rendered_parse": [],
+        "initial_data_parse": [],
+        "match": [],
+        "match_batch": [],
+    }
+    rendered_pages = [pad_page(label["rendered_page_source"], pad_kb)
+                      for label in corpus]
+    correct, total = collections.Counter(), collections.Counter()
+    for round_ in range(repeat):
+        search_queries, video_lists = list(), list()
+        song_datas, matched, urls = list(), list(), list()
+        for label, rendered_page in zip(corpus, rendered_pages):
+            song_data = None
+            if label["spotify_page_source"] is not None:
+                song_data, seconds = timed(
+                    retrieve_songs.parse_song_details,
+                    label["spotify_page_source"], label["url"]
+                    )
+                samples["spotify_parse"].append(seconds)
+            if song_data is None:
+                song_data = {"song": label["song"],
+                             "artists": label["artists"]}
+
+            if label["raw_page_source"] is not None:
+                _, seconds = timed(_initial_data_video_list,
+                                   label["raw_page_source"])
+                samples["initial_data_parse"].append(seconds)
+
+            if rendered_page is None:
+                continue
+            video_list, seconds = timed(
+                retrieve_songs.video_list_from_rendered_page, rendered_page
+                )
+            samples["rendered_parse"].append(seconds)
+            if not video_list:
+                continue
+
+            matched_video_url, seconds = timed(_match, song_data, video_list)
+            samples["match"].append(seconds)
+            search_queries.append(_search_query(song_data))
+            video_lists.append(video_list)
+            song_datas.append(song_data)
+            matched.append(matched_video_url)
+            urls.append(label["url"])
+            if round_ == 0 and label["expected"]:
+                source = label.get("source", "recorded")
+                total[source] += 1
+                correct[source] += any(matched_video_url.endswith(href)
+                                       for href in label["expected"])
+
+        if video_lists:
+            batch, seconds = timed(retrieve_songs.match_songs_and_videos,
+                                   search_queries, video_lists, None,
+                                   song_datas)
+            disagree = [
+                url for url, single, batched in zip(urls, matched, batch)
+                if single != batched
+                ]
+            assert batch == matched, \
+                "match_batch disagrees with match on {}".format(disagree)
+            samples["match_batch"].extend(
+                [seconds / len(video_lists)] * len(video_lists)
+                )
+    stages = {name: summarize(values)
+              for name, values in samples.items() if values}
+    if memory:
+        for name, peak in measure_memory(corpus, pad_kb).items():
+            if name in stages:
+                stages[name]["peak_kb"] = peak
+    return {
+        "tracks": len(corpus),
+        "repeat": repeat,
+        "pad_kb": pad_kb,
+        "stages": stages,
+        "accuracy": _fraction(correct, total, "recorded"),
+        "synthetic_agreement": _fraction(correct, total, "synthetic"),
+    }
+
+
+def _fraction(correct, total, source):
+    if not total[source]:
+        return None
+    return correct[source] / total[source]
+
+
+def compare(results, baseline, tolerance):
+    """
+    :return: Human readable regressions of results against baseline, an
+        empty list when there are none
+    :rtype: list
+    """
+    regressions = list()
+    for name, stage in results["stages"].items():
+        before = baseline.get("stages", {}).get(name)
+        if before is None:
+            continue
+        if stage["p50_ms"] > before["p50_ms"] * (1 + tolerance):
+            regressions.append("{}: p50 {:.3f} ms -> {:.3f} ms".format(
+                name, before["p50_ms"], stage["p50_ms"]
+                ))
+    before = dict(baseline)
+    accuracy = before.get("accuracy")
+    if isinstance(accuracy, dict):
+        # Results saved with the fractions of every label source together
+        before["accuracy"] = accuracy.get("recorded")
+        before["synthetic_agreement"] = accuracy.get("synthetic")
+    elif "synthetic_agreement" not in before:
+        # Results saved before recorded tracks existed at all
+        before["accuracy"], before["synthetic_agreement"] = None, accuracy
+    for key in ("accuracy", "synthetic_agreement"):
+        if results[key] is None or before.get(key) is None:
+            continue
+        if results[key] < before[key]:
+            regressions.append("{}: {:.3f} -> {:.3f}".format(
+                key, before[key], results[key]
+                ))
+    return regressions
+
+
+def print_results(results):
+    print("{} tracks x {} rounds, pages padded by {} kB".format(
+        results["tracks"], results["repeat"], results["pad_kb"]
+        ))
+    print("{:<20} {:>8} {:>10} {:>10} {:>10}".format(
+        "stage", "count", "p50 ms", "p95 ms", "ops/s"
+        ))
+    for name, stage in results["stages"].items():
+        print("{:<20} {:>8} {:>10.3f} {:>10.3f} {:>10.1f}".format(
+            name, stage["count"], stage["p50_ms"], stage["p95_ms"],
+            stage["ops_per_s"]
+            ))
+    for name, stage in results["stages"].items():
+        if "peak_kb" in stage:
+            print("{:<20} peak memory {:>10.1f} kB".format(
+                name, stage["peak_kb"]
+                ))
+    if results["accuracy"] is not None:
+        print("match accuracy (recorded): {:.1%}".format(
+            results["accuracy"]
+            ))
+    else:
+        print("match accuracy: n/a, no hand-labeled recorded tracks")
+    if results["synthetic_agreement"] is not None:
+        print("synthetic agreement: {:.1%} (regression check, "
+              "not accuracy)".format(results["synthetic_agreement"]))
+
+
+def main():
+    argparser = argparse.ArgumentParser(
+        description = "Benchmark parsing and matching on recorded pages"
+        )
+    argparser.add_argument(
+        "--fixtures", default = FIXTURES_DIR,
+        help = "Directory holding labels.json and the pages"
+        )
+    argparser.add_argument(
+        "--repeat", type = int, default = 5,
+        help = "Passes over the corpus, e.g. 20 x 24 tracks for a batch "
+            "of a few hundred songs"
+        )
+    argparser.add_argument(
+        "--pad-kb", type = int, default = 0,
+        help = "Pad the rendered results pages to realistic size"
+        )
+    argparser.add_argument(
+        "--memory", action = "store_true",
+        help = "Also measure the peak memory of parsing the pages"
+        )
+    argparser.add_argument(
+        "--json", metavar = "PATH",
+        help = "Save the results as JSON"
+        )
+    argparser.add_argument(
+        "--baseline", metavar = "PATH",
+        help = "Results JSON of an earlier run to compare against"
+        )
+    argparser.add_argument(
+        "--tolerance", type = float, default = 0.25,
+        help = "Allowed relative p50 slowdown against --baseline"
+        )
+    args = argparser.parse_args()
+
+    results = run(
+        load_corpus(args.fixtures), args.repeat, args.pad_kb, args.memory
+        )
+    print_results(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print("REGRESSION " + regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Startup time benchmark of retrieve_songs.py
+
+Measures, in fresh interpreters, the wall time of
+- import: importing the module
+- help: running the CLI with --help
+and lists the heavy third party and standard library packages that are
+loaded by merely importing the module. Those are meant to be imported
+lazily, by the code path that uses them, so short jobs (e.g. --help,
+cached lookups) do not pay for selenium, bs4, requests and friends.
+
+The run fails (exit status 1) when one of :data:'LAZY_MODULES' is loaded
+at import time, or, given --baseline, when a measurement got slower than
+the tolerance allows.
+
+Usage:
+    python benchmarks/bench_startup.py [--repeat 10] [--json results.json]
+        [--baseline results.json] [--tolerance 0.25]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+SCRIPT = os.path.join(ROOT_DIR, "retrieve_songs.py")
+
+# Loaded only by the code paths that need them
+LAZY_MODULES = [
+    "asyncio", "bs4", "http.server", "lxml", "multiprocessing", "numpy",
+    "pandas", "pyarrow", "rapidfuzz", "requests", "selenium", "urllib3",
+]
+
+_IMPORT = "import sys; sys.path.insert(0, {!r}); import retrieve_songs".format(
+    ROOT_DIR
+    )
+_LIST_MODULES = _IMPORT + "; import json; print(json.dumps(sorted(sys.modules)))"
+
+
+def wall_time(argv):
+    start = time.perf_counter()
+    subprocess.run(argv, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                   check=True)
+    return time.perf_counter() - start
+
+
+def summarize(samples):
+    return {
+        "min_ms": min(samples) * 1000,
+        "median_ms": statistics.median(samples) * 1000,
+        "max_ms": max(samples) * 1000,
+    }
+
+
+def eager_lazy_modules():
+    """
+    :return: The :data:'LAZY_MODULES' that importing the module loads
+    :rtype: list
+    """
+    loaded = set(json.loads(subprocess.run(
+        [sys.executable, "-c", _LIST_MODULES],
+        capture_output=True, check=True, text=True,
+        ).stdout))
+    return [name for name in LAZY_MODULES if name in loaded]
+
+
+def run(repeat=10):
+    commands = {
+        "import": [sys.executable, "-c", _IMPORT],
+        "help": [sys.executable, SCRIPT, "--help"],
+    }
+    # A warm-up run of each fills the OS file cache and __pycache__
+    for argv in commands.values():
+        wall_time(argv)
+    return {
+        "repeat": repeat,
+        "python": sys.version.split()[0],
+        "timings": {
+            name: summarize([wall_time(argv) for _ in range(repeat)])
+            for name, argv in commands.items()
+        },
+        "eager_modules": eager_lazy_modules(),
+    }
+
+
+def compare(results, baseline, tolerance):
+    regressions = list()
+    for name, timing in results["timings"].items():
+        before = baseline.get("timings", {}).get(name)
+        if before is None:
+            continue
+        if timing["median_ms"] > before["median_ms"] * (1 + tolerance):
+            regressions.append("{}: median {:.1f} ms -> {:.1f} ms".format(
+                name, before["median_ms"], timing["median_ms"]
+                ))
+    return regressions
+
+
+def main():
+    argparser = argparse.ArgumentParser(
+        description = "Benchmark the startup time of retrieve_songs.py"
+        )
+    argparser.add_argument(
+        "--repeat", type = int, default = 10,
+        help = "Fresh interpreters started per measurement"
+        )
+    argparser.add_argument(
+        "--json", metavar = "PATH",
+        help = "Save the results as JSON"
+        )
+    argparser.add_argument(
+        "--baseline", metavar = "PATH",
+        help = "Results JSON of an earlier run to compare against"
+        )
+    argparser.add_argument(
+        "--tolerance", type = float, default = 0.25,
+        help = "Allowed relative slowdown of the median against --baseline"
+        )
+    args = argparser.parse_args()
+
+    results = run(args.repeat)
+    print("python {}, {} runs each".format(results["python"], args.repeat))
+    print("{:<10} {:>10} {:>10} {:>10}".format(
+        "command", "min ms", "median ms", "max ms"
+        ))
+    for name, timing in results["timings"].items():
+        print("{:<10} {:>10.1f} {:>10.1f} {:>10.1f}".format(
+            name, timing["min_ms"], timing["median_ms"], timing["max_ms"]
+            ))
+    failures = list()
+    if results["eager_modules"]:
+        failures.append("imported eagerly: " + ", ".join(
+            results["eager_modules"]
+            ))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            failures += compare(results, json.load(f), args.tolerance)
+    for failure in failures:
+        print("REGRESSION " + failure)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
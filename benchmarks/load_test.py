@@ -0,0 +1,332 @@
+"""
+Load test of the batch pipeline of retrieve_songs.py against the local
+stand-in servers, on one machine and without network access
+
+Starts standin_server.py, points retrieve_songs.py at it (see
+SPOTIFY2YOUTUBE_SPOTIFY_URL and SPOTIFY2YOUTUBE_YOUTUBE_URL) and pushes
+--tracks synthetic track URLs through run_pipeline with the http search
+backend, i.e. metadata, search, match and, with --download, the download
+of the fake media by standin_downloader.py (put on the PATH as yt-dlp).
+With --downloader segmented the stand-in only resolves the stream and
+the media is fetched in --segments parallel ranges. This is repeated for
+every --concurrency, the number of workers of each stage and of requests
+in flight per host.
+
+Reported per concurrency:
+- throughput in tracks per second
+- p50/p95/p99 latency of a track, from entering the pipeline until its
+    result, so queueing in front of a busy stage is included
+- p95 of every stage, and the failed, throttled and retried requests
+- CPU use, as a share of all cores, of the pipeline (this process), of
+    the downloader processes it ran and of the stand-in server
+
+Everything runs on the one machine, so once the CPU is used up more
+concurrency only queues more tracks. With --download every track starts
+a downloader process (standin_downloader.py, or the real yt-dlp, both
+python programs), ~0.12 CPU seconds a track against ~0.01 for the rest
+of the pipeline; on a single core that caps a run at ~7 tracks/s with
+either --downloader and the default --media-kb, from 4 workers on,
+while p50 latency grows with the tracks in flight (the stage queues hold
+up to twice the workers each). Check the cpu column before reading a
+flat throughput as a limit of the pipeline.
+
+Results can be saved with --json. The latency and failures of the
+stand-in are set with the options of standin_server.py given after "--".
+
+Usage:
+    python benchmarks/load_test.py [--tracks 2000] [--concurrency 1,4,16]
+        [--download] [--downloader segmented] [--json results.json]
+        [-- --latency 50 --jitter 20 --throttle-rate 0.01]
+"""
+import argparse
+import asyncio
+import collections
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import string
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+
+def start_standin(server_args):
+    """
+    Run standin_server.py on a free port
+
+    :return: The (process, base URL) pair
+    :rtype: tuple
+    """
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(BENCH_DIR, "standin_server.py"),
+         "--port", "0"] + server_args,
+        stdout = subprocess.PIPE,
+        text = True,
+        )
+    line = process.stdout.readline()
+    if not line.startswith("# Stand-in serving on "):
+        process.kill()
+        raise RuntimeError("The stand-in did not start: {!r}".format(line))
+    return process, line.split()[4]
+
+
+def install_standin_downloader(bin_dir):
+    """
+    Put standin_downloader.py on the PATH as "yt-dlp"
+    """
+    path = os.path.join(bin_dir, "yt-dlp")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("#!{}\nimport runpy\nrunpy.run_path({!r}, "
+                "run_name='__main__')\n".format(
+                    sys.executable,
+                    os.path.join(BENCH_DIR, "standin_downloader.py"),
+                    ))
+    os.chmod(path, 0o755)
+    os.environ["PATH"] = bin_dir + os.pathsep + os.environ["PATH"]
+
+
+def synthetic_urls(base_url, count, seed=2022):
+    rng = random.Random(seed)
+    alphabet = string.ascii_letters + string.digits
+    return [
+        base_url + "/track/" + "".join(rng.choice(alphabet) for _ in range(22))
+        for _ in range(count)
+    ]
+
+
+def _server_cpu_seconds(base_url):
+    with urllib.request.urlopen(base_url + "/__stats", timeout=10) as response:
+        return json.load(response).get("cpu_seconds", 0.0)
+
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def run_load(retrieve_songs, urls, concurrency, base_url, download_dir=None,
+             max_retries=2, downloader="ytdlp", segments=4):
+    """
+    Push :param:'urls' through the pipeline with :param:'concurrency'
+    workers per stage
+
+    :param download_dir: Download into this directory, None skips the
+        download stage
+    :return: The measurements of the run
+    :rtype: dict
+    """
+    host = base_url.split("//", 1)[1]
+    argv = [
+        "retrieve_songs.py",
+        "--search-backend", "http",
+        "--no-cache", "--quiet",
+        "--metadata-workers", str(concurrency),
+        "--search-workers", str(concurrency),
+        "--max-per-host", str(concurrency),
+        "--rate-limit", "{}=100000".format(host),
+        "--max-retries", str(max_retries),
+    ]
+    if download_dir is not None:
+        argv += [
+            "--download",
+            "--download-workers", str(concurrency),
+            "--download-dir", download_dir,
+            "--audio-format", "native",
+            "--no-archive",
+            "--downloader", downloader,
+            "--segments", str(segments),
+        ]
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(contextlib.redirect_stdout(io.StringIO()))
+        sys.argv = argv
+        _, cli_args = retrieve_songs.read_cli_inputs()
+    retrieve_songs.VERBOSE = False
+    retrieve_songs.METRICS = retrieve_songs.Metrics()
+    retrieve_songs.configure_rate_limiter(cli_args)
+    download_scheduler = None
+    if download_dir is not None:
+        download_scheduler = retrieve_songs.DownloadScheduler(
+            workers = concurrency,
+            timeout = cli_args.download_timeout,
+            retries = cli_args.download_retries,
+            audio_format = cli_args.audio_format,
+            download_dir = download_dir,
+            downloader = cli_args.downloader,
+            segments = cli_args.segments,
+            )
+
+    admitted, latencies, failed = list(), list(), [0]
+    stage_times = collections.defaultdict(list)
+
+    def admit(urls):
+        for url in urls:
+            admitted.append(time.perf_counter())
+            yield url
+
+    def on_result(record):
+        latencies.append(time.perf_counter() - admitted[record["index"]])
+        failed[0] += record["error"] is not None
+        for name, seconds in record["timings"].items():
+            stage_times[name].append(seconds)
+
+    start, times = time.perf_counter(), os.times()
+    server_cpu = _server_cpu_seconds(base_url)
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(contextlib.redirect_stdout(io.StringIO()))
+        if download_scheduler is not None:
+            stack.enter_context(download_scheduler)
+        asyncio.run(retrieve_songs.run_pipeline(
+            admit(urls), cli_args,
+            download_scheduler = download_scheduler,
+            on_result = on_result,
+            ))
+    elapsed = time.perf_counter() - start
+    server_cpu = _server_cpu_seconds(base_url) - server_cpu
+    used = [after - before for after, before in zip(os.times(), times)]
+    cpus = (os.cpu_count() or 1) * elapsed
+
+    summary = retrieve_songs.METRICS.summary()
+    return {
+        "concurrency": concurrency,
+        "tracks": len(latencies),
+        "failed": failed[0],
+        "elapsed": elapsed,
+        "throughput": len(latencies) / elapsed,
+        "p50_ms": 1000 * _percentile(latencies, 0.50),
+        "p95_ms": 1000 * _percentile(latencies, 0.95),
+        "p99_ms": 1000 * _percentile(latencies, 0.99),
+        "stages_p95_ms": {
+            name: 1000 * _percentile(seconds, 0.95)
+            for name, seconds in stage_times.items()
+        },
+        "throttled": summary["counters"].get("throttled", 0),
+        "download_mb": summary["counters"].get("download_bytes", 0) / 2**20,
+        "retries": summary["counters"].get("retries", 0),
+        "cpu": {
+            "pipeline": (used[0] + used[1]) / cpus,
+            "downloaders": (used[2] + used[3]) / cpus,
+            "server": server_cpu / cpus,
+        },
+    }
+
+
+def print_results(results):
+    print("{:>11} {:>8} {:>10} {:>9} {:>9} {:>9} {:>7} {:>9} {:>5}".format(
+        "concurrency", "tracks", "tracks/s", "p50 ms", "p95 ms", "p99 ms",
+        "failed", "throttled", "cpu",
+        ))
+    for run in results["runs"]:
+        print("{concurrency:>11} {tracks:>8} {throughput:>10.1f} "
+              "{p50_ms:>9.1f} {p95_ms:>9.1f} {p99_ms:>9.1f} {failed:>7} "
+              "{throttled:>9} {cpu_total:>5.0%}".format(
+                  cpu_total=sum(run["cpu"].values()), **run
+                  ))
+    for run in results["runs"]:
+        print("concurrency {:>3}: cpu {}".format(
+            run["concurrency"],
+            ", ".join("{}={:.0%}".format(name, share)
+                      for name, share in run["cpu"].items()),
+            ))
+    for run in results["runs"]:
+        print("concurrency {:>3}: stage p95 ms {}".format(
+            run["concurrency"],
+            ", ".join("{}={:.1f}".format(name, ms)
+                      for name, ms in run["stages_p95_ms"].items()),
+            ))
+
+
+def main():
+    argparser = argparse.ArgumentParser(
+        description = "Load test the pipeline against local stand-ins",
+        epilog = "Arguments after -- are passed to standin_server.py"
+        )
+    argparser.add_argument(
+        "--tracks", type = int, default = 2000,
+        help = "Synthetic track URLs per run"
+        )
+    argparser.add_argument(
+        "--concurrency", default = "1,4,16",
+        type = lambda value: [int(n) for n in value.split(",")],
+        help = "Comma separated workers per stage, one run each"
+        )
+    argparser.add_argument(
+        "--download", action = "store_true",
+        help = "Also download the fake media of every matched video"
+        )
+    argparser.add_argument(
+        "--real-downloader", action = "store_true",
+        help = "Download with the yt-dlp on the PATH instead of "
+            "standin_downloader.py"
+        )
+    argparser.add_argument(
+        "--downloader", default = "ytdlp", choices = ("ytdlp", "segmented"),
+        help = "Downloader of --download, see retrieve_songs.py --downloader"
+        )
+    argparser.add_argument(
+        "--segments", type = int, default = 4,
+        help = "Parallel ranges per download of --downloader segmented"
+        )
+    argparser.add_argument(
+        "--max-retries", type = int, default = 2,
+        help = "Retries of a throttled request"
+        )
+    argparser.add_argument(
+        "--json", metavar = "PATH",
+        help = "Save the results as JSON"
+        )
+    argv = sys.argv[1:]
+    server_args = list()
+    if "--" in argv:
+        argv, server_args = argv[:argv.index("--")], \
+            argv[argv.index("--") + 1:]
+    args = argparser.parse_args(argv)
+
+    process, base_url = start_standin(server_args)
+    work_dir = tempfile.mkdtemp(prefix="s2y-load-")
+    try:
+        # Read once, when retrieve_songs is imported
+        os.environ["SPOTIFY2YOUTUBE_SPOTIFY_URL"] = base_url
+        os.environ["SPOTIFY2YOUTUBE_YOUTUBE_URL"] = base_url
+        import retrieve_songs
+        if args.download and not args.real_downloader:
+            install_standin_downloader(work_dir)
+
+        urls = synthetic_urls(base_url, args.tracks)
+        results = {"server": base_url, "server_args": server_args,
+                   "download": args.download, "downloader": args.downloader,
+                   "runs": list()}
+        for concurrency in args.concurrency:
+            download_dir = None
+            if args.download:
+                download_dir = os.path.join(work_dir, str(concurrency))
+            results["runs"].append(run_load(
+                retrieve_songs, urls, concurrency, base_url, download_dir,
+                args.max_retries, args.downloader, args.segments,
+                ))
+        with urllib.request.urlopen(base_url + "/__stats",
+                                    timeout=10) as response:
+            results["server_stats"] = json.load(response)
+    finally:
+        process.terminate()
+        process.wait()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print_results(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+
+
+if __name__ == "__main__":
+    main()
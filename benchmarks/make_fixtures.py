@@ -0,0 +1,363 @@
+"""
+Generate the labeled offline corpus in benchmarks/fixtures/
+
+For every synthetic track this writes
+- spotify/<track_id>.html: the track page, as served by open.spotify.com
+- youtube/<track_id>.rendered.html: the results page as rendered by
+    Chrome, i.e. the ytd-video-renderer markup find_youtube_videos_v3
+    scrapes
+- youtube/<track_id>.raw.html: the results page as served over plain HTTP,
+    with the results embedded as ytInitialData
+and labels.json, listing the pages of each track together with the hrefs
+that are an acceptable match for it.
+
+The pages mirror the markup of the real sites with the bulk (styles,
+scripts, thumbnails) left out; bench_offline.py pads them back to a
+realistic size. The corpus is generated from a fixed seed, so re-running
+this script reproduces the committed fixtures byte for byte. As the
+labels come from the same generator as the pages, bench_offline.py
+reports how well matching agrees with them as a regression check, not as
+match accuracy; that takes pages of real tracks, added next to these with
+record_fixtures.py.
+
+Usage:
+    python benchmarks/make_fixtures.py [--tracks 24] [--seed 2022]
+"""
+import argparse
+import html
+import json
+import os
+import random
+import string
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            "fixtures")
+
+SONG_WORDS = [
+    "Midnight", "Paper", "Ocean", "Golden", "Hearts", "River", "Neon",
+    "Summer", "Ghost", "Velvet", "Echoes", "Wild", "Silver", "Fire",
+    "Dreams", "Satellite", "Northern", "Lights", "Heavy", "Rain", "Lonely",
+    "City", "Comptine", "d'un", "autre", "été", "Boulevard", "Honey",
+]
+ARTISTS = [
+    "The Paper Kites", "Aurora Lane", "Benjamin Cambridge", "Kaleo Ray",
+    "Florence & The Spoons", "Mira Solberg", "Nightdrive", "Oskar Lind",
+    "Les Étoiles", "Jonah Vale", "Sunny Hollow", "Piano Fruits Music",
+]
+CHANNELS = ["LyricVibes", "7clouds", "Sing King", "Loop Station",
+            "Chill Nation", "Acoustic Covers", "Random Uploads"]
+
+
+def _track_id(rng):
+    return "".join(rng.choice(string.ascii_letters + string.digits)
+                   for _ in range(22))
+
+
+def _video_id(rng):
+    return "".join(rng.choice(string.ascii_letters + string.digits + "-_")
+                   for _ in range(11))
+
+
+def _duration_text(seconds):
+    return "{}:{:02d}".format(seconds // 60, seconds % 60)
+
+
+def _views_text(views):
+    return "{:,} views".format(views)
+
+
+def make_track(rng):
+    song = " ".join(rng.sample(SONG_WORDS, rng.randint(1, 3)))
+    artists = rng.sample(ARTISTS, rng.choice([1, 1, 1, 2]))
+    duration = rng.randint(140, 320)
+    artist = artists[0]
+    other_song = " ".join(rng.sample(SONG_WORDS, 2))
+
+    def video(title, channel, seconds, views):
+        return {
+            "video_id": _video_id(rng),
+            "title": title,
+            "channel": channel,
+            "duration": seconds,
+            "views": views,
+        }
+
+    official = [
+        video(song, artist + " - Topic", duration, rng.randint(10**4, 10**6)),
+        video("{} - {} (Official Audio)".format(artist, song),
+              artist, duration + rng.randint(-2, 2),
+              rng.randint(10**5, 10**8)),
+    ]
+    distractors = [
+        video("{} - {} (Lyrics)".format(artist, song),
+              rng.choice(CHANNELS[:2]), duration + rng.randint(0, 4),
+              rng.randint(10**4, 10**7)),
+        video("{} - {} (Live at {})".format(
+                artist, song, rng.choice(["Wembley", "KEXP", "Paris"])),
+              artist, duration + rng.randint(40, 200),
+              rng.randint(10**3, 10**6)),
+        video("{} Karaoke Version | In the Style of {}".format(song, artist),
+              "Sing King", duration + rng.randint(-5, 5),
+              rng.randint(10**3, 10**5)),
+        video("{} (1 Hour Loop)".format(song), "Loop Station", 3600,
+              rng.randint(10**3, 10**5)),
+        video("{} - {} (Cover)".format(song, artist),
+              "Acoustic Covers", duration + rng.randint(-30, 30),
+              rng.randint(10**2, 10**5)),
+        video("{} - {} (Official Video)".format(artist, other_song),
+              artist.replace(" ", "") + "VEVO", rng.randint(150, 300),
+              rng.randint(10**5, 10**8)),
+        video("{} {}".format(rng.choice(SONG_WORDS), rng.choice(SONG_WORDS)),
+              rng.choice(CHANNELS), rng.randint(60, 900),
+              rng.randint(10**2, 10**6)),
+    ]
+    videos = official + distractors
+    rng.shuffle(videos)
+    # The official uploads are usually, not always, near the top
+    for official_video in official:
+        videos.remove(official_video)
+        videos.insert(rng.randint(0, 3), official_video)
+
+    return {
+        "track_id": _track_id(rng),
+        "song": song,
+        "artists": artists,
+        "duration": duration,
+        "videos": videos,
+        "expected": ["/watch?v=" + v["video_id"] for v in official],
+    }
+
+
+def spotify_page(track):
+    title = "{} - song by {} | Spotify".format(
+        track["song"], ", ".join(track["artists"])
+        )
+    return (
+        '<!DOCTYPE html><html lang="en" dir="ltr"><head>'
+        '<meta charset="utf-8"/>'
+        '<meta name="viewport" content="width=device-width, initial-scale=1"/>'
+        '<title>{title}</title>'
+        '<meta property="og:site_name" content="Spotify"/>'
+        '<meta property="og:title" content="{song}"/>'
+        '<meta property="og:description" content="{artists} · Song · {year}"/>'
+        '<meta property="og:type" content="music.song"/>'
+        '<meta property="og:url" '
+        'content="https://open.spotify.com/track/{track_id}"/>'
+        '<meta name="music:duration" content="{duration}"/>'
+        '<meta name="music:release_date" content="{year}-01-01"/>'
+        '</head><body><div id="main"></div>'
+        '<script id="session" type="application/json">{{}}</script>'
+        '</body></html>\n'
+        ).format(
+            title = html.escape(title, quote=False),
+            song = html.escape(track["song"]),
+            artists = html.escape(", ".join(track["artists"])),
+            year = 2000 + len(track["song"]) % 23,
+            track_id = track["track_id"],
+            duration = track["duration"],
+            )
+
+
+_RENDERER = (
+    '<ytd-video-renderer class="style-scope ytd-item-section-renderer" '
+    'bigger-thumbs-style="DEFAULT" lockup="true">'
+    '<div id="dismissible" class="style-scope ytd-video-renderer">'
+    '<ytd-thumbnail use-hovered-property="" class="style-scope '
+    'ytd-video-renderer"><a id="thumbnail" class="yt-simple-endpoint '
+    'inline-block style-scope ytd-thumbnail" aria-hidden="true" '
+    'tabindex="-1" rel="null" href="{href}"><yt-image alt="" '
+    'ftl-eligible="" class="style-scope ytd-thumbnail"><img alt="" '
+    'class="yt-core-image--fill-parent-height yt-core-image--loaded" '
+    'src="https://i.ytimg.com/vi/{video_id}/hq720.jpg"></yt-image>'
+    '<div id="overlays" class="style-scope ytd-thumbnail">'
+    '<ytd-thumbnail-overlay-time-status-renderer class="style-scope '
+    'ytd-thumbnail" overlay-style="DEFAULT"><span id="text" '
+    'class="style-scope ytd-thumbnail-overlay-time-status-renderer" '
+    'aria-label="{duration_label}">{duration_text}</span>'
+    '</ytd-thumbnail-overlay-time-status-renderer></div></a></ytd-thumbnail>'
+    '<div class="text-wrapper style-scope ytd-video-renderer">'
+    '<div id="meta" class="style-scope ytd-video-renderer">'
+    '<div id="title-wrapper" class="style-scope ytd-video-renderer">'
+    '<h3 class="title-and-badge style-scope ytd-video-renderer">'
+    '<a id="video-title" class="yt-simple-endpoint style-scope '
+    'ytd-video-renderer" title="{title}" href="{href}" aria-label="{label}">'
+    '<yt-icon id="inline-title-icon" class="style-scope ytd-video-renderer" '
+    'hidden=""><!--css-build:shady--></yt-icon>'
+    '<yt-formatted-string class="style-scope ytd-video-renderer" '
+    'aria-label="{label}">{title}</yt-formatted-string></a></h3></div>'
+    '<ytd-video-meta-block class="style-scope ytd-video-renderer '
+    'byline-item-separated"><div id="metadata" class="style-scope '
+    'ytd-video-meta-block"><div id="metadata-line" class="style-scope '
+    'ytd-video-meta-block"><span class="inline-metadata-item style-scope '
+    'ytd-video-meta-block">{views_text}</span><span '
+    'class="inline-metadata-item style-scope ytd-video-meta-block">'
+    '{age} years ago</span></div></div></ytd-video-meta-block></div>'
+    '<div id="channel-info" class="style-scope ytd-video-renderer">'
+    '<ytd-channel-name id="channel-name" class="long-byline style-scope '
+    'ytd-video-renderer"><div id="container" class="style-scope '
+    'ytd-channel-name"><div id="text-container" class="style-scope '
+    'ytd-channel-name"><yt-formatted-string id="text" title="{channel}" '
+    'class="style-scope ytd-channel-name complex-string" '
+    'ellipsis-truncate="">'
+    '<a class="yt-simple-endpoint style-scope yt-formatted-string" '
+    'spellcheck="false" href="/@{handle}" dir="auto">{channel}</a>'
+    '</yt-formatted-string></div></div></ytd-channel-name></div>'
+    '</div></div></ytd-video-renderer>\n'
+)
+
+_PLAYLIST_RENDERER = (
+    '<ytd-playlist-renderer class="style-scope ytd-item-section-renderer">'
+    '<div id="content" class="style-scope ytd-playlist-renderer">'
+    '<a class="yt-simple-endpoint style-scope ytd-playlist-renderer" '
+    'href="/watch?v={video_id}&amp;list=PL{video_id}"><span id="video-title" '
+    'class="style-scope ytd-playlist-renderer" title="{title}">{title}</span>'
+    '</a></div></ytd-playlist-renderer>\n'
+)
+
+
+def rendered_results_page(track, rng):
+    items = list()
+    for i, v in enumerate(track["videos"]):
+        title = html.escape(v["title"])
+        channel = html.escape(v["channel"])
+        items.append(_RENDERER.format(
+            href = "/watch?v=" + v["video_id"],
+            video_id = v["video_id"],
+            title = title,
+            channel = channel,
+            handle = v["channel"].replace(" ", ""),
+            label = "{} by {} {} years ago {} minutes {} views".format(
+                title, channel, 1 + i % 9, v["duration"] // 60,
+                "{:,}".format(v["views"]),
+                ),
+            duration_label = "{} minutes, {} seconds".format(
+                v["duration"] // 60, v["duration"] % 60
+                ),
+            duration_text = _duration_text(v["duration"]),
+            views_text = _views_text(v["views"]),
+            age = 1 + i % 9,
+            ))
+        if i == 2:
+            items.append(_PLAYLIST_RENDERER.format(
+                video_id = _video_id(rng),
+                title = html.escape(track["song"] + " playlist"),
+                ))
+    return (
+        '<html style="font-size: 10px;" lang="en" system-icons="" '
+        'typography="" dark=""><head><title>{} - YouTube</title></head>'
+        '<body><ytd-app><div id="content" class="style-scope ytd-app">'
+        '<ytd-section-list-renderer class="style-scope '
+        'ytd-two-column-search-results-renderer"><div id="contents" '
+        'class="style-scope ytd-section-list-renderer">'
+        '<ytd-item-section-renderer class="style-scope '
+        'ytd-section-list-renderer"><div id="contents" class="style-scope '
+        'ytd-item-section-renderer">\n{}</div></ytd-item-section-renderer>'
+        '</div></ytd-section-list-renderer></div></ytd-app></body></html>\n'
+        ).format(html.escape(track["song"]), "".join(items))
+
+
+def _initial_data(track):
+    contents = list()
+    for i, v in enumerate(track["videos"]):
+        contents.append({"videoRenderer": {
+            "videoId": v["video_id"],
+            "title": {"runs": [{"text": v["title"]}]},
+            "ownerText": {"runs": [{
+                "text": v["channel"],
+                "navigationEndpoint": {"commandMetadata": {
+                    "webCommandMetadata": {
+                        "url": "/@" + v["channel"].replace(" ", "")
+                    }
+                }},
+            }]},
+            "lengthText": {"simpleText": _duration_text(v["duration"])},
+            "viewCountText": {"simpleText": _views_text(v["views"])},
+            "publishedTimeText": {
+                "simpleText": "{} years ago".format(1 + i % 9)
+            },
+            "navigationEndpoint": {"commandMetadata": {"webCommandMetadata": {
+                "url": "/watch?v=" + v["video_id"],
+                "webPageType": "WEB_PAGE_TYPE_WATCH",
+            }}},
+        }})
+        if i == 2:
+            contents.append({"shelfRenderer": {
+                "title": {"simpleText": "People also watched"},
+                "content": {"verticalListRenderer": {"items": []}},
+            }})
+    return {
+        "responseContext": {"serviceTrackingParams": []},
+        "estimatedResults": "123456",
+        "contents": {"twoColumnSearchResultsRenderer": {"primaryContents": {
+            "sectionListRenderer": {"contents": [
+                {"itemSectionRenderer": {"contents": contents}},
+                {"continuationItemRenderer": {"trigger":
+                    "CONTINUATION_TRIGGER_ON_ITEM_SHOWN"}},
+            ]}
+        }}},
+    }
+
+
+def raw_results_page(track):
+    return (
+        '<!DOCTYPE html><html style="font-size: 10px" lang="en"><head>'
+        '<title>{} - YouTube</title></head><body>'
+        '<script nonce="s2yfixture">var ytInitialData = {};</script>'
+        '<script nonce="s2yfixture">if (window.ytcsi) '
+        '{{window.ytcsi.tick("pdr", null, "");}}</script>'
+        '</body></html>\n'
+        ).format(
+            html.escape(track["song"]),
+            json.dumps(_initial_data(track), ensure_ascii=False),
+            )
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("--tracks", type=int, default=24)
+    argparser.add_argument("--seed", type=int, default=2022)
+    argparser.add_argument("--output", default=FIXTURES_DIR)
+    args = argparser.parse_args()
+
+    rng = random.Random(args.seed)
+    os.makedirs(os.path.join(args.output, "spotify"), exist_ok=True)
+    os.makedirs(os.path.join(args.output, "youtube"), exist_ok=True)
+
+    labels = list()
+    for _ in range(args.tracks):
+        track = make_track(rng)
+        pages = {
+            "spotify_page": "spotify/{}.html".format(track["track_id"]),
+            "rendered_page": "youtube/{}.rendered.html".format(
+                track["track_id"]
+                ),
+            "raw_page": "youtube/{}.raw.html".format(track["track_id"]),
+        }
+        contents = {
+            "spotify_page": spotify_page(track),
+            "rendered_page": rendered_results_page(track, rng),
+            "raw_page": raw_results_page(track),
+        }
+        for key, path in pages.items():
+            with open(os.path.join(args.output, path), "w",
+                      encoding="utf-8") as f:
+                f.write(contents[key])
+        labels.append(dict(
+            url = "https://open.spotify.com/track/" + track["track_id"],
+            song = track["song"],
+            artists = track["artists"],
+            duration = track["duration"],
+            expected = track["expected"],
+            source = "synthetic",
+            **pages,
+            ))
+
+    with open(os.path.join(args.output, "labels.json"), "w",
+              encoding="utf-8") as f:
+        json.dump(labels, f, indent=2, ensure_ascii=False)
+        f.write("\n")
+    print("Wrote {} tracks to {}".format(len(labels), args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Record real Spotify and youtube pages into benchmarks/fixtures/
+
+Reads lines of the form
+    <spotify track url> <expected youtube url> [<another acceptable url> ...]
+(blank lines and lines starting with # are skipped), and for every track
+saves its Spotify page, the youtube results page for its search query both
+rendered by Chrome and as served over plain HTTP, and appends the track to
+labels.json with the expected hrefs as labels. Requires network access and
+Chrome, exactly like a live run of retrieve_songs.py.
+
+The expected videos are picked by hand. A track without any is recorded
+all the same, so the right video can be looked up on its saved results
+page and added to labels.json afterwards; bench_offline.py leaves it out
+of the match accuracy until then. Only tracks recorded this way count
+towards the accuracy, the synthetic ones of make_fixtures.py are a
+regression check. fixtures/sample_tracks.txt lists the tracks
+retrieve_songs.py was debugged against.
+
+Usage:
+    python benchmarks/record_fixtures.py tracks.txt [--show-browser]
+    python benchmarks/record_fixtures.py benchmarks/fixtures/sample_tracks.txt
+"""
+import argparse
+import json
+import os
+import sys
+import urllib.parse
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import retrieve_songs  # noqa: E402
+
+FIXTURES_DIR = os.path.join(BENCH_DIR, "fixtures")
+
+
+def read_track_lines(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            url, *expected = line.split()
+            yield url, expected
+
+
+def youtube_href(url):
+    """
+    "https://www.youtube.com/watch?v=ID&t=1" or "https://youtu.be/ID"
+    -> "/watch?v=ID", the form the result renderers link to
+    """
+    parts = urllib.parse.urlsplit(url)
+    if parts.netloc.endswith("youtu.be"):
+        video_id = parts.path.strip("/")
+    else:
+        video_id = urllib.parse.parse_qs(parts.query).get("v", [""])[0]
+    return "/watch?v=" + video_id
+
+
+def record_track(url, expected, output, driver_pool):
+    session = retrieve_songs.get_http_session()
+    track_id = retrieve_songs.spotify_track_id(url)
+
+    spotify_page = retrieve_songs.RATE_LIMITER.request(
+        "GET", url, session, timeout=10
+        )
+    spotify_page.raise_for_status()
+    song_data = retrieve_songs.parse_song_details(spotify_page.text, url)
+    search_query = retrieve_songs.parse_search_query(dict(song_data))
+    search_url = "https://www.youtube.com/results?search_query={}".format(
+        search_query
+        )
+
+    raw_page = retrieve_songs.RATE_LIMITER.request(
+        "GET",
+        search_url,
+        session,
+        headers = retrieve_songs.YOUTUBE_HTTP_HEADERS,
+        cookies = retrieve_songs.YOUTUBE_HTTP_COOKIES,
+        timeout = 10,
+        )
+    raw_page.raise_for_status()
+    rendered_page = retrieve_songs._fetch_rendered_page(
+        search_url, driver_pool=driver_pool
+        )
+
+    label = {
+        "url": url,
+        "song": song_data["song"],
+        "artists": song_data["artists"],
+        "duration": song_data.get("duration"),
+        "expected": [youtube_href(e) for e in expected],
+        "source": "recorded",
+        "spotify_page": "spotify/{}.html".format(track_id),
+        "rendered_page": "youtube/{}.rendered.html".format(track_id),
+        "raw_page": "youtube/{}.raw.html".format(track_id),
+    }
+    for key, text in (("spotify_page", spotify_page.text),
+                      ("rendered_page", rendered_page),
+                      ("raw_page", raw_page.text)):
+        with open(os.path.join(output, label[key]), "w",
+                  encoding="utf-8") as f:
+            f.write(text)
+    return label
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument(
+        "tracks",
+        help = "File of '<spotify url> <expected youtube url> ...' lines"
+        )
+    argparser.add_argument("--output", default = FIXTURES_DIR)
+    argparser.add_argument(
+        "--show-browser", action = "store_true",
+        help = "Record the rendered pages with a visible Chrome"
+        )
+    args = argparser.parse_args()
+
+    os.makedirs(os.path.join(args.output, "spotify"), exist_ok=True)
+    os.makedirs(os.path.join(args.output, "youtube"), exist_ok=True)
+    labels_path = os.path.join(args.output, "labels.json")
+    labels = list()
+    if os.path.exists(labels_path):
+        with open(labels_path, encoding="utf-8") as f:
+            labels = json.load(f)
+    recorded = {label["url"]: i for i, label in enumerate(labels)}
+
+    with retrieve_songs.WebDriverPool(
+            headless=not args.show_browser) as driver_pool:
+        for url, expected in read_track_lines(args.tracks):
+            try:
+                label = record_track(url, expected, args.output, driver_pool)
+            except Exception as err:
+                print("# Failed to record {}: {}".format(url, err))
+                continue
+            if url in recorded:
+                labels[recorded[url]] = label
+            else:
+                recorded[url] = len(labels)
+                labels.append(label)
+
+    with open(labels_path, "w", encoding="utf-8") as f:
+        json.dump(labels, f, indent=2, ensure_ascii=False)
+        f.write("\n")
+
+
+if __name__ == "__main__":
+    main()
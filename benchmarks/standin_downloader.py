@@ -0,0 +1,95 @@
+"""
+Stand-in of yt-dlp for load tests against standin_server.py
+
+Understands the options retrieve_songs.py runs the downloader with
+(--format, --extract-audio, --audio-format, --print after_move:TEMPLATE,
+--output TEMPLATE -- URL) and fetches the fake media of the URL from the
+stand-in, so that the download step costs a process start, an HTTP
+transfer and a file write like the real one, minus the transcode.
+load_test.py puts it on the PATH as "yt-dlp".
+
+Like yt-dlp, --print FIELD (ext, acodec, filesize or url) prints the
+field of the audio stream instead of downloading it, the stream of a
+stand-in video being the video URL itself (opus in webm), which
+--downloader segmented then fetches.
+
+Usage:
+    python benchmarks/standin_downloader.py --output "%(id)s.%(ext)s" \\
+        -- http://127.0.0.1:8321/watch?v=dQw4w9WgXcQ
+"""
+import argparse
+import os
+import shutil
+import sys
+import urllib.error
+import urllib.parse
+import urllib.request
+
+
+def print_fields(url, fields):
+    """
+    Print the fields of the audio stream of a stand-in video, one per line
+    """
+    try:
+        request = urllib.request.Request(url, method="HEAD")
+        with urllib.request.urlopen(request, timeout=60) as response:
+            filesize = response.headers.get("Content-Length", "NA")
+    except urllib.error.HTTPError as e:
+        print("ERROR: Unable to extract: HTTP Error {}: {}".format(
+            e.code, e.reason
+            ), file=sys.stderr)
+        sys.exit(1)
+    values = {"ext": "webm", "acodec": "opus", "filesize": filesize,
+              "url": url}
+    for field in fields:
+        print(values.get(field, "NA"))
+
+
+def main():
+    argparser = argparse.ArgumentParser(
+        description = "Download the fake media of a stand-in video"
+        )
+    argparser.add_argument("--format", default = "bestaudio/best")
+    argparser.add_argument("--extract-audio", action = "store_true")
+    argparser.add_argument("--audio-format", default = None)
+    argparser.add_argument("--print", action = "append", default = [])
+    argparser.add_argument("--output", default = "%(title)s.%(ext)s")
+    argparser.add_argument("url")
+    args = argparser.parse_args()
+
+    query = urllib.parse.parse_qs(urllib.parse.urlsplit(args.url).query)
+    video_id = query.get("v", ["video"])[0]
+    fields = [field for field in args.print if ":" not in field]
+    if fields:
+        print_fields(args.url, fields)
+        return
+    path = args.output % {
+        "id": video_id,
+        "title": video_id,
+        "uploader": "standin",
+        "ext": args.audio_format or "webm",
+    }
+    partial = path + ".part"
+    try:
+        with urllib.request.urlopen(args.url, timeout=60) as response, \
+                open(partial, "wb") as file:
+            shutil.copyfileobj(response, file, 1 << 16)
+    except urllib.error.HTTPError as e:
+        # retrieve_songs.py looks for the message of yt-dlp on throttling
+        print("ERROR: Unable to download: HTTP Error {}: {}".format(
+            e.code, e.reason
+            ), file=sys.stderr)
+        sys.exit(1)
+    except OSError as e:
+        print("ERROR: {}".format(e), file=sys.stderr)
+        sys.exit(1)
+    os.replace(partial, path)
+    for template in args.print:
+        print(template[len("after_move:"):] % {
+            "filepath": os.path.abspath(path),
+            "acodec": "opus" if path.endswith(".webm") else "NA",
+            })
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,384 @@
+"""
+Local stand-in of open.spotify.com and www.youtube.com for load tests
+
+Serves, on one HTTP port and without any network access:
+- GET /track/<track_id>: a Spotify track page. The tracks of
+    fixtures/labels.json get their recorded page, any other ID a
+    synthetic track made up from the ID (see make_fixtures.make_track), so
+    that thousands of distinct URLs can be pushed through the pipeline.
+- GET /results?search_query=...: a youtube results page as served over
+    plain HTTP (ytInitialData), with the videos of the track whose page
+    was served for that query, or of a track made up from the query.
+- GET /watch?v=<video_id>: fake media, --media-kb of deterministic bytes
+    per video with Range (and If-Range, by ETag) support, for the download
+    step.
+- GET /__stats: request counts per route and status as JSON, and the
+    CPU seconds the stand-in used so far under "cpu_seconds".
+
+Latency (--latency/--jitter), server errors (--error-rate) and throttling
+(--throttle-rate, HTTP 429 with Retry-After) are injected into the routes
+given by --inject.
+
+retrieve_songs.py is pointed at the stand-in by the environment::
+
+    python benchmarks/standin_server.py --port 8321 &
+    export SPOTIFY2YOUTUBE_SPOTIFY_URL=http://127.0.0.1:8321
+    export SPOTIFY2YOUTUBE_YOUTUBE_URL=http://127.0.0.1:8321
+    echo http://127.0.0.1:8321/track/anyTrackId > urls.txt
+    python retrieve_songs.py --search-backend http \\
+        --rate-limit 127.0.0.1:8321=1000 -f urls.txt
+
+load_test.py does all of this for whole batches.
+
+Usage:
+    python benchmarks/standin_server.py [--port 0] [--latency 50]
+        [--jitter 20] [--error-rate 0.01] [--throttle-rate 0.01]
+        [--inject track,results] [--media-kb 256] [--media-kbps 0]
+"""
+import argparse
+import collections
+import hashlib
+import http.server
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.parse
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import make_fixtures  # noqa: E402
+import retrieve_songs  # noqa: E402
+
+retrieve_songs.VERBOSE = False     # parse_search_query prints otherwise
+
+FIXTURES_DIR = os.path.join(BENCH_DIR, "fixtures")
+ROUTES = ("track", "results", "watch")
+
+
+def search_key(song, artists):
+    """
+    The normalized query retrieve_songs.py searches a track with
+    """
+    return retrieve_songs.normalize_search_query(
+        retrieve_songs.parse_search_query({"song": song, "artists": artists})
+        )
+
+
+class Catalog:
+    """
+    The tracks known to the stand-in: the recorded fixtures, and the
+    synthetic tracks whose page was served, by search query. At most
+    :attr:'max_queries' synthetic tracks are remembered.
+    """
+
+    def __init__(self, fixtures_dir=FIXTURES_DIR, max_queries=100000):
+        self.max_queries = max_queries
+        self._recorded = dict()     # track ID -> (track page, results page)
+        self._queries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        labels_path = os.path.join(fixtures_dir, "labels.json")
+        if not os.path.exists(labels_path):
+            return
+        with open(labels_path, encoding="utf-8") as f:
+            labels = json.load(f)
+        for label in labels:
+            pages = list()
+            for key in ("spotify_page", "raw_page"):
+                with open(os.path.join(fixtures_dir, label[key]), "rb") as f:
+                    pages.append(f.read())
+            track_id = retrieve_songs.spotify_track_id(label["url"])
+            self._recorded[track_id] = tuple(pages)
+            self._queries[search_key(label["song"], label["artists"])] = \
+                pages[1]
+
+    def __len__(self):
+        return len(self._recorded)
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._queries[key] = value
+            self._queries.move_to_end(key)
+            while len(self._queries) > self.max_queries + len(self._recorded):
+                self._queries.popitem(last=False)
+
+    def track_page(self, track_id):
+        if track_id in self._recorded:
+            return self._recorded[track_id][0]
+        track = make_fixtures.make_track(random.Random(track_id))
+        track["track_id"] = track_id
+        self._remember(search_key(track["song"], track["artists"]), track)
+        return make_fixtures.spotify_page(track).encode("utf-8")
+
+    def results_page(self, search_query):
+        key = retrieve_songs.normalize_search_query(search_query)
+        with self._lock:
+            value = self._queries.get(key)
+        if isinstance(value, bytes):
+            return value
+        if value is None:
+            # Searched without its track page, e.g. a cached track
+            value = make_fixtures.make_track(random.Random(key))
+        return make_fixtures.raw_results_page(value).encode("utf-8")
+
+
+def media_bytes(video_id, start, end):
+    """
+    Bytes [start, end) of the fake media of a video, a repeated digest of
+    its ID so that a download can be checked
+    """
+    block = hashlib.sha256(video_id.encode("utf-8")).digest()
+    first = start // len(block)
+    count = (end + len(block) - 1) // len(block) - first
+    data = block * count
+    offset = start - first * len(block)
+    return data[offset:offset + end - start]
+
+
+def _parse_range(header, size):
+    """
+    The [start, end) of a single "bytes=" Range header, None when it is
+    missing or not satisfiable
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].partition("-")
+    try:
+        if not first:   # Suffix, the last N bytes
+            start, end = max(0, size - int(last)), size
+        else:
+            start = int(first)
+            end = min(size, int(last) + 1) if last else size
+    except ValueError:
+        return None
+    if start >= end:
+        return None
+    return start, end
+
+
+class StandinHandler(http.server.BaseHTTPRequestHandler):
+    server_version = "spotify2youtube-standin"
+    protocol_version = "HTTP/1.1"
+    # Headers and body are separate writes, keep-alive clients would
+    # otherwise wait for the delayed ACK of every response
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type="text/html; charset=utf-8",
+              headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or dict()).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+        self.server.count(self.route, status)
+
+    def _inject(self):
+        """
+        Apply the configured latency and failures, True when the request
+        was answered with a failure
+        """
+        options = self.server.options
+        if self.route not in options.inject:
+            return False
+        rng = self.server.rng
+        if options.latency or options.jitter:
+            time.sleep(max(0.0, rng.gauss(
+                options.latency, options.jitter
+                )) / 1000)
+        dice = rng.random()
+        if dice < options.throttle_rate:
+            self._send(429, b"Too Many Requests", "text/plain",
+                       {"Retry-After": str(options.retry_after)})
+            return True
+        if dice < options.throttle_rate + options.error_rate:
+            self._send(500, b"Internal Server Error", "text/plain")
+            return True
+        return False
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        parts = url.path.strip("/").split("/")
+        self.route = parts[0] or "index"
+        if self.route == "__stats":
+            self._send(200, json.dumps(self.server.stats()).encode("utf-8"),
+                       "application/json")
+            return
+        if self.route not in ROUTES:
+            self._send(404, b"Not Found", "text/plain")
+            return
+        if self._inject():
+            return
+        if self.route == "track" and len(parts) == 2:
+            self._send(200, self.server.catalog.track_page(parts[1]))
+        elif self.route == "results":
+            # The raw query, the client does not escape "&" in song names
+            _, _, search_query = url.query.partition("search_query=")
+            self._send(200, self.server.catalog.results_page(
+                urllib.parse.unquote_plus(search_query)
+                ))
+        elif self.route == "watch":
+            video_id = urllib.parse.parse_qs(url.query).get("v", [""])[0]
+            self._send_media(video_id)
+        else:
+            self._send(404, b"Not Found", "text/plain")
+
+    def _send_media(self, video_id):
+        options = self.server.options
+        size = options.media_kb * 1024
+        byte_range = _parse_range(self.headers.get("Range"), size)
+        if self.headers.get("Range") and byte_range is None:
+            self._send(416, b"", "text/plain",
+                       {"Content-Range": "bytes */{}".format(size)})
+            return
+        etag = '"{}-{}"'.format(
+            hashlib.sha256(video_id.encode("utf-8")).hexdigest()[:16], size
+            )
+        if self.headers.get("If-Range") not in (None, etag):
+            byte_range = None   # Changed since, the whole file is sent
+        start, end = byte_range or (0, size)
+        headers = {"Accept-Ranges": "bytes", "ETag": etag}
+        if byte_range is not None:
+            headers["Content-Range"] = "bytes {}-{}/{}".format(
+                start, end - 1, size
+                )
+        self.send_response(206 if byte_range else 200)
+        self.send_header("Content-Type", "audio/webm")
+        self.send_header("Content-Length", str(end - start))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            chunk = 64 * 1024
+            for offset in range(start, end, chunk):
+                self.wfile.write(media_bytes(
+                    video_id, offset, min(end, offset + chunk)
+                    ))
+                if options.media_kbps:
+                    time.sleep(chunk / 1024 / options.media_kbps)
+        self.server.count(self.route, 206 if byte_range else 200)
+
+
+class StandinServer(http.server.ThreadingHTTPServer):
+    """
+    The stand-in, configured by the options of :func:'build_argparser'
+    """
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, options, catalog=None):
+        super().__init__(address, StandinHandler)
+        self.options = options
+        self.catalog = catalog if catalog is not None else Catalog()
+        self.rng = random.Random(options.seed)
+        self._counts = collections.Counter()
+        self._lock = threading.Lock()
+
+    def handle_error(self, request, client_address):
+        # A client hanging up mid-response, e.g. a download that timed out
+        # or a probe that only wanted the first bytes, is not an error
+        if isinstance(sys.exc_info()[1],
+                      (ConnectionResetError, BrokenPipeError)):
+            return
+        super().handle_error(request, client_address)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+    def count(self, route, status):
+        with self._lock:
+            self._counts[route, status] += 1
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._counts)
+        stats = collections.defaultdict(dict)
+        for (route, status), count in sorted(counts.items()):
+            stats[route][str(status)] = count
+        stats["cpu_seconds"] = time.process_time()
+        return stats
+
+
+def build_argparser():
+    argparser = argparse.ArgumentParser(
+        description = "Serve stand-ins of the Spotify and youtube pages"
+        )
+    argparser.add_argument(
+        "--host", default = "127.0.0.1",
+        help = "Address to listen on"
+        )
+    argparser.add_argument(
+        "--port", type = int, default = 0,
+        help = "Port to listen on, 0 picks a free one"
+        )
+    argparser.add_argument(
+        "--latency", type = float, default = 0.0,
+        help = "Mean added latency per request in ms"
+        )
+    argparser.add_argument(
+        "--jitter", type = float, default = 0.0,
+        help = "Standard deviation of the added latency in ms"
+        )
+    argparser.add_argument(
+        "--error-rate", type = float, default = 0.0,
+        help = "Fraction of requests answered with HTTP 500"
+        )
+    argparser.add_argument(
+        "--throttle-rate", type = float, default = 0.0,
+        help = "Fraction of requests answered with HTTP 429"
+        )
+    argparser.add_argument(
+        "--retry-after", type = int, default = 1,
+        help = "Retry-After seconds of the throttled answers"
+        )
+    argparser.add_argument(
+        "--inject", default = "track,results",
+        type = lambda value: set(value.split(",")) if value else set(),
+        help = "Comma separated routes ({}) the latency and failures are "
+            "injected into".format(", ".join(ROUTES))
+        )
+    argparser.add_argument(
+        "--media-kb", type = int, default = 256,
+        help = "Size of the fake media of every video"
+        )
+    argparser.add_argument(
+        "--media-kbps", type = float, default = 0.0,
+        help = "Bandwidth of a single media response, 0 is unlimited"
+        )
+    argparser.add_argument(
+        "--seed", type = int, default = 2022,
+        help = "Seed of the injected latency and failures"
+        )
+    return argparser
+
+
+def main():
+    options = build_argparser().parse_args()
+    server = StandinServer((options.host, options.port), options)
+    # The first line tells a parent process (see load_test.py) the address
+    print("# Stand-in serving on {} ({} recorded tracks)".format(
+        server.url, len(server.catalog)
+        ), flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,640 +1,5957 @@
-"""
-Download Songs from Spotify by finding the song from Youtube and 
-grabbing audio with youtube-dl in Linux.
-
-How it works:
-- Web-scraping 
--:FIXME:
-
-Checklist:
-- youtube-dl AND ffmpeg must be installed/accessible beforehand in Linux
-    or WSL
-- :module:'bs4'  is required
-- :module:'selenium' is required
-- Chrome-Webdriver that is compatible with your current Google Chrome
-    is required
-- Chrome-Webdriver should be set as a Path enviromental variable.
-
-TODO:
-- [ ] Add a licence and README to the repo
-- [ ] Convert the downloader from youtube-dl to yt-dlp for faster downloads
-- [ ] Notify the user of possible nature of downloading videos, in certain regions
-- [ ] Notify the user of the checklist before execution
-- [ ] Turn the script into an executable program to be run
-    from the CLI
-- [ ] Implement asynchronous calls for WebDriver 
-with selenium?/asyncio/multithreading/multiprocessing or alike
-- [ ] Write docstrings for functions & comments in Sphinx/reST format
-- [ ] Check and validate style for PEP-8, i.e. check code margins and spaces
-Max. Line Length = 79 chars, Max. Comment & Docstring line length = 72
-- [ ] Clean up unneccessary imports 
-- [x] Argument Parsing for using the script through a CLI
-- [ ] Possibly update the code to be hosted on a website like Github-Pages
-- [ ] Possibly incorporate different Webdrivers that the user specifies
-"""
-import os
-import sys
-import platform
-import argparse
-import requests
-from bs4 import BeautifulSoup
-import re
-from pprint import pprint
-import asyncio
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-import pandas as pd
-
-
-def __debug_sample_inputs():
-
-    """
-    Return a single predefined spotify URL for testing the code
-    """
-    # #:HACK:
-    URL = "https://open.spotify.com/track/64f5bf2jyAkrsucnG9FXot"   #issue #tolerable success
-    # URL = "https://open.spotify.com/track/7LNAIE5fdvAjrUJH18x5P4"   #issue #success-at-last
-    # URL = "https://open.spotify.com/track/7M13FwBAKWNa2jqcZeUhL6"   # tolerable success
-    URL = "https://open.spotify.com/track/6NYqFxemN4ZdpIO8HGrCzC"   # success
-    # URL = "https://open.spotify.com/track/4O2N861eOnF9q8EtpH8IJu"  # Difficult #success at last
-    # URL = "https://open.spotify.com/track/1JYxCgv4Jlx2X4SYNtXgkB"   #correct
-    # URL = "https://open.spotify.com/track/25ViKfgVhbDr3IzhsjeQzU"   #correct
-    # URL = "https://open.spotify.com/track/03wqvxOYgomDNUWTzesadS"   #correct
-    # URL = "https://open.spotify.com/track/4TqYHkRMUc5XpBGUcpYNep"   #correct
-
-    return  [URL]
-
-
-def read_cli_inputs(_skip=False):
-    """Argument Parsing for Command Line execution, parses user input in CLI
-    """
-
-    argparser = argparse.ArgumentParser(prog="spotify2youtube")
-    group = argparser.add_mutually_exclusive_group(required=False)
-
-    group.add_argument(
-        "-f", "--file",
-        help = "Execute the script for a text file",
-        )
-    group.add_argument(
-        "-s", "--single",
-        help = "Execute the script for a single URL",
-        )
-
-    argparser.add_argument(
-        "--headless", 
-        help = "Run WebDriver in headless mode",
-        action = "store_true",
-        default = True,
-        )
-    argparser.add_argument(
-        "--log", 
-        help = "Log the execution history in cwd",
-        action = "store_true"
-        )
-
-    argparser.add_argument(
-        "-d", "--download",
-        help = "Download the song(s)", # :TODO: add requirements as a list
-        action = "store_true"
-        )
-
-    cli_args = argparser.parse_args()
-
-    if _skip:    # For Debugging
-        urls = __debug_sample_inputs()
-        return urls, cli_args
-    # :TODO: :FIXME: 
-    # Redirect argparser attributes to correct functions to modify
-    # execution
-
-    if cli_args.file is not None:
-        # if os.path.exists(cli_args.file):
-        # try:
-        with open(cli_args.file, 'r') as f:
-            urls = f.readlines()
-        # :REVIEW: Should one handle exceptions?, Allowing errors to
-        # propagate is probably better  
-        for i, line in enumerate(urls):
-            urls[i] = line.rstrip("\n")
-
-    if cli_args.single is not None:
-        urls = [str(cli_args.single)]
-
-    return urls, cli_args
-
-
-def get_song_details(url: str):
-    """
-    Given an URL, retrieve the HTML source code and separate it to obtain
-    song info
-
-    :param url: Spotify song URL
-    :type url: class:'str'
-    """
-
-    page = requests.get(url)
-    # print(dir(page)); print(page.url)
-    soup = BeautifulSoup(page.text, "html.parser")
-    title = str(soup.find("title"))
-    # print(title)
-
-    temp = re.split(">| \| ", title) 
-    temp = temp[1].split(" - song by ")
-    # print(temp)
-    name_song = temp[0]
-    name_artist = temp[1]
-
-    dict_ = {
-        "song": name_song,
-        "artists": [i for i in name_artist.split(", ") ]
-    }
-    # print(name_song, "==",name_artist, "\n")
-    # pprint(dict_)
-    # return name_song, name_artist
-    return dict_
-
-
-def parse_search_query(song_data: dict) -> str:
-    """
-    From a dictionary containing a dict with the form
-    dict_ = {
-        "song": name_song,
-        "artists": [i for i in list_of_artist_names]
-    }
-
-    generate a search_query compatible with youtube search query
-    """
-    name_song = song_data["song"]
-    name_artist = song_data["artists"]
-
-    search_query = name_song + " " + " ".join(name_artist)
-    search_query = search_query.replace(" ", "_")
-    search_query = search_query.replace(",", "_")
-    search_query = re.sub(r'\_+', '+', search_query)
-    
-    song_data.update({
-        "search_query": search_query,
-    }
-    )
-
-    pprint(song_data)
-    return search_query
-
-
-# :XXX: Deprecated due to scoring and insufficient scraping of tags
-def find_youtube_videos_v1(search_query):
-    """
-    With the current state of Youtube, the webpage is thought to be using
-    a scripting language to dynamically create the webpage, which makes it
-    difficult to use standard HTTP requests (with requests module) to :method:
-    'get' the response object with a html '<script>' tag which does not contain 
-    necessary information in a structured manner. Selenium and ChromeWebdriver 
-    is used as a result of this limitation of :module:'requests' 
-
-    :param search_query: A string literal that contains the parsed searching 
-        string that is joined with youtube search query URL
-    :type search_query: class:'str'
-    :return: The list of strings, each of which is a title of the videos as a 
-    result of the search on Youtube
-    :rtype: list
-    """
-    chrome_options = Options()
-    chrome_options.headless = True # Run chrome without UI
-    # chrome_options.add_argument("--headless") # also works
-    """
-    #chrome_options.add_argument("--disable-extensions")
-    #chrome_options.add_argument("--disable-gpu")
-    #chrome_options.add_argument("--no-sandbox") # linux only
- 
-    """
-
-    driver = webdriver.Chrome(options=chrome_options)
-    search_url = "https://www.youtube.com/results?search_query={}".format(
-        search_query
-    )
-    print(search_url)
-    page = driver.get(search_url)
-
-    soup = BeautifulSoup(driver.page_source, 'html.parser')
-    driver.quit()
-
-    # print(soup.prettify())
-    # with open("mycontents2.html", "wb") as f:
-    #     f.write(soup.prettify().encode("utf-8"))
-    # pass
-
-    # with open("mycontents.html", "wb") as f:
-    #     f.write(soup.prettify().encode("utf-8"))
-    # pass
-
-    # candidates = soup.find(search_tag, {"class": search_term})
-    # OR
-    candidates = soup.find_all(
-        "a",
-        {
-            "id": "video-title",
-            # "class": "style-scope ytd-video-renderer"
-        }
-        )
-
-
-    # print(len(candidates))
-    # print(type(candidates[0]))
-
-    # print(str(candidates[0]))
-    """
-    each candidate
-
-    <a aria-label="Benjamin Cambridge - Comptine d'un autre été, l'après midi | Classical Piano Version by Piano Fruits Music 4 months ago 1 minute, 50 seconds 7,349 views" class="yt-simple-endpoint style-scope ytd-video-renderer" href="/watch?v=qE-sCalGpcE" id="video-title" title="Benjamin Cambridge - Comptine d'un autre été, l'après midi | Classical Piano Version">
-    <yt-icon class="style-scope ytd-video-renderer" hidden="" id="inline-title-icon"><!--css-build:shady--></yt-icon>
-    <yt-formatted-string aria-label="Benjamin Cambridge - Comptine d'un autre été, l'après midi | Classical Piano Version by Piano Fruits Music 4 months ago 1 minute, 50 seconds 7,349 views" class="style-scope ytd-video-renderer">Benjamin Cambridge 
-    - Comptine d'un autre été, l'après midi | Classical Piano Version</yt-formatted-string>
-    </a>
-    """
-    print("\t_Videos-Status_")
-    video_list = list()
-    for i, candidate in enumerate(candidates):
-        pattern_title = re.findall(r"(title=)\"(.*?)\"", str(candidate))
-        pattern_href = re.findall(r"(href=)\"(.*?)\"", str(candidate))
-        # print(temp)
-        if pattern_title != [] and pattern_href != []:  # If Regex finds at least 1 match to have a non-empty list
-            title = pattern_title[0][1]
-            href = pattern_href[0][1]
-            video_list.append((title,href))
-            message = "# Successfully grabbed title of video({:02d})"
-        else:
-            message = "# Failed to determine title of entity({:02d})"
-        print(message.format(i), end="\n")
-    print("\n")
-    # del temp, message
-    return video_list
-
-# :XXX: Possibly deprecated due to buggy scraping of tags
-def find_youtube_videos_v2(search_query, headless=True):
-    """
-    With the current state of Youtube, the webpage is thought to be using
-    a scripting language to dynamically create the webpage, which makes it
-    difficult to use standard HTTP requests (with requests module) to :method:
-    'get' the response object with a html '<script>' tag which does not contain 
-    necessary information in a structured manner. Selenium and ChromeWebdriver 
-    is used as a result of this limitation of :module:'requests' 
-
-    :param search_query: A string literal that contains the parsed searching 
-        string that is joined with youtube search query URL
-    :type search_query: class:'str'
-    :return: The list of strings, each of which is a title of the videos as a 
-    result of the search on Youtube
-    :rtype: list
-    """
-    chrome_options = Options()
-    chrome_options.headless = headless  # Run chrome without UI
-    # chrome_options.add_argument("--headless") # also works
-    """
-    #chrome_options.add_argument("--disable-extensions")
-    #chrome_options.add_argument("--disable-gpu")
-    #chrome_options.add_argument("--no-sandbox") # linux only
- 
-    """
-
-    driver = webdriver.Chrome(options=chrome_options)
-    search_url = "https://www.youtube.com/results?search_query={}".format(
-        search_query
-    )
-    print(search_url)
-    page = driver.get(search_url)
-
-    soup = BeautifulSoup(driver.page_source, 'html.parser')
-    driver.quit()
-
-    candidates = []
-    candidates = soup.find_all(
-        "a",
-        {
-            "id": "video-title",
-            # "class": "style-scope ytd-video-renderer"
-        }
-    )
-
-    # print(len(candidates))
-
-    candidates_uploaders = soup.find_all(
-        "a",
-        {
-            "class": "yt-simple-endpoint style-scope yt-formatted-string",
-            "dir": "auto",
-            "spellcheck": "false"
-        }
-    )
-
-    # pprint(len(candidates_uploaders := candidates_uploaders[::2]))
-        # # pprint(candidate_uploaders)
-
-
-    #:TODO: 
-    # :BUG: Correct html parsing for more accurate video title and
-    # uploader detection
-
-    """
-    each candidate
-
-    <a aria-label="Benjamin Cambridge - Comptine d'un autre été, l'après midi | Classical Piano Version by Piano Fruits Music 4 months ago 1 minute, 50 seconds 7,349 views" class="yt-simple-endpoint style-scope ytd-video-renderer" href="/watch?v=qE-sCalGpcE" id="video-title" title="Benjamin Cambridge - Comptine d'un autre été, l'après midi | Classical Piano Version">
-    <yt-icon class="style-scope ytd-video-renderer" hidden="" id="inline-title-icon"><!--css-build:shady--></yt-icon>
-    <yt-formatted-string aria-label="Benjamin Cambridge - Comptine d'un autre été, l'après midi | Classical Piano Version by Piano Fruits Music 4 months ago 1 minute, 50 seconds 7,349 views" class="style-scope ytd-video-renderer">Benjamin Cambridge 
-    - Comptine d'un autre été, l'après midi | Classical Piano Version</yt-formatted-string>
-    </a>
-    """
-    print("\t_Videos-Status_")
-    video_list = list()
-    for i, candidate in enumerate(candidates):
-        pattern_title = re.findall(r"(title=)\"(.*?)\"", str(candidate))
-        pattern_href = re.findall(r"(href=)\"(.*?)\"", str(candidate))
-        pattern_channelname = re.findall(
-            r"\>(.*?)\</a\>", 
-            str(candidates_uploaders[i])
-            )\
-            
-        
-        # print(pattern_channelname)
-        # print(temp)
-        if pattern_title != [] and pattern_href != []:  # If Regex finds at least 1 match to have a non-empty list
-            title = pattern_title[0][1]
-            href = pattern_href[0][1]
-            channelname = pattern_channelname[0]
-            video_list.append((title, href, channelname))
-            message = "# Successfully grabbed title of video({:02d})"
-        else:
-            message = "# Failed to determine title of entity({:02d})"
-        print(message.format(i), end="\n")
-    print("\n")
-    # del temp, message
-    return video_list
-
-
-def find_youtube_videos_v3(search_query, headless=True):
-    """
-    With the current state of Youtube, the webpage is thought to be using
-    a scripting language to dynamically create the webpage, which makes it
-    difficult to use standard HTTP requests (with requests module) to :method:
-    'get' the response object with a html '<script>' tag which does not contain 
-    necessary information in a structured manner. Selenium and ChromeWebdriver 
-    is used as a result of this limitation of :module:'requests' 
-
-    :param search_query: A string literal that contains the parsed searching 
-        string that is joined with youtube search query URL
-    :type search_query: class:'str'
-    :return: The list of strings, each of which is a title of the videos as a 
-    result of the search on Youtube
-    :rtype: list
-    """
-    chrome_options = Options()
-    chrome_options.headless = headless  # Run chrome without UI
-    # chrome_options.add_argument("--headless") # also works
-  
-
-    driver = webdriver.Chrome(options=chrome_options)
-    search_url = "https://www.youtube.com/results?search_query={}".format(
-        search_query
-    )
-    print(search_url)
-    page = driver.get(search_url)
-
-    soup = BeautifulSoup(driver.page_source, 'html.parser')
-    #print(type(driver.page_source))
-    driver.quit()
-
-    candidates = []
-
-    # Find all tags that are songs, eliminate all playlists
-    soup_search_results = soup.find_all(
-        "div", 
-        {
-            "id": "dismissible",
-            "class": "style-scope ytd-video-renderer"
-        }
-    ) 
-    #print(type(search_results), type(search_results[0]))
-
-    # Define the HTML tags that should be scraped for video title and uploader
-    tag_title = [
-        "a",
-        {
-            "id": "video-title",
-            # "class": "style-scope ytd-video-renderer"
-        }
-        ]
-
-    tag_uploader = [
-        "a",
-        {
-            "class": "yt-simple-endpoint style-scope yt-formatted-string",
-            "dir": "auto",
-            "spellcheck": "false"
-        }
-        ]
-
-    print("\t_Videos-Status_")
-    video_list = list()
-    for i, soup_search in enumerate(soup_search_results):
-        # print(str(search_result))
-        #soup_search = BeautifulSoup(str(search_result), "html.parser")
-        candidate_title = soup_search.find(*tag_title)
-        candidate_uploader = soup_search.find(*tag_uploader)
-
-        pattern_title = re.findall(r"(title=)\"(.*?)\"", str(candidate_title))
-        pattern_href = re.findall(r"(href=)\"(.*?)\"", str(candidate_title))
-        pattern_channelname = re.findall(
-            r"\>(.*?)\</a\>", 
-            str(candidate_uploader)
-            )\
-            
-        
-        if pattern_title != [] and pattern_href != [] and pattern_channelname != []:  # If Regex finds at least 1 match to have a non-empty list
-            title = pattern_title[0][1]
-            href = pattern_href[0][1]
-            channelname = pattern_channelname[0]
-            video_list.append((title, href, channelname))
-            message = "# Successfully grabbed title of video({:02d})"
-        else:
-            message = "# Failed to determine title of entity({:02d})"
-        print(message.format(i), end="\n")
-    print("\n")
-    # del temp, message
-    return video_list
-
-
-def match_song_and_video(song_data, video_list, single=True):
-    """
-    Determine and grab the video that has the highest relevance to the 
-    original song name. This relevance is quantified by a calculated score
-    based on how many keywords in the search query appear in the video title
-    in relevance to the number of words in the video title string.
-    
-    :return: A dictionary in the form 
-        dict_['song'] = :str:'song'
-        dict_['artists'] = :list:'artists'
-        dict_['search_query'] = :str:'search_query'
-        dict_['matched_video_title'] = :str:'matched_video_title'
-        dict_['matched_video_url'] = :str:'matched_video_url'
-    :rtype: dict
-    
-    :TODO:
-    - Implement a fuzzy search algorithm to match spotify song
-        titles and youtube video titles more effectively. The one currently
-        in place is a primitive one.
-    """
-       
-    search_query = song_data["search_query"]
-    keywords = search_query.lower().split("+")
-
-    chars_to_remove = ["-", ".", "\\", "/" , "(", ")"]   #"\'" removed for correct french songs
-    rx = '[' + re.escape(''.join(chars_to_remove)) + ']'
-
-    print("\t_Scores_")
-    scores_list = list()
-    enum = -1
-    for title, href, channelname in video_list:
-        enum += 1
-        video = title.lower() + " " + channelname.lower()
-        video = re.sub("&(amp;)+", ' ', video)
-        video =  re.sub(rx, ' ', video) #Replace all chars_to_remove with spcce
-        video = re.sub(r'(\s)\1+', r'\1', video) #Reduce whitespaces to 1 space
-       
-        # Calculate the scores for how dominant the match is
-
-        # # Determine if each keyword is a substring of  
-        # #     video (title + channelname), and
-        # #     determine how many of such keyword(s) is actually contained
-        score1 = sum([(keyword in video) for keyword in keywords])
-
-        # # Determine the number of words in video (title + channelname) 
-        # #     that is also a keyword for the search_query
-        # # e.g. The more words in the video that contains a keyword for search
-        # #     the better
-        score2 = sum([(word in keywords) for word in video.split(" ")])
-
-
-        # # Attempt to "Normalize" the score with the number of words
-        # #     that is in the video-title
-        factor = (1/len(video.split(" "))) if len(video.split(" ")) != 0 else 0
-        score1 = score1*factor
-        score2 = score2*factor
-        scores_list.append(
-            max(score1,score2)
-            )
-
-        print("{:02d}({:0.3f} {:0.3f}) - {}".format(
-                enum,
-                score1, 
-                score2, 
-                video
-                )
-            ) 
-
-    # print(scores_list)
-
-    maxval = max(scores_list)
-    ind = scores_list.index(maxval)
-    matched_video_title = video_list[ind][0]
-    matched_video_url = "https://www.youtube.com" \
-                        + video_list[ind][1] # Add href
-    matched_video_uploader = video_list[ind][2]
-
-    # print(i, video_list[i][0])
-    # print(video_list[i][1])
-    # print("www.youtube.com" + video_list[i][1])
-
-    print("\n\t_ANS:BEST-GUESS_")
-    print("Index = {:02d} | Overall Score = {:0.3f}".format(
-        ind, scores_list[ind]
-        )
-        )
-    print(
-        matched_video_title, 
-        "| upload by {}".format(matched_video_uploader)
-        )
-    print(matched_video_url)
-    print("\n")
-    
-    # If a single link is provided by the user at CLI as input
-    if single:  
-        chrome_options = Options()
-        chrome_options.headless = False  # Run chrome with UI
-        driver = webdriver.Chrome(options=chrome_options)
-        driver.get(matched_video_url)
-        input("# Press AnyKey to Leave")
-        driver.quit()
-
-    return matched_video_url
-
-
-def download_youtube_song(matched_video_url, song_data): #:FIXME:
-    """
-    OS-dependent, 
-    :TODO:
-    - Check if this is even secure,
-        we are redirecting user input to a download-engine
-        through the commmand line, is it prone to 
-        some sort of injection attack?
-    Check if it works in virtual machines,
-    Check if it works in WSL and other emulator-like environments
-    """
-
-    cli_os = platform.system().lower()
-    print("\t_Download-Status_")
-    name_song = song_data["song"]
-    name_artist = ", ".join(song_data["artists"])
-    name_audio = name_song + " - " + name_artist
-    mystr = r'"%(title)s.%(uploader)s.%(ext)s"'
-
-    if cli_os == "linux":
-        cmd = "youtube-dl --extract-audio --audio-format mp3 --output {} {}".format(
-            mystr,
-            matched_video_url,
-            )
-        return_code = os.system(cmd)
-        print(cmd)
-        return return_code
-
-    if cli_os == "windows":
-        print("Downloader is not implemented yet")
-        return NotImplemented
-
-
-def spotify2youtube(url, cli_args):
-    """
-    Given a Spotify song URL, find and retrieve the most relevant video to the song,
-    from Youtube.
-
-    :param url: Spotify URL of an individual song
-    :type url: class:'str'
-    :return: Youtube URL of the most relevant video to the song in Spotify URL
-    :rtype: class:'str'
-
-    :REVIEW:
-    This may be implemented not as functional programming but as a 
-    class like :class:'VideoMatcher' or :class:'spotify2youtube' with
-    internal methods. The functional programming method may be more beneficial
-    if a programmer wants to import indiviual functions for their own use.
-    """
-
-    song_data = get_song_details(url)
-    search_query = parse_search_query(song_data)
-    # video_list = find_youtube_videos(search_query)
-    video_list = find_youtube_videos_v3(search_query, cli_args.headless)
-    matched_video_url = match_song_and_video(song_data, video_list, cli_args.single)
-    return matched_video_url, song_data
-
-
-if __name__ == '__main__':
-
-    skip = 0   # Debug Mode
-
-    urls, cli_args = read_cli_inputs(skip)  
-    # :TODO: cli_args should be fully redirected into spotify2youtube
-    for url in urls:
-        matched_video_url, song_data = spotify2youtube(url, cli_args)
-        if cli_args.download:
-            return_code = download_youtube_song(matched_video_url, song_data)
-            print(return_code)
-    
+"""
+Download Songs from Spotify by finding the song from Youtube and 
+grabbing audio with youtube-dl in Linux.
+
+How it works:
+- Web-scraping 
+-:FIXME:
+
+Checklist:
+- yt-dlp (or youtube-dl) AND ffmpeg must be installed/accessible beforehand
+    in PATH
+- :module:'bs4'  is required
+- :module:'selenium' is required
+- Chrome-Webdriver that is compatible with your current Google Chrome
+    is required
+- Chrome-Webdriver should be set as a Path enviromental variable.
+
+TODO:
+- [ ] Add a licence and README to the repo
+- [x] Convert the downloader from youtube-dl to yt-dlp for faster downloads
+- [ ] Notify the user of possible nature of downloading videos, in certain regions
+- [ ] Notify the user of the checklist before execution
+- [ ] Turn the script into an executable program to be run
+    from the CLI
+- [x] Implement asynchronous calls for WebDriver 
+with selenium?/asyncio/multithreading/multiprocessing or alike
+- [ ] Write docstrings for functions & comments in Sphinx/reST format
+- [ ] Check and validate style for PEP-8, i.e. check code margins and spaces
+Max. Line Length = 79 chars, Max. Comment & Docstring line length = 72
+- [x] Clean up unneccessary imports 
+- [x] Argument Parsing for using the script through a CLI
+- [ ] Possibly update the code to be hosted on a website like Github-Pages
+- [ ] Possibly incorporate different Webdrivers that the user specifies
+"""
+import os
+import sys
+import argparse
+import concurrent.futures
+import collections
+import contextlib
+import csv
+import cProfile
+import dataclasses
+import difflib
+import enum
+import functools
+import glob
+import hashlib
+import heapq
+import html
+import importlib.util
+import json
+import pstats
+import queue
+import random
+import shutil
+import sqlite3
+import subprocess
+import threading
+import time
+import types
+import uuid
+import unicodedata
+import urllib.parse
+import re
+from pprint import pprint
+# requests, bs4, selenium, asyncio and the modules of the resolver service
+# and of --workers are imported by the functions that use them, so that
+# short runs (--help, cached results, the http backend) start fast and do
+# not pay for the backends they never touch, see benchmarks/bench_startup.py
+
+
+def __debug_sample_inputs():
+
+    """
+    Return a single predefined spotify URL for testing the code
+    """
+    # #:HACK:
+    URL = "https://open.spotify.com/track/64f5bf2jyAkrsucnG9FXot"   #issue #tolerable success
+    # URL = "https://open.spotify.com/track/7LNAIE5fdvAjrUJH18x5P4"   #issue #success-at-last
+    # URL = "https://open.spotify.com/track/7M13FwBAKWNa2jqcZeUhL6"   # tolerable success
+    URL = "https://open.spotify.com/track/6NYqFxemN4ZdpIO8HGrCzC"   # success
+    # URL = "https://open.spotify.com/track/4O2N861eOnF9q8EtpH8IJu"  # Difficult #success at last
+    # URL = "https://open.spotify.com/track/1JYxCgv4Jlx2X4SYNtXgkB"   #correct
+    # URL = "https://open.spotify.com/track/25ViKfgVhbDr3IzhsjeQzU"   #correct
+    # URL = "https://open.spotify.com/track/03wqvxOYgomDNUWTzesadS"   #correct
+    # URL = "https://open.spotify.com/track/4TqYHkRMUc5XpBGUcpYNep"   #correct
+
+    return  [URL]
+
+
+def read_cli_inputs(_skip=False):
+    """Argument Parsing for Command Line execution, parses user input in CLI
+    """
+
+    argparser = argparse.ArgumentParser(prog="spotify2youtube")
+    group = argparser.add_mutually_exclusive_group(required=False)
+
+    group.add_argument(
+        "-f", "--file",
+        help = "Execute the script for a text file of track, playlist "
+            "and album URLs, one per line, '-' reads them from stdin. "
+            "Blank lines and lines starting with '#' are skipped",
+        )
+    group.add_argument(
+        "-s", "--single",
+        help = "Execute the script for a single track, playlist or "
+            "album URL",
+        )
+
+    argparser.add_argument(
+        "--headless", 
+        help = "Run WebDriver in headless mode",
+        action = "store_true",
+        default = True,
+        )
+    argparser.add_argument(
+        "--log", 
+        help = "Log the execution history in cwd",
+        action = "store_true"
+        )
+
+    argparser.add_argument(
+        "-d", "--download",
+        help = "Download the song(s)", # :TODO: add requirements as a list
+        action = "store_true"
+        )
+
+    argparser.add_argument(
+        "--pool-size",
+        help = "Number of warm WebDriver sessions kept for searching",
+        type = int,
+        default = 1,
+        )
+    argparser.add_argument(
+        "--driver-max-pages",
+        help = "Recycle a WebDriver after it has loaded this many pages",
+        type = int,
+        default = 100,
+        )
+    argparser.add_argument(
+        "--driver-max-memory",
+        help = "Recycle a WebDriver once its browser uses more than this "
+            "many MB of memory (Linux only)",
+        type = int,
+        default = None,
+        )
+
+    argparser.add_argument(
+        "--search-backend",
+        help = "Backend used to search youtube, 'auto' tries plain HTTP "
+            "first and falls back to selenium",
+        choices = ["auto"] + sorted(SEARCH_BACKENDS),
+        default = "auto",
+        )
+    argparser.add_argument(
+        "--top-n",
+        help = "Early-exit search: read only the first N videos of a search, "
+            "as soon as they are rendered, in a browser that does not load "
+            "images, fonts or ads",
+        type = int,
+        default = None,
+        )
+    argparser.add_argument(
+        "--match-threshold",
+        help = "Pick the first video whose score reaches this value instead "
+            "of scoring every video",
+        type = float,
+        default = None,
+        )
+    argparser.add_argument(
+        "--fuzzy",
+        help = "Blend a fuzzy similarity of the song and the video title "
+            "into the keyword score used to pick the video",
+        choices = ["none"] + sorted(FUZZY_SCORERS),
+        default = "none",
+        )
+    argparser.add_argument(
+        "--fuzzy-weight",
+        help = "Weight of the --fuzzy similarity in the score, 0 to 1",
+        type = float,
+        default = 0.5,
+        )
+    argparser.add_argument(
+        "--duration-tolerance",
+        help = "Drop videos whose duration differs from the song's by more "
+            "than this many seconds before scoring them, 0 keeps every video",
+        type = float,
+        default = 20.0,
+        )
+    argparser.add_argument(
+        "--min-confidence",
+        help = "Search again for songs whose match has a lower confidence "
+            "(0 to 1, the share of the song's words found in the video "
+            "weighed by the duration difference) in "
+            "--file mode, by ISRC when known, and report them as "
+            "low-confidence instead of downloading them if that does not "
+            "help",
+        type = float,
+        default = None,
+        )
+
+    argparser.add_argument(
+        "--metadata-workers",
+        help = "Concurrent Spotify metadata fetches in --file mode",
+        type = int,
+        default = 4,
+        )
+    argparser.add_argument(
+        "--search-workers",
+        help = "Concurrent youtube searches in --file mode, defaults to "
+            "--pool-size",
+        type = int,
+        default = None,
+        )
+    argparser.add_argument(
+        "--download-workers",
+        help = "Concurrent downloads in --file mode, defaults to the "
+            "number of CPUs",
+        type = int,
+        default = None,
+        )
+    argparser.add_argument(
+        "--download-timeout",
+        help = "Seconds after which a single download attempt is killed, "
+            "or with --downloader segmented a stalled request fails",
+        type = float,
+        default = 600,
+        )
+    argparser.add_argument(
+        "--download-retries",
+        help = "Extra attempts for a failed or timed out download",
+        type = int,
+        default = 2,
+        )
+    argparser.add_argument(
+        "--audio-format",
+        help = "Audio of the downloads: mp3 (always transcoded), m4a or "
+            "opus (transcoded only when the video has no such stream) or "
+            "native (the video's own audio stream, remuxed only)",
+        choices = list(AUDIO_FORMATS),
+        default = "mp3",
+        )
+    argparser.add_argument(
+        "--downloader",
+        help = "'ytdlp' downloads with yt-dlp (or youtube-dl), "
+            "'segmented' only asks yt-dlp for the audio stream and fetches "
+            "it in parallel ranges, resuming interrupted downloads",
+        choices = sorted(DOWNLOADERS),
+        default = "ytdlp",
+        )
+    argparser.add_argument(
+        "--segments",
+        help = "Parallel ranges per download of --downloader segmented",
+        type = int,
+        default = 4,
+        )
+    argparser.add_argument(
+        "--transcode-workers",
+        help = "Concurrent ffmpeg transcodes in --file mode, separate from "
+            "--download-workers, defaults to the number of CPUs",
+        type = int,
+        default = None,
+        )
+    argparser.add_argument(
+        "--download-dir",
+        help = "Directory of the downloads, named 'SONG - ARTISTS "
+            "[VIDEO_ID].EXT'",
+        default = ".",
+        metavar = "DIR",
+        )
+    argparser.add_argument(
+        "--archive",
+        help = "SQLite download archive, videos it has (with unchanged "
+            "files) are never downloaded again. Defaults to "
+            "{} in --download-dir".format(DOWNLOAD_ARCHIVE_NAME),
+        default = None,
+        metavar = "PATH",
+        )
+    argparser.add_argument(
+        "--no-archive",
+        help = "Neither use nor update the download archive",
+        action = "store_true",
+        )
+    argparser.add_argument(
+        "--prune-archive",
+        help = "Instead of running, drop the archive entries whose files "
+            "are gone or changed",
+        action = "store_true",
+        )
+    argparser.add_argument(
+        "--prune-unused",
+        help = "With --prune-archive, also delete the archived files (and "
+            "their links) no track asked for in DAYS days",
+        type = float,
+        default = None,
+        metavar = "DAYS",
+        )
+
+    argparser.add_argument(
+        "--cache-path",
+        help = "SQLite database of the persistent cache",
+        default = default_cache_path(),
+        )
+    argparser.add_argument(
+        "--cache-ttl",
+        help = "Days after which cached Spotify metadata expires",
+        type = float,
+        default = 30,
+        )
+    argparser.add_argument(
+        "--search-cache-ttl",
+        help = "Days after which cached youtube searches and matches expire",
+        type = float,
+        default = 7,
+        )
+    argparser.add_argument(
+        "--cache-max-entries",
+        help = "Number of entries kept per cache, least recently used ones "
+            "are evicted first",
+        type = int,
+        default = 100000,
+        )
+    cache_group = argparser.add_mutually_exclusive_group(required=False)
+    cache_group.add_argument(
+        "--no-cache",
+        help = "Neither read nor write the persistent cache",
+        action = "store_true",
+        )
+    cache_group.add_argument(
+        "--refresh",
+        help = "Ignore cached entries, fetch again and update the cache",
+        action = "store_true",
+        )
+
+    argparser.add_argument(
+        "--rate-limit",
+        help = "Requests per second to a host, e.g. www.youtube.com=2, "
+            "may be given several times",
+        action = "append",
+        default = [],
+        metavar = "HOST=RATE",
+        )
+    argparser.add_argument(
+        "--max-per-host",
+        help = "Requests in flight per host",
+        type = int,
+        default = 8,
+        )
+    argparser.add_argument(
+        "--max-retries",
+        help = "Retries of a request that was throttled by its host",
+        type = int,
+        default = 5,
+        )
+
+    argparser.add_argument(
+        "--journal",
+        help = "Append the progress of a batch run to this JSONL file",
+        default = None,
+        )
+    argparser.add_argument(
+        "--resume",
+        help = "Skip the work completed in --journal, retry failed and "
+            "unfinished URLs",
+        action = "store_true",
+        )
+
+    argparser.add_argument(
+        "-o", "--output",
+        help = "Write a result row (song, artists, query, matched URL, "
+            "score, stage timings) per URL to this file as it completes, "
+            "'-' writes to stdout",
+        default = None,
+        metavar = "PATH",
+        )
+    argparser.add_argument(
+        "--output-format",
+        help = "Format of --output, by default guessed from its extension "
+            "and jsonl otherwise. parquet requires pyarrow",
+        choices = sorted(RESULT_FORMATS),
+        default = None,
+        )
+    argparser.add_argument(
+        "-q", "--quiet",
+        help = "Do not print the candidates, scores and status of every "
+            "search, only failures and results",
+        action = "store_true",
+        )
+
+    argparser.add_argument(
+        "--shard",
+        help = "Only process the URLs of shard I of N (0 <= I < N), picked "
+            "by a stable hash of the track ID, e.g. --shard 2/8 on the third "
+            "of eight nodes given the same input",
+        type = shard_spec,
+        default = None,
+        metavar = "I/N",
+        )
+    argparser.add_argument(
+        "--workers",
+        help = "Run N sharded worker processes on this machine, each with "
+            "its own browsers, and merge their --output and --journal when "
+            "they finished. The per-host rate limits are split among them",
+        type = int,
+        default = None,
+        metavar = "N",
+        )
+    argparser.add_argument(
+        "--merge",
+        help = "Instead of running, merge the results or journal files of "
+            "shards into --output and --journal",
+        nargs = "+",
+        default = None,
+        metavar = "PATH",
+        )
+    argparser.set_defaults(rate_share=1.0)
+
+    argparser.add_argument(
+        "--serve",
+        help = "Run as a resolver service with warm browsers and caches on "
+            "HOST:PORT or unix:/path/to/socket, see ResolverService",
+        default = None,
+        metavar = "ADDRESS",
+        )
+
+    argparser.add_argument(
+        "--metrics",
+        help = "Write stage timings (p50/p95) and event counters to this "
+            "file at the end of the run, as Prometheus text for *.prom "
+            "files and JSON otherwise",
+        default = None,
+        metavar = "PATH",
+        )
+    argparser.add_argument(
+        "--profile",
+        help = "Profile the run with cProfile and write the pstats to "
+            "this file",
+        default = None,
+        metavar = "PATH",
+        )
+
+    cli_args = argparser.parse_args()
+    if cli_args.resume and cli_args.journal is None:
+        argparser.error("--resume requires --journal")
+    if cli_args.output is not None and cli_args.output_format is None:
+        cli_args.output_format = result_format(cli_args.output)
+    if cli_args.output_format == "parquet" \
+            and importlib.util.find_spec("pyarrow") is None:
+        argparser.error("--output-format parquet requires pyarrow")
+    if cli_args.merge is not None and cli_args.output is None \
+            and cli_args.journal is None:
+        argparser.error("--merge requires --output and/or --journal")
+    if cli_args.archive is None:
+        cli_args.archive = os.path.join(
+            cli_args.download_dir, DOWNLOAD_ARCHIVE_NAME
+            )
+    if cli_args.prune_archive and cli_args.no_archive:
+        argparser.error("--prune-archive and --no-archive are exclusive")
+    if cli_args.workers is not None:
+        if cli_args.workers < 1:
+            argparser.error("--workers must be at least 1")
+        if cli_args.shard is not None:
+            argparser.error("--workers and --shard are exclusive")
+        if cli_args.file == "-":
+            argparser.error("--workers cannot share URLs read from stdin")
+        if cli_args.output == "-":
+            argparser.error("--workers cannot write results to stdout")
+    for rate_limit in cli_args.rate_limit:
+        host, _, rate = rate_limit.partition("=")
+        try:
+            float(rate)
+        except ValueError:
+            argparser.error("--rate-limit expects HOST=RATE, got {!r}".format(
+                rate_limit
+                ))
+
+    if _skip:    # For Debugging
+        urls = __debug_sample_inputs()
+        return urls, cli_args
+    # :TODO: :FIXME: 
+    # Redirect argparser attributes to correct functions to modify
+    # execution
+
+    # :REVIEW: Should one handle exceptions?, Allowing errors to
+    # propagate is probably better  
+    urls = input_urls(cli_args)
+
+    return urls, cli_args
+
+
+def input_urls(cli_args):
+    """
+    The URLs given by -f, read lazily so that even huge files are never
+    held in memory, or by -s
+    """
+    if cli_args.file is not None:
+        return iter_input_urls(cli_args.file)
+    if cli_args.single is not None:
+        return [str(cli_args.single)]
+    return []
+
+
+def shard_spec(value):
+    """
+    argparse type of --shard, "I/N" -> (I, N)
+    """
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            "expected I/N, e.g. 0/4, got {!r}".format(value)
+            )
+    if not 0 <= index < count:
+        raise argparse.ArgumentTypeError(
+            "shard index must be in [0, N), got {!r}".format(value)
+            )
+    return index, count
+
+
+def shard_of(url, count):
+    """
+    Shard in [0, count) of a URL. Stable across processes, machines and
+    python versions (unlike hash()), and keyed by track ID so that every
+    form of a track's URL lands in the same shard.
+    """
+    key = spotify_track_id(url) or url
+    digest = hashlib.sha1(key.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % count
+
+
+def shard_path(path, index, count):
+    """
+    Per-shard variant of an output path,
+    e.g. "results.jsonl" -> "results.shard0-of-4.jsonl"
+    """
+    root, extension = os.path.splitext(path)
+    return "{}.shard{}-of-{}{}".format(root, index, count, extension)
+
+
+def iter_input_urls(path):
+    """
+    Lazily read URLs from a text file, one per line, or from stdin if
+    :param:'path' is "-". Surrounding whitespace is stripped, blank lines
+    and lines starting with "#" are skipped.
+
+    :return: Generator of URLs
+    """
+    if path == "-":
+        yield from _iter_url_lines(sys.stdin)
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        yield from _iter_url_lines(f)
+
+
+def _iter_url_lines(lines):
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            yield line
+
+
+class _SpanStats:
+    """
+    Count, total and maximum of a span plus a bounded uniform sample of
+    its durations (reservoir sampling) for the percentiles, so memory stays
+    constant however many tracks are processed
+    """
+
+    def __init__(self, reservoir_size):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = list()
+        self._reservoir_size = reservoir_size
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        if len(self.samples) < self._reservoir_size:
+            self.samples.append(seconds)
+        else:
+            i = random.randrange(self.count)
+            if i < self._reservoir_size:
+                self.samples[i] = seconds
+
+    def percentile(self, q):
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Metrics:
+    """
+    Thread-safe timing spans and event counters of a run, e.g.::
+
+        with METRICS.span("page_load"):
+            driver.get(search_url)
+        METRICS.incr("metadata_cache_hit")
+
+    :meth:'summary' reports count, mean, p50, p95 and max per span, and
+    :meth:'write' exports it as JSON or in the Prometheus text format.
+    """
+
+    def __init__(self, reservoir_size=10000):
+        self._spans = dict()
+        self._counters = dict()
+        self._reservoir_size = reservoir_size
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def observe(self, name, seconds):
+        with self._lock:
+            if name not in self._spans:
+                self._spans[name] = _SpanStats(self._reservoir_size)
+            self._spans[name].add(seconds)
+
+    def incr(self, name, n=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def summary(self):
+        """
+        :return: A dict in the form
+            dict_['spans'][name] = {count, total, mean, p50, p95, max}
+            dict_['counters'][name] = :int:'count'
+        :rtype: dict
+        """
+        with self._lock:
+            spans = {
+                name: {
+                    "count": stats.count,
+                    "total": stats.total,
+                    "mean": stats.total / stats.count,
+                    "p50": stats.percentile(0.50),
+                    "p95": stats.percentile(0.95),
+                    "max": stats.max,
+                }
+                for name, stats in sorted(self._spans.items())
+            }
+            counters = dict(sorted(self._counters.items()))
+        return {"spans": spans, "counters": counters}
+
+    def to_json(self):
+        return json.dumps(self.summary(), indent=2)
+
+    def to_prometheus(self, prefix="spotify2youtube"):
+        summary = self.summary()
+        lines = [
+            "# HELP {}_stage_seconds Duration of pipeline stages".format(
+                prefix
+                ),
+            "# TYPE {}_stage_seconds summary".format(prefix),
+        ]
+        for name, stats in summary["spans"].items():
+            for key, quantile in (("p50", "0.5"), ("p95", "0.95")):
+                lines.append(
+                    '{}_stage_seconds{{stage="{}",quantile="{}"}} {}'.format(
+                        prefix, name, quantile, stats[key]
+                        )
+                    )
+            lines.append('{}_stage_seconds_sum{{stage="{}"}} {}'.format(
+                prefix, name, stats["total"]
+                ))
+            lines.append('{}_stage_seconds_count{{stage="{}"}} {}'.format(
+                prefix, name, stats["count"]
+                ))
+        lines.append("# HELP {}_events_total Counted events".format(prefix))
+        lines.append("# TYPE {}_events_total counter".format(prefix))
+        for name, count in summary["counters"].items():
+            lines.append('{}_events_total{{event="{}"}} {}'.format(
+                prefix, name, count
+                ))
+        return "\n".join(lines) + "\n"
+
+    def write(self, path, format=None):
+        """
+        Write the summary to :param:'path', as Prometheus text if
+        :param:'format' is "prometheus" or the file ends with .prom,
+        otherwise as JSON
+        """
+        if format is None:
+            format = "prometheus" if path.endswith(".prom") else "json"
+        text = self.to_prometheus() if format == "prometheus" \
+            else self.to_json()
+        with open(path, "w") as f:
+            f.write(text)
+
+
+METRICS = Metrics()
+
+
+class ThreadProfiler:
+    """
+    cProfile hook for the threaded parts of a run. Before Python 3.12
+    :mod:'cProfile' only sees the thread it is enabled in, so every thread
+    running a :meth:'call' gets a profiler of its own and :meth:'dump'
+    merges them all into one pstats file, e.g. for ``python -m pstats``.
+    From 3.12 on a profiler sees every thread but only one may be active
+    at a time, so the one of :meth:'profiling' covers the whole run and
+    :meth:'call' is a plain call.
+    """
+
+    process_wide = sys.version_info >= (3, 12)
+
+    def __init__(self):
+        self._profiles = list()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _profile(self):
+        profile = getattr(self._local, "profile", None)
+        if profile is None:
+            profile = cProfile.Profile()
+            self._local.profile = profile
+            with self._lock:
+                self._profiles.append(profile)
+        return profile
+
+    def call(self, func, *args, **kwargs):
+        if self.process_wide:
+            return func(*args, **kwargs)
+        return self._profile().runcall(func, *args, **kwargs)
+
+    @contextlib.contextmanager
+    def profiling(self):
+        """
+        Profile the calling thread for the duration of the block
+        """
+        profile = self._profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+
+    def dump(self, path):
+        with self._lock:
+            profiles = list(self._profiles)
+        if not profiles:
+            return
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        stats.dump_stats(path)
+
+
+# Set to a ThreadProfiler by --profile
+PROFILER = None
+# Per-video and per-candidate console output, turned off by --quiet
+VERBOSE = True
+
+
+_SPOTIFY_TRACK_ID_RX = re.compile(r"/track/([0-9A-Za-z]+)")
+
+
+def spotify_track_id(url):
+    """
+    Spotify track ID of a track URL, e.g. "6NYqFxemN4ZdpIO8HGrCzC" for
+    https://open.spotify.com/track/6NYqFxemN4ZdpIO8HGrCzC?si=...
+
+    :return: The track ID, or None if :param:'url' is not a track URL
+    :rtype: class:'str'
+    """
+    match = _SPOTIFY_TRACK_ID_RX.search(url)
+    return match.group(1) if match else None
+
+
+def default_cache_path():
+    """
+    Location of the persistent cache database, under $XDG_CACHE_HOME
+    (~/.cache by default)
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME") \
+        or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "spotify2youtube", "cache.sqlite3")
+
+
+class SQLiteCache:
+    """
+    Persistent key -> JSON value store in a single SQLite table, with
+    expiry of old entries and least-recently-used eviction once the table
+    grows beyond :attr:'max_entries'. Several caches (tables) can share one
+    database file, and an instance can be shared between threads.
+
+    :param path: Database file, created with its directory when missing.
+        ":memory:" keeps the cache for the lifetime of the instance only
+    :type path: class:'str'
+    :param table: Name of the table holding this cache
+    :type table: class:'str'
+    :param ttl: Seconds after which an entry expires, None never expires
+    :type ttl: class:'float'
+    :param max_entries: Number of entries kept, None is unbounded
+    :type max_entries: class:'int'
+    """
+
+    def __init__(self, path, table, ttl=None, max_entries=None):
+        if not re.fullmatch(r"[A-Za-z_][A-Za-z0-9_]*", table):
+            raise ValueError("Invalid cache table name {!r}".format(table))
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)),
+                        exist_ok=True)
+        self.path = path
+        self.table = table
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(path, timeout=30,
+                                   check_same_thread=False)
+        with self._lock, self._db:
+            if path != ":memory:":
+                # Readers do not block the writer, e.g. sharded workers
+                self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS {} ("
+                "key TEXT PRIMARY KEY, "
+                "value TEXT NOT NULL, "
+                "created_at REAL NOT NULL, "
+                "accessed_at REAL NOT NULL)".format(table)
+                )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS {0}_accessed_at "
+                "ON {0} (accessed_at)".format(table)
+                )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM {}".format(self.table)
+                ).fetchone()[0]
+
+    def get(self, key):
+        """
+        Value stored under :param:'key', None if it is missing or expired
+        """
+        now = time.time()
+        with self._lock, self._db:
+            row = self._db.execute(
+                "SELECT value, created_at FROM {} WHERE key = ?".format(
+                    self.table
+                    ),
+                (key,),
+                ).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            if self.ttl is not None and now - created_at > self.ttl:
+                self._db.execute(
+                    "DELETE FROM {} WHERE key = ?".format(self.table),
+                    (key,),
+                    )
+                return None
+            self._db.execute(
+                "UPDATE {} SET accessed_at = ? WHERE key = ?".format(
+                    self.table
+                    ),
+                (now, key),
+                )
+        return json.loads(value)
+
+    def put(self, key, value):
+        """
+        Store a JSON serializable :param:'value' under :param:'key',
+        evicting the least recently used entries when the cache is full
+        """
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO {} "
+                "(key, value, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?)".format(self.table),
+                (key, json.dumps(value), now, now),
+                )
+            if self.max_entries is not None:
+                self._db.execute(
+                    "DELETE FROM {0} WHERE key IN ("
+                    "SELECT key FROM {0} ORDER BY accessed_at DESC "
+                    "LIMIT -1 OFFSET ?)".format(self.table),
+                    (self.max_entries,),
+                    )
+
+    def delete(self, key):
+        with self._lock, self._db:
+            self._db.execute(
+                "DELETE FROM {} WHERE key = ?".format(self.table), (key,)
+                )
+
+    def purge_expired(self):
+        """
+        Delete every expired entry
+
+        :return: Number of deleted entries
+        :rtype: class:'int'
+        """
+        if self.ttl is None:
+            return 0
+        with self._lock, self._db:
+            return self._db.execute(
+                "DELETE FROM {} WHERE created_at < ?".format(self.table),
+                (time.time() - self.ttl,),
+                ).rowcount
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class MetadataCache(SQLiteCache):
+    """
+    Song details of :func:'get_song_details' keyed by Spotify track ID
+    """
+
+    def __init__(self, path, ttl=None, max_entries=None):
+        super().__init__(path, "track_metadata", ttl, max_entries)
+
+
+def normalize_search_query(search_query):
+    """
+    Canonical form of a search query used as cache key, so that queries
+    differing only in case, unicode representation or separators share
+    one entry, e.g. "Song_Name+ARTIST" -> "song+name+artist"
+    """
+    search_query = unicodedata.normalize("NFKC", search_query).casefold()
+    return "+".join(re.split(r"[\s+_,]+", search_query)).strip("+")
+
+
+class SearchCache(SQLiteCache):
+    """
+    Youtube search results and the matched video per normalized search
+    query, see :func:'normalize_search_query'. Usable on its own by other
+    tools::
+
+        with SearchCache(default_cache_path()) as cache:
+            url = cache.get_match("song+artist")
+            if url is None:
+                ...
+                cache.put_match("song+artist", url)
+
+    A match is only valid for the scoring that made it, so it can be
+    stored under a key of the scorer settings and the song's duration (see
+    :meth:'MatchScorer.cache_key') and is then only returned for that key.
+    """
+
+    def __init__(self, path, ttl=None, max_entries=None):
+        super().__init__(path, "search_results", ttl, max_entries)
+
+    def _update(self, search_query, **fields):
+        key = normalize_search_query(search_query)
+        with self._lock:
+            entry = self.get(key) or dict()
+            entry.update(fields)
+            self.put(key, entry)
+
+    def get_videos(self, search_query):
+        """
+        Cached :class:'VideoCandidate' tuples of a search, or None
+        """
+        entry = self.get(normalize_search_query(search_query))
+        if entry is None or entry.get("video_list") is None:
+            return None
+        # Entries cached before durations were read have 3 fields
+        return [VideoCandidate(*video) for video in entry["video_list"]]
+
+    def put_videos(self, search_query, video_list):
+        self._update(search_query, video_list=list(video_list))
+
+    def get_match(self, search_query, match_key=None):
+        """
+        Cached URL of the video matched for a search under
+        :param:'match_key', or None
+        """
+        match = self.get_match_details(search_query, match_key)
+        return match.url if match is not None else None
+
+    def get_match_details(self, search_query, match_key=None):
+        """
+        The cached :class:'CachedMatch' of a search under
+        :param:'match_key', or None
+        """
+        entry = self.get(normalize_search_query(search_query))
+        if entry is None or entry.get("matched_video_url") is None \
+                or entry.get("match_key") != match_key:
+            return None
+        return CachedMatch(
+            entry["matched_video_url"],
+            entry.get("match_score"),
+            entry.get("match_confidence"),
+            )
+
+    def put_match(self, search_query, matched_video_url, score=None,
+                  confidence=None, match_key=None):
+        self._update(
+            search_query,
+            matched_video_url = matched_video_url,
+            match_score = score,
+            match_confidence = confidence,
+            match_key = match_key,
+            )
+
+
+# A match of :class:'SearchCache', see :func:'best_video_match'
+CachedMatch = collections.namedtuple(
+    "CachedMatch", ["url", "score", "confidence"]
+    )
+
+
+class RateLimitError(IOError):
+    """
+    A host kept throttling (HTTP 429/5xx or a captcha page) after every
+    retry. An IOError like :class:'requests.RequestException', without
+    importing requests.
+
+    :ivar response: The last throttled response, None for a captcha page
+    """
+
+    def __init__(self, *args, response=None):
+        super().__init__(*args)
+        self.response = response
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket that allows :attr:'rate' acquisitions per
+    second on average and bursts of up to :attr:'burst'
+
+    :param rate: Tokens added per second
+    :type rate: class:'float'
+    :param burst: Capacity of the bucket
+    :type burst: class:'float'
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Take a token, sleeping until one is available
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.burst,
+                    self._tokens + (now - self._updated) * self.rate,
+                    )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class _HostState:
+    def __init__(self, rate, max_concurrency):
+        self.bucket = TokenBucket(rate)
+        self.max_rate = rate
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        self.error_rate = 0.0   # Exponentially weighted share of throttles
+
+
+class HostRateLimiter:
+    """
+    Pacing shared by every request of the module, per host: a token bucket
+    limits the request rate and a semaphore the number of requests in
+    flight. Throttling answers (HTTP 429 and 5xx, or a redirect to a
+    captcha page) are retried after an exponential backoff with full
+    jitter, honouring Retry-After.
+
+    The rate of a host adapts to what it tolerates: it is halved on every
+    throttle and grows back by :attr:'rate_step' per successful request,
+    up to its configured rate, while the observed error rate stays below
+    :attr:'target_error_rate'.
+
+    :param rates: Host -> requests per second, e.g. {"www.youtube.com": 2}
+    :type rates: class:'dict'
+    :param default_rate: Requests per second for any other host
+    :type default_rate: class:'float'
+    :param max_concurrency: Requests in flight per host
+    :type max_concurrency: class:'int'
+    :param max_retries: Retries of a throttled request
+    :type max_retries: class:'int'
+    :param base_delay: Backoff of the first retry in seconds
+    :type base_delay: class:'float'
+    :param max_delay: Upper bound of a single backoff in seconds
+    :type max_delay: class:'float'
+    """
+
+    THROTTLE_STATUS = (429, 500, 502, 503, 504)
+    # Paths of youtube's own captcha interstitial, Google's "unusual
+    # traffic" captcha is www.google.com/sorry/index
+    CAPTCHA_PATHS = ("/das_captcha",)
+
+    def __init__(self, rates=None, default_rate=5.0, max_concurrency=8,
+                 max_retries=5, base_delay=1.0, max_delay=60.0,
+                 min_rate=0.1, rate_step=0.05, target_error_rate=0.05):
+        self.rates = dict(rates or dict())
+        self.default_rate = default_rate
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.min_rate = min_rate
+        self.rate_step = rate_step
+        self.target_error_rate = target_error_rate
+        self._hosts = dict()
+        self._lock = threading.Lock()
+
+    def _state(self, url):
+        host = urllib.parse.urlsplit(url).netloc.lower()
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = _HostState(
+                    self.rates.get(host, self.default_rate),
+                    self.max_concurrency,
+                    )
+            return self._hosts[host]
+
+    def wait(self, url):
+        """
+        Block until the host of :param:'url' may be contacted again,
+        without taking one of its concurrency slots
+        """
+        self._state(url).bucket.acquire()
+
+    @contextlib.contextmanager
+    def slot(self, url):
+        """
+        Hold one of the concurrency slots of the host of :param:'url'
+        after waiting for its rate limit
+        """
+        state = self._state(url)
+        with state.slots:
+            state.bucket.acquire()
+            yield
+
+    def report(self, url, throttled):
+        """
+        Adjust the rate of the host of :param:'url' to the outcome of a
+        request
+        """
+        state = self._state(url)
+        with self._lock:
+            state.error_rate = 0.9 * state.error_rate + 0.1 * bool(throttled)
+            bucket = state.bucket
+            if throttled:
+                bucket.rate = max(self.min_rate, bucket.rate / 2)
+            elif state.error_rate < self.target_error_rate:
+                bucket.rate = min(state.max_rate, bucket.rate + self.rate_step)
+
+    def backoff_delay(self, attempt, retry_after=None):
+        """
+        Seconds to wait before retry number :param:'attempt' (from 0)
+        """
+        if retry_after is not None:
+            return min(self.max_delay, retry_after)
+        return random.uniform(
+            0, min(self.max_delay, self.base_delay * 2 ** attempt)
+            )
+
+    @classmethod
+    def is_captcha_url(cls, url):
+        """
+        Whether :param:'url' is a captcha page. Only the host and the path
+        are looked at, a search for "captcha" is not a captcha page.
+        """
+        parts = urllib.parse.urlsplit(url)
+        host, path = parts.netloc.lower(), parts.path.lower()
+        if path.startswith("/sorry/"):
+            return host == "" or host == "google.com" \
+                or host.endswith(".google.com")
+        return path.startswith(cls.CAPTCHA_PATHS)
+
+    def is_throttled(self, response):
+        if response.status_code in self.THROTTLE_STATUS:
+            return True
+        urls = [response.url] + [
+            r.headers.get("Location", "") for r in response.history
+            ]
+        return any(self.is_captcha_url(url) for url in urls)
+
+    def request(self, method, url, session=None, **kwargs):
+        """
+        :meth:'requests.Session.request' paced and retried for the host of
+        :param:'url'
+
+        :raises RateLimitError: The host still throttles after
+            :attr:'max_retries' retries
+        :rtype: class:'requests.Response'
+        """
+        session = session or get_http_session()
+        for attempt in range(self.max_retries + 1):
+            with self.slot(url):
+                response = session.request(method, url, **kwargs)
+            throttled = self.is_throttled(response)
+            self.report(url, throttled)
+            if not throttled:
+                return response
+
+            retry_after = response.headers.get("Retry-After")
+            response.close()
+            METRICS.incr("throttled")
+            if attempt == self.max_retries:
+                break
+            METRICS.incr("retries")
+            delay = self.backoff_delay(
+                attempt,
+                float(retry_after) if retry_after
+                    and retry_after.isdigit() else None,
+                )
+            print("# {} throttled ({}), retrying in {:0.1f}s".format(
+                url, response.status_code, delay
+                ), file=sys.stderr)
+            time.sleep(delay)
+        raise RateLimitError(
+            "{} still throttled after {} retries".format(
+                url, self.max_retries
+                ),
+            response = response,
+            )
+
+
+RATE_LIMITER = HostRateLimiter(rates={
+    "open.spotify.com": 10,
+    "api.spotify.com": 10,
+    "www.youtube.com": 3,
+})
+
+
+_HTTP_SESSION = None
+_HTTP_SESSION_LOCK = threading.Lock()
+
+
+def get_http_session():
+    """
+    The :class:'requests.Session' shared by every plain HTTP request of the
+    module. It keeps connections to Spotify and youtube alive between
+    requests, instead of a new TCP/TLS handshake for each of them, and is
+    sized for many concurrent fetches.
+    """
+    global _HTTP_SESSION
+    with _HTTP_SESSION_LOCK:
+        if _HTTP_SESSION is None:
+            import requests
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections = 8,   # Number of hosts
+                pool_maxsize = 32,      # Connections per host
+                )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _HTTP_SESSION = session
+        return _HTTP_SESSION
+
+
+class SongDetailsError(ValueError):
+    """
+    The Spotify page does not look like a track page, e.g. an error or
+    region block page
+    """
+
+
+_HTML_TITLE_RX = re.compile(r"<title[^>]*>(.*?)</title>", re.S | re.I)
+# <meta name="music:duration" content="215"/>, the track length in seconds
+_MUSIC_DURATION_RX = re.compile(
+    r"<meta\s[^>]*?(?:name|property)=\"music:duration\"[^>]*?"
+    r"content=\"(\d+)\""
+    r"|<meta\s[^>]*?content=\"(\d+)\"[^>]*?"
+    r"(?:name|property)=\"music:duration\"",
+    re.I,
+    )
+# International Standard Recording Code, in the JSON some pages embed
+_ISRC_RX = re.compile(r"\"isrc\"\s*:\s*\"([A-Z]{2}[A-Z0-9]{3}\d{7})\"", re.I)
+
+
+def _release_response(response, drain_limit=64 * 1024):
+    """
+    Give the connection of a partially read streamed response back to the
+    pool. A connection can only be reused once its body is fully read, so
+    the remainder is drained when it is at most :param:'drain_limit'
+    bytes; otherwise the connection is closed, which is cheaper than
+    downloading a large remainder.
+    """
+    try:
+        length = int(response.headers["Content-Length"])
+        remaining = length - response.raw.tell()
+    except (KeyError, ValueError, AttributeError):
+        remaining = None
+    if remaining is not None and remaining <= drain_limit:
+        for _ in response.iter_content(drain_limit):
+            pass
+    response.close()
+
+
+def fetch_page_head(url, session=None, stop_at=b"</title>",
+                    chunk_size=8192, max_bytes=2 * 1024 * 1024, timeout=10):
+    """
+    Download a page only up to (and including) :param:'stop_at', e.g. the
+    end of its <title>, instead of the whole document
+
+    :param url: URL of the page
+    :type url: class:'str'
+    :param session: Session to send the request with, defaults to
+        :func:'get_http_session'
+    :type session: class:'requests.Session'
+    :param stop_at: Marker after which reading stops
+    :type stop_at: class:'bytes'
+    :param max_bytes: Read at most this many (decoded) bytes
+    :type max_bytes: class:'int'
+    :return: The beginning of the page
+    :rtype: class:'str'
+    """
+    response = RATE_LIMITER.request(
+        "GET", url, session, stream=True, timeout=timeout
+        )
+    try:
+        response.raise_for_status()
+        buffer = bytearray()
+        for chunk in response.iter_content(chunk_size):
+            # Only the tail can contain a marker that was not there before
+            start = max(0, len(buffer) - len(stop_at))
+            buffer += chunk
+            if buffer.find(stop_at, start) != -1 or len(buffer) >= max_bytes:
+                break
+    finally:
+        _release_response(response)
+    return buffer.decode(response.encoding or "utf-8", "replace")
+
+
+def get_song_details(url: str, cache=None, refresh=False, session=None):
+    """
+    Given an URL, retrieve the HTML source code and separate it to obtain
+    song info
+
+    :param url: Spotify song URL
+    :type url: class:'str'
+    :param cache: Cache consulted before and filled after fetching the page,
+        keyed by the track ID of :param:'url'
+    :type cache: class:'MetadataCache'
+    :param refresh: Ignore a cached entry and fetch the page again
+    :type refresh: class:'bool'
+    :param session: Session to fetch the page with, defaults to
+        :func:'get_http_session'
+    :type session: class:'requests.Session'
+    """
+
+    cache_key = spotify_track_id(url) or url
+    if cache is not None and not refresh:
+        dict_ = cache.get(cache_key)
+        if dict_ is not None:
+            METRICS.incr("metadata_cache_hit")
+            return dict_
+        METRICS.incr("metadata_cache_miss")
+
+    # Only the <head> of the page is needed (the <title> and the
+    # music:duration), the rest is not downloaded
+    with METRICS.span("metadata_fetch"):
+        head = fetch_page_head(url, session, stop_at=b"</head>")
+    dict_ = parse_song_details(head, url)
+    if cache is not None:
+        cache.put(cache_key, dict_)
+    return dict_
+
+
+def parse_song_details(page_source, url=""):
+    """
+    Separate the song info from the <title> of a Spotify track page, e.g.
+    "Song - song by Artist1, Artist2 | Spotify", and read the track length
+    from its music:duration <meta>
+
+    :param page_source: The track page, or only its beginning up to the
+        </head>
+    :type page_source: class:'str'
+    :param url: URL of the page, only used in error messages
+    :type url: class:'str'
+    :raises SongDetailsError: The page has no track title
+    :return: A dictionary in the form
+        dict_['song'] = :str:'song'
+        dict_['artists'] = :list:'artists'
+        dict_['duration'] = :int:'seconds' or None
+        dict_['isrc'] = :str:'ISRC' or None
+    :rtype: dict
+    """
+    match = _HTML_TITLE_RX.search(page_source)
+    if match is None:
+        raise SongDetailsError("No <title> in the page of {}".format(url))
+    title = html.unescape(match.group(1))
+    # print(title)
+
+    temp = re.split(" \| ", title) 
+    temp = temp[0].split(" - song by ")
+    if len(temp) != 2:
+        raise SongDetailsError("Unexpected title {!r} of {}".format(
+            title, url
+            ))
+    # print(temp)
+    name_song = temp[0]
+    name_artist = temp[1]
+
+    duration = _MUSIC_DURATION_RX.search(page_source)
+    isrc = _ISRC_RX.search(page_source)
+    dict_ = {
+        "song": name_song,
+        "artists": [i for i in name_artist.split(", ") ],
+        "duration": int(duration.group(1) or duration.group(2))
+            if duration else None,
+        "isrc": isrc.group(1).upper() if isrc else None,
+    }
+    # print(name_song, "==",name_artist, "\n")
+    # pprint(dict_)
+    # return name_song, name_artist
+    return dict_
+
+
+_SPOTIFY_URL_RX = re.compile(r"(track|playlist|album)[/:]([0-9A-Za-z]+)")
+
+SPOTIFY_API_URL = "https://api.spotify.com/v1"
+# Overridable to run against local stand-ins of the sites, e.g. for load
+# tests without network access, see benchmarks/standin_server.py
+SPOTIFY_BASE_URL = os.environ.get(
+    "SPOTIFY2YOUTUBE_SPOTIFY_URL", "https://open.spotify.com"
+    ).rstrip("/")
+YOUTUBE_BASE_URL = os.environ.get(
+    "SPOTIFY2YOUTUBE_YOUTUBE_URL", "https://www.youtube.com"
+    ).rstrip("/")
+SPOTIFY_TOKEN_URL = "https://accounts.spotify.com/api/token"
+_SPOTIFY_TOKEN = {"value": None, "expires_at": 0}
+_SPOTIFY_TOKEN_LOCK = threading.Lock()
+
+
+def spotify_url_kind(url):
+    """
+    Kind and ID of a Spotify URL or URI, e.g. ("playlist", "37i9...") for
+    https://open.spotify.com/playlist/37i9... or spotify:playlist:37i9...
+
+    :return: A (kind, id) pair, kind is one of "track", "playlist" and
+        "album", (None, None) for anything else
+    :rtype: tuple
+    """
+    match = _SPOTIFY_URL_RX.search(url)
+    if match is None:
+        return None, None
+    return match.group(1), match.group(2)
+
+
+def _spotify_api_token(session):
+    """
+    Client credentials access token of the Spotify Web API, read from the
+    SPOTIFY_CLIENT_ID and SPOTIFY_CLIENT_SECRET environment variables and
+    kept until it expires. None when no credentials are set.
+    """
+    client_id = os.environ.get("SPOTIFY_CLIENT_ID")
+    client_secret = os.environ.get("SPOTIFY_CLIENT_SECRET")
+    if not client_id or not client_secret:
+        return None
+    with _SPOTIFY_TOKEN_LOCK:
+        if time.time() < _SPOTIFY_TOKEN["expires_at"]:
+            return _SPOTIFY_TOKEN["value"]
+        response = RATE_LIMITER.request(
+            "POST",
+            SPOTIFY_TOKEN_URL,
+            session,
+            data = {"grant_type": "client_credentials"},
+            auth = (client_id, client_secret),
+            timeout = 10,
+            )
+        response.raise_for_status()
+        token = response.json()
+        _SPOTIFY_TOKEN["value"] = token["access_token"]
+        # Renew a minute early rather than sending an expired token
+        _SPOTIFY_TOKEN["expires_at"] = time.time() + token["expires_in"] - 60
+        return _SPOTIFY_TOKEN["value"]
+
+
+def _iter_collection_api(kind, id_, token, session):
+    """
+    Tracks of a playlist or album from the Spotify Web API, following the
+    "next" links of its paginated track listing (100 tracks per page for
+    playlists, 50 for albums)
+    """
+    url = "{}/{}s/{}/tracks?limit={}".format(
+        SPOTIFY_API_URL, kind, id_, 100 if kind == "playlist" else 50
+        )
+    while url:
+        response = RATE_LIMITER.request(
+            "GET",
+            url,
+            session,
+            headers = {"Authorization": "Bearer " + token},
+            timeout = 10,
+            )
+        response.raise_for_status()
+        page = response.json()
+        for item in page["items"]:
+            # Playlist items wrap the track, album items are the track
+            track = item.get("track") if kind == "playlist" else item
+            # Removed tracks, local files and podcast episodes
+            if not track or track.get("type") != "track" \
+                    or not track.get("id"):
+                continue
+            yield {
+                "id": track["id"],
+                "song": track["name"],
+                "artists": [artist["name"] for artist in track["artists"]],
+                "duration": track["duration_ms"] // 1000
+                    if track.get("duration_ms") else None,
+                "isrc": (track.get("external_ids") or dict()).get("isrc"),
+            }
+        url = page.get("next")
+
+
+def _iter_collection_embed(kind, id_, session):
+    """
+    Tracks of a playlist or album from its public embed page, which needs
+    no credentials. The embed page lists at most the first 100 tracks and
+    has no pagination, use the Web API for longer playlists.
+    """
+    response = RATE_LIMITER.request(
+        "GET",
+        "{}/embed/{}/{}".format(SPOTIFY_BASE_URL, kind, id_),
+        session,
+        timeout = 10,
+        )
+    response.raise_for_status()
+    match = re.search(
+        r'<script id="__NEXT_DATA__" type="application/json">(.*?)</script>',
+        response.text,
+        re.S,
+        )
+    if match is None:
+        raise ValueError("No track list in the embed page of {} {}".format(
+            kind, id_
+            ))
+    entity = json.loads(match.group(1))["props"]["pageProps"]["state"] \
+        ["data"]["entity"]
+    for item in entity.get("trackList", []):
+        track_kind, track_id = spotify_url_kind(item.get("uri", ""))
+        if track_kind != "track":
+            continue
+        yield {
+            "id": track_id,
+            "song": item["title"],
+            "artists": [
+                artist.strip()
+                for artist in item["subtitle"].replace("\xa0", " ").split(",")
+            ],
+            "duration": item["duration"] // 1000
+                if item.get("duration") else None,
+            "isrc": None,
+        }
+
+
+def expand_spotify_url(url, session=None):
+    """
+    Tracks of a Spotify playlist or album URL, read in bulk from the
+    collection instead of one track page per song. The Web API is used
+    when SPOTIFY_CLIENT_ID and SPOTIFY_CLIENT_SECRET are set (all tracks,
+    a request per 100), otherwise the embed page (first 100 tracks, one
+    request).
+
+    :param url: Spotify playlist or album URL
+    :type url: class:'str'
+    :return: Generator of dicts with the "id", "song" and "artists" of each
+        track
+    """
+    kind, id_ = spotify_url_kind(url)
+    if kind not in ("playlist", "album"):
+        raise ValueError("Not a playlist or album URL: {}".format(url))
+    session = session or get_http_session()
+    token = _spotify_api_token(session)
+    if token is not None:
+        return _iter_collection_api(kind, id_, token, session)
+    return _iter_collection_embed(kind, id_, session)
+
+
+def expand_spotify_urls(urls, prefetched, cache=None):
+    """
+    Replace playlist and album URLs in :param:'urls' with the URLs of their
+    tracks. The song details read along the way are stored in
+    :param:'prefetched' (and :param:'cache'), keyed by track ID, so that
+    the tracks need no further request.
+
+    :param urls: Spotify track, playlist and album URLs
+    :type urls: iterable
+    :param prefetched: Filled with track ID -> song details
+    :type prefetched: class:'dict'
+    :param cache: Cache of Spotify song details
+    :type cache: class:'MetadataCache'
+    :return: Generator of track URLs
+    """
+    for url in urls:
+        kind, _ = spotify_url_kind(url)
+        if kind not in ("playlist", "album"):
+            yield url
+            continue
+        count = 0
+        for track in expand_spotify_url(url):
+            song_data = {
+                key: track[key]
+                for key in ("song", "artists", "duration", "isrc")
+            }
+            prefetched[track["id"]] = song_data
+            if cache is not None:
+                cache.put(track["id"], song_data)
+            count += 1
+            yield SPOTIFY_BASE_URL + "/track/" + track["id"]
+        if VERBOSE:
+            print("# Expanded {} into {} tracks".format(url, count))
+
+
+def parse_search_query(song_data: dict) -> str:
+    """
+    From a dictionary containing a dict with the form
+    dict_ = {
+        "song": name_song,
+        "artists": [i for i in list_of_artist_names]
+    }
+
+    generate a search_query compatible with youtube search query
+    """
+    name_song = song_data["song"]
+    name_artist = song_data["artists"]
+
+    search_query = name_song + " " + " ".join(name_artist)
+    search_query = search_query.replace(" ", "_")
+    search_query = search_query.replace(",", "_")
+    search_query = re.sub(r'\_+', '+', search_query)
+    
+    song_data.update({
+        "search_query": search_query,
+    }
+    )
+
+    if VERBOSE:
+        pprint(song_data)
+    return search_query
+
+
+# Requests a lean browser never makes: images (the thumbnails), fonts and
+# the ad and tracking endpoints of youtube
+LEAN_BLOCKED_URLS = [
+    "*.jpg", "*.jpeg", "*.png", "*.gif", "*.webp", "*.svg", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf",
+    "*i.ytimg.com/*", "*yt3.ggpht.com/*", "*.googlevideo.com/*",
+    "*doubleclick.net/*", "*googlesyndication.com/*",
+    "*googleadservices.com/*", "*google-analytics.com/*",
+    "*/pagead/*", "*/ptracking*", "*/api/stats/*", "*/youtubei/v1/log_event*",
+]
+
+
+def _new_chrome_driver(headless=True, lean=False):
+    """
+    Launch a fresh Chrome WebDriver session
+
+    :param headless: Run Chrome without UI
+    :type headless: class:'bool'
+    :param lean: Return from driver.get once the HTML is parsed (eager page
+        load strategy) instead of after every subresource loaded, and block
+        images, fonts and ads, see :data:'LEAN_BLOCKED_URLS'
+    :type lean: class:'bool'
+    :rtype: class:'selenium.webdriver.Chrome'
+    """
+    from selenium import webdriver
+    from selenium.common.exceptions import WebDriverException
+    from selenium.webdriver.chrome.options import Options
+
+    chrome_options = Options()
+    if headless:
+        chrome_options.add_argument("--headless")  # Run chrome without UI
+    if lean:
+        chrome_options.page_load_strategy = "eager"
+        chrome_options.add_argument("--blink-settings=imagesEnabled=false")
+        chrome_options.add_experimental_option("prefs", {
+            "profile.managed_default_content_settings.images": 2,
+            "profile.managed_default_content_settings.fonts": 2,
+        })
+    with METRICS.span("driver_start"):
+        driver = webdriver.Chrome(options=chrome_options)
+    if lean:
+        try:
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd(
+                "Network.setBlockedURLs", {"urls": LEAN_BLOCKED_URLS}
+                )
+        except WebDriverException as e:
+            print("# Could not block requests in the browser: {}".format(e))
+    return driver
+
+
+def _driver_memory_mb(driver):
+    """
+    Resident memory of the browser behind a WebDriver, i.e. chromedriver
+    and every process spawned beneath it, in MB.
+
+    Only implemented for Linux through /proc, returns None elsewhere or
+    when the process tree cannot be inspected.
+    """
+    try:
+        root = driver.service.process.pid
+    except AttributeError:
+        return None
+    if not os.path.isdir("/proc"):
+        return None
+
+    children = dict()
+    rss_pages = dict()
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open("/proc/{}/stat".format(entry), "r") as f:
+                # The process name may contain spaces, fields are split
+                # after the closing parenthesis
+                fields = f.read().rsplit(")", 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        pid = int(entry)
+        ppid = int(fields[1])
+        children.setdefault(ppid, []).append(pid)
+        rss_pages[pid] = int(fields[21])
+
+    if root not in rss_pages:
+        return None
+    total, stack = 0, [root]
+    while stack:
+        pid = stack.pop()
+        total += rss_pages.get(pid, 0)
+        stack.extend(children.get(pid, []))
+    return total * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+class WebDriverPool:
+    """
+    A bounded pool of warm Chrome WebDriver sessions, so that a browser
+    is launched once and reused for many searches instead of being started
+    and quit for every single search query.
+
+    Drivers are launched lazily up to :attr:'size', health checked before
+    they are lent out and recycled (quit and replaced on next demand) after
+    serving :attr:'max_pages' pages or once the browser grows beyond
+    :attr:'max_memory_mb'.
+
+    Usage::
+
+        with WebDriverPool(size=2) as pool:
+            with pool.driver() as driver:
+                driver.get(url)
+
+    :param size: Maximum number of concurrent WebDriver sessions
+    :type size: class:'int'
+    :param headless: Run Chrome without UI
+    :type headless: class:'bool'
+    :param max_pages: Recycle a driver after loading this many pages,
+        None disables the limit
+    :type max_pages: class:'int'
+    :param max_memory_mb: Recycle a driver when its process tree uses more
+        than this many MB of resident memory, None disables the check
+    :type max_memory_mb: class:'int'
+    :param lean: Launch lean drivers, see :func:'_new_chrome_driver'
+    :type lean: class:'bool'
+    """
+
+    def __init__(self, size=1, headless=True, max_pages=100,
+                 max_memory_mb=None, lean=False):
+        if size < 1:
+            raise ValueError("WebDriverPool size must be at least 1")
+        self.size = size
+        self.headless = headless
+        self.lean = lean
+        self.max_pages = max_pages
+        self.max_memory_mb = max_memory_mb
+
+        self._idle = queue.LifoQueue()  # Reuse the most recently used driver
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._pages = dict()    # id(driver) -> number of pages served
+        self._drivers = set()   # Every live driver, idle or borrowed
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _launch(self):
+        driver = _new_chrome_driver(self.headless, self.lean)
+        with self._lock:
+            self._drivers.add(driver)
+            self._pages[id(driver)] = 0
+        return driver
+
+    def _discard(self, driver):
+        from selenium.common.exceptions import WebDriverException
+        METRICS.incr("driver_discarded")
+        with self._lock:
+            self._drivers.discard(driver)
+            self._pages.pop(id(driver), None)
+        try:
+            driver.quit()
+        except WebDriverException:
+            pass    # Already dead, nothing left to clean up
+
+    def _is_healthy(self, driver):
+        from selenium.common.exceptions import WebDriverException
+        try:
+            driver.execute_script("return 1")
+        except WebDriverException:
+            return False
+        return True
+
+    def _needs_recycle(self, driver):
+        if self.max_pages is not None \
+                and self._pages.get(id(driver), 0) >= self.max_pages:
+            return True
+        if self.max_memory_mb is not None:
+            memory = _driver_memory_mb(driver)
+            if memory is not None and memory > self.max_memory_mb:
+                return True
+        return False
+
+    def _checkout(self):
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                return self._launch()
+            if self._is_healthy(driver):
+                return driver
+            self._discard(driver)
+
+    @contextlib.contextmanager
+    def driver(self):
+        """
+        Borrow a WebDriver from the pool, blocking while all
+        :attr:'size' drivers are in use. A driver that raised a
+        :class:'WebDriverException' while borrowed is discarded instead of
+        being returned to the pool.
+        """
+        from selenium.common.exceptions import WebDriverException
+        if self._closed:
+            raise RuntimeError("WebDriverPool is closed")
+        self._slots.acquire()
+        try:
+            driver = self._checkout()
+            try:
+                yield driver
+            except WebDriverException:
+                self._discard(driver)
+                raise
+            except BaseException:
+                self._release(driver)
+                raise
+            else:
+                self._release(driver)
+        finally:
+            self._slots.release()
+
+    def _release(self, driver):
+        with self._lock:
+            self._pages[id(driver)] = self._pages.get(id(driver), 0) + 1
+        if self._closed or self._needs_recycle(driver):
+            self._discard(driver)
+        else:
+            self._idle.put(driver)
+
+    def close(self):
+        """
+        Quit every driver owned by the pool. Drivers that are borrowed at
+        the time of closing are quit when they are returned.
+        """
+        self._closed = True
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(driver)
+
+
+def _load_paced(driver, search_url, wait_for=None):
+    """
+    driver.get paced by :data:'RATE_LIMITER', retried with backoff while
+    youtube answers with its captcha page. wait_for(driver) is called
+    after a successful load, before the page source is read.
+    """
+    for attempt in range(RATE_LIMITER.max_retries + 1):
+        with RATE_LIMITER.slot(search_url), METRICS.span("page_load"):
+            driver.get(search_url)
+        throttled = RATE_LIMITER.is_captcha_url(driver.current_url)
+        RATE_LIMITER.report(search_url, throttled)
+        if not throttled:
+            if wait_for is not None:
+                with METRICS.span("render_wait"):
+                    wait_for(driver)
+            return driver.page_source
+        METRICS.incr("throttled")
+        if attempt < RATE_LIMITER.max_retries:
+            METRICS.incr("retries")
+            delay = RATE_LIMITER.backoff_delay(attempt)
+            print("# Captcha page for {}, retrying in {:0.1f}s".format(
+                search_url, delay
+                ), file=sys.stderr)
+            time.sleep(delay)
+    raise RateLimitError("{} still throttled after {} retries".format(
+        search_url, RATE_LIMITER.max_retries
+        ))
+
+
+def _fetch_rendered_page(search_url, headless=True, driver_pool=None,
+                         wait_for=None):
+    """
+    Load a URL in Chrome and return the rendered HTML source. A driver is
+    borrowed from :param:'driver_pool' when given, otherwise a one-off
+    browser is launched and quit, a lean one if there is a wait_for, see
+    :func:'_load_paced'.
+    """
+    if driver_pool is not None:
+        with driver_pool.driver() as driver:
+            return _load_paced(driver, search_url, wait_for)
+
+    driver = _new_chrome_driver(headless, lean=wait_for is not None)
+    try:
+        return _load_paced(driver, search_url, wait_for)
+    finally:
+        driver.quit()
+
+
+def _wait_for_video_renderers(count, timeout=10):
+    """
+    A wait_for of :func:'_load_paced' that returns as soon as the first
+    :param:'count' video renderers of a results page exist, or after
+    :param:'timeout' seconds when the page has fewer results
+    """
+    def wait_for(driver):
+        from selenium.common.exceptions import TimeoutException
+        from selenium.webdriver.support.ui import WebDriverWait
+        try:
+            WebDriverWait(driver, timeout, poll_frequency=0.1).until(
+                lambda d: d.execute_script(
+                    "return document.getElementsByTagName("
+                    "'ytd-video-renderer').length"
+                    ) >= count
+                )
+        except TimeoutException:
+            if VERBOSE:
+                print("# Fewer than {} videos rendered after {}s".format(
+                    count, timeout
+                    ))
+    return wait_for
+
+
+# :XXX: Deprecated due to scoring and insufficient scraping of tags
+def find_youtube_videos_v1(search_query, driver_pool=None):
+    """
+    With the current state of Youtube, the webpage is thought to be using
+    a scripting language to dynamically create the webpage, which makes it
+    difficult to use standard HTTP requests (with requests module) to :method:
+    'get' the response object with a html '<script>' tag which does not contain 
+    necessary information in a structured manner. Selenium and ChromeWebdriver 
+    is used as a result of this limitation of :module:'requests' 
+
+    :param search_query: A string literal that contains the parsed searching 
+        string that is joined with youtube search query URL
+    :type search_query: class:'str'
+    :param driver_pool: Pool to borrow a warm WebDriver from, a one-off
+        browser is launched when None
+    :type driver_pool: class:'WebDriverPool'
+    :return: The list of strings, each of which is a title of the videos as a 
+    result of the search on Youtube
+    :rtype: list
+    """
+    """
+    #chrome_options.add_argument("--disable-extensions")
+    #chrome_options.add_argument("--disable-gpu")
+    #chrome_options.add_argument("--no-sandbox") # linux only
+ 
+    """
+
+    search_url = "{}/results?search_query={}".format(
+        YOUTUBE_BASE_URL, search_query
+    )
+    print(search_url)
+    page_source = _fetch_rendered_page(search_url, True, driver_pool)
+
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(page_source, 'html.parser')
+
+    # print(soup.prettify())
+    # with open("mycontents2.html", "wb") as f:
+    #     f.write(soup.prettify().encode("utf-8"))
+    # pass
+
+    # with open("mycontents.html", "wb") as f:
+    #     f.write(soup.prettify().encode("utf-8"))
+    # pass
+
+    # candidates = soup.find(search_tag, {"class": search_term})
+    # OR
+    candidates = soup.find_all(
+        "a",
+        {
+            "id": "video-title",
+            # "class": "style-scope ytd-video-renderer"
+        }
+        )
+
+
+    # print(len(candidates))
+    # print(type(candidates[0]))
+
+    # print(str(candidates[0]))
+    """
+    each candidate
+
+    <a aria-label="Benjamin Cambridge - Comptine d'un autre été, l'après midi | Classical Piano Version by Piano Fruits Music 4 months ago 1 minute, 50 seconds 7,349 views" class="yt-simple-endpoint style-scope ytd-video-renderer" href="/watch?v=qE-sCalGpcE" id="video-title" title="Benjamin Cambridge - Comptine d'un autre été, l'après midi | Classical Piano Version">
+    <yt-icon class="style-scope ytd-video-renderer" hidden="" id="inline-title-icon"><!--css-build:shady--></yt-icon>
+    <yt-formatted-string aria-label="Benjamin Cambridge - Comptine d'un autre été, l'après midi | Classical Piano Version by Piano Fruits Music 4 months ago 1 minute, 50 seconds 7,349 views" class="style-scope ytd-video-renderer">Benjamin Cambridge 
+    - Comptine d'un autre été, l'après midi | Classical Piano Version</yt-formatted-string>
+    </a>
+    """
+    print("\t_Videos-Status_")
+    video_list = list()
+    for i, candidate in enumerate(candidates):
+        pattern_title = re.findall(r"(title=)\"(.*?)\"", str(candidate))
+        pattern_href = re.findall(r"(href=)\"(.*?)\"", str(candidate))
+        # print(temp)
+        if pattern_title != [] and pattern_href != []:  # If Regex finds at least 1 match to have a non-empty list
+            title = pattern_title[0][1]
+            href = pattern_href[0][1]
+            video_list.append((title,href))
+            message = "# Successfully grabbed title of video({:02d})"
+        else:
+            message = "# Failed to determine title of entity({:02d})"
+        print(message.format(i), end="\n")
+    print("\n")
+    # del temp, message
+    return video_list
+
+# :XXX: Possibly deprecated due to buggy scraping of tags
+def find_youtube_videos_v2(search_query, headless=True, driver_pool=None):
+    """
+    With the current state of Youtube, the webpage is thought to be using
+    a scripting language to dynamically create the webpage, which makes it
+    difficult to use standard HTTP requests (with requests module) to :method:
+    'get' the response object with a html '<script>' tag which does not contain 
+    necessary information in a structured manner. Selenium and ChromeWebdriver 
+    is used as a result of this limitation of :module:'requests' 
+
+    :param search_query: A string literal that contains the parsed searching 
+        string that is joined with youtube search query URL
+    :type search_query: class:'str'
+    :param driver_pool: Pool to borrow a warm WebDriver from, a one-off
+        browser is launched when None
+    :type driver_pool: class:'WebDriverPool'
+    :return: The list of strings, each of which is a title of the videos as a 
+    result of the search on Youtube
+    :rtype: list
+    """
+    """
+    #chrome_options.add_argument("--disable-extensions")
+    #chrome_options.add_argument("--disable-gpu")
+    #chrome_options.add_argument("--no-sandbox") # linux only
+ 
+    """
+
+    search_url = "{}/results?search_query={}".format(
+        YOUTUBE_BASE_URL, search_query
+    )
+    print(search_url)
+    page_source = _fetch_rendered_page(search_url, headless, driver_pool)
+
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(page_source, 'html.parser')
+
+    candidates = []
+    candidates = soup.find_all(
+        "a",
+        {
+            "id": "video-title",
+            # "class": "style-scope ytd-video-renderer"
+        }
+    )
+
+    # print(len(candidates))
+
+    candidates_uploaders = soup.find_all(
+        "a",
+        {
+            "class": "yt-simple-endpoint style-scope yt-formatted-string",
+            "dir": "auto",
+            "spellcheck": "false"
+        }
+    )
+
+    # pprint(len(candidates_uploaders := candidates_uploaders[::2]))
+        # # pprint(candidate_uploaders)
+
+
+    #:TODO: 
+    # :BUG: Correct html parsing for more accurate video title and
+    # uploader detection
+
+    """
+    each candidate
+
+    <a aria-label="Benjamin Cambridge - Comptine d'un autre été, l'après midi | Classical Piano Version by Piano Fruits Music 4 months ago 1 minute, 50 seconds 7,349 views" class="yt-simple-endpoint style-scope ytd-video-renderer" href="/watch?v=qE-sCalGpcE" id="video-title" title="Benjamin Cambridge - Comptine d'un autre été, l'après midi | Classical Piano Version">
+    <yt-icon class="style-scope ytd-video-renderer" hidden="" id="inline-title-icon"><!--css-build:shady--></yt-icon>
+    <yt-formatted-string aria-label="Benjamin Cambridge - Comptine d'un autre été, l'après midi | Classical Piano Version by Piano Fruits Music 4 months ago 1 minute, 50 seconds 7,349 views" class="style-scope ytd-video-renderer">Benjamin Cambridge 
+    - Comptine d'un autre été, l'après midi | Classical Piano Version</yt-formatted-string>
+    </a>
+    """
+    print("\t_Videos-Status_")
+    video_list = list()
+    for i, candidate in enumerate(candidates):
+        pattern_title = re.findall(r"(title=)\"(.*?)\"", str(candidate))
+        pattern_href = re.findall(r"(href=)\"(.*?)\"", str(candidate))
+        pattern_channelname = re.findall(
+            r"\>(.*?)\</a\>", 
+            str(candidates_uploaders[i])
+            )\
+            
+        
+        # print(pattern_channelname)
+        # print(temp)
+        if pattern_title != [] and pattern_href != []:  # If Regex finds at least 1 match to have a non-empty list
+            title = pattern_title[0][1]
+            href = pattern_href[0][1]
+            channelname = pattern_channelname[0]
+            video_list.append((title, href, channelname))
+            message = "# Successfully grabbed title of video({:02d})"
+        else:
+            message = "# Failed to determine title of entity({:02d})"
+        print(message.format(i), end="\n")
+    print("\n")
+    # del temp, message
+    return video_list
+
+
+def find_youtube_videos_v3(search_query, headless=True, driver_pool=None,
+                           top_n=None):
+    """
+    With the current state of Youtube, the webpage is thought to be using
+    a scripting language to dynamically create the webpage, which makes it
+    difficult to use standard HTTP requests (with requests module) to :method:
+    'get' the response object with a html '<script>' tag which does not contain 
+    necessary information in a structured manner. Selenium and ChromeWebdriver 
+    is used as a result of this limitation of :module:'requests' 
+
+    :param search_query: A string literal that contains the parsed searching 
+        string that is joined with youtube search query URL
+    :type search_query: class:'str'
+    :param driver_pool: Pool to borrow a warm WebDriver from, a one-off
+        browser is launched when None
+    :type driver_pool: class:'WebDriverPool'
+    :param top_n: Early exit: read the page as soon as its first top_n
+        videos are rendered, and only those, instead of after the whole
+        page loaded
+    :type top_n: class:'int'
+    :return: The list of strings, each of which is a title of the videos as a 
+    result of the search on Youtube
+    :rtype: list
+    """
+    search_url = "{}/results?search_query={}".format(
+        YOUTUBE_BASE_URL, search_query
+    )
+    if VERBOSE:
+        print(search_url)
+    wait_for = None if top_n is None else _wait_for_video_renderers(top_n)
+    page_source = _fetch_rendered_page(
+        search_url, headless, driver_pool, wait_for
+        )
+    with METRICS.span("parse"):
+        return video_list_from_rendered_page(page_source, top_n)
+
+
+# lxml builds the tree several times faster than the pure python parser,
+# it is used when installed
+RESULTS_HTML_PARSER = "lxml" if importlib.util.find_spec("lxml") \
+    else "html.parser"
+_VIDEO_RENDERER_TAG = "<ytd-video-renderer"
+# Attributes of the tags in a ytd-video-renderer that hold the video title
+# and href, and the uploader's channel name
+_TAG_TITLE = {"id": "video-title"}
+_TAG_UPLOADER = {
+    "class": "yt-simple-endpoint style-scope yt-formatted-string",
+    "dir": "auto",
+    "spellcheck": "false"
+}
+
+
+# A video of the search results. duration is in seconds and views the view
+# count, both None when the page does not show them (e.g. live streams)
+VideoCandidate = collections.namedtuple(
+    "VideoCandidate",
+    ["title", "href", "channelname", "duration", "views"],
+    defaults = (None, None),
+    )
+
+
+def parse_duration_text(text):
+    """
+    Seconds of a youtube duration, e.g. "3:45" -> 225, "1:02:03" -> 3723
+
+    :return: The seconds, None if the text is not a duration
+    :rtype: class:'int'
+    """
+    if not text:
+        return None
+    parts = text.strip().split(":")
+    if not all(part.isdigit() for part in parts) or len(parts) > 3:
+        return None
+    seconds = 0
+    for part in parts:
+        seconds = 60 * seconds + int(part)
+    return seconds
+
+
+_VIEW_COUNT_RX = re.compile(r"([\d.,]+)\s*([KMB]?)", re.I)
+_VIEW_COUNT_UNITS = {"": 1, "k": 10**3, "m": 10**6, "b": 10**9}
+
+
+def parse_view_count(text):
+    """
+    View count of a youtube views text, e.g. "1,234 views" -> 1234,
+    "1.2M views" -> 1200000, "No views" -> 0
+
+    :return: The count, None if the text has no count
+    :rtype: class:'int'
+    """
+    if not text:
+        return None
+    if text.strip().lower().startswith("no "):
+        return 0
+    match = _VIEW_COUNT_RX.search(text)
+    if match is None:
+        return None
+    number, unit = match.groups()
+    try:
+        if unit:
+            return int(float(number.replace(",", "."))
+                       * _VIEW_COUNT_UNITS[unit.lower()])
+        return int(number.replace(",", "").replace(".", ""))
+    except ValueError:
+        return None
+
+
+def _video_renderers_markup(page_source, top_n=None):
+    """
+    Cut the part of a rendered results page that holds the video
+    renderers, from the first one up to the start of the (top_n+1)th, so
+    the styles and templates in front of the results and the results that
+    are not needed are never parsed.
+
+    :return: The slice of the page, empty if it has no video renderers
+    :rtype: class:'str'
+    """
+    start = page_source.find(_VIDEO_RENDERER_TAG)
+    if start == -1:
+        return ""
+    end = len(page_source)
+    if top_n is not None:
+        at = start
+        for _ in range(top_n):
+            at = page_source.find(_VIDEO_RENDERER_TAG, at + 1)
+            if at == -1:
+                break
+        else:
+            end = at
+    return page_source[start:end]
+
+
+def video_list_from_rendered_page(page_source, top_n=None):
+    """
+    Extract the :class:'VideoCandidate' tuples of the videos in a results
+    page rendered by Chrome, see :func:'find_youtube_videos_v3'
+
+    Only the ytd-video-renderer subtrees are parsed (playlists, channels
+    and shelves use other renderers and are skipped) and the title, href,
+    channel name, duration and views are read from the tags' attributes
+    and text directly.
+
+    :param page_source: HTML of the rendered page, e.g. driver.page_source
+        or a saved copy of it
+    :type page_source: class:'str'
+    :param top_n: Stop after the first top_n videos, None reads them all
+    :type top_n: class:'int'
+    :rtype: list
+    """
+    from bs4 import BeautifulSoup, SoupStrainer
+
+    markup = _video_renderers_markup(page_source, top_n)
+    soup = BeautifulSoup(
+        markup,
+        RESULTS_HTML_PARSER,
+        parse_only=SoupStrainer("ytd-video-renderer"),
+        )
+
+    if VERBOSE:
+        print("\t_Videos-Status_")
+    video_list = list()
+    for i, renderer in enumerate(soup.find_all("ytd-video-renderer",
+                                               recursive=False)):
+        candidate_title = renderer.find("a", _TAG_TITLE)
+        candidate_uploader = renderer.find("a", _TAG_UPLOADER)
+        time_status = renderer.find(
+            "ytd-thumbnail-overlay-time-status-renderer"
+            )
+        candidate_views = renderer.find("span", class_="inline-metadata-item")
+
+        title = href = channelname = duration = views = None
+        if candidate_title is not None:
+            title = candidate_title.get("title")
+            href = candidate_title.get("href")
+        if candidate_uploader is not None:
+            channelname = candidate_uploader.get_text()
+        if time_status is not None:
+            duration = parse_duration_text(time_status.get_text())
+        if candidate_views is not None:
+            views = parse_view_count(candidate_views.get_text())
+
+        if title and href and channelname:
+            video_list.append(VideoCandidate(
+                title, href, channelname, duration, views
+                ))
+            message = "# Successfully grabbed title of video({:02d})"
+        else:
+            message = "# Failed to determine title of entity({:02d})"
+        if VERBOSE:
+            print(message.format(i), end="\n")
+        if top_n is not None and len(video_list) >= top_n:
+            break
+    if VERBOSE:
+        print("\n")
+    return video_list
+
+
+# Start of the JSON object youtube embeds in the raw results page, e.g.
+# <script nonce="...">var ytInitialData = {...};</script>
+_YT_INITIAL_DATA_RX = re.compile(
+    r"(?:var\s+ytInitialData|window\[[\"']ytInitialData[\"']\])\s*=\s*"
+)
+
+YOUTUBE_HTTP_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
+        "(KHTML, like Gecko) Chrome/120.0 Safari/537.36",
+    "Accept-Language": "en-US,en;q=0.9",
+}
+# Skips the EU cookie consent interstitial that has no search results
+YOUTUBE_HTTP_COOKIES = {"CONSENT": "YES+"}
+
+
+def parse_yt_initial_data(page_source):
+    """
+    Pull the embedded ``ytInitialData`` JSON blob out of a youtube page
+
+    :param page_source: HTML of a youtube page, either fetched over plain
+        HTTP or saved to disk
+    :type page_source: class:'str'
+    :return: The decoded blob, or None if the page does not contain one
+    :rtype: dict
+    """
+    match = _YT_INITIAL_DATA_RX.search(page_source)
+    if match is None:
+        return None
+    try:
+        data, _ = json.JSONDecoder().raw_decode(page_source, match.end())
+    except ValueError:
+        return None
+    return data
+
+
+def _iter_video_renderers(node):
+    """
+    Walk a ``ytInitialData`` tree depth-first and yield every
+    ``videoRenderer`` in page order. Playlists, channels and shelves use
+    other renderer names and are skipped, as in
+    :func:'find_youtube_videos_v3'
+    """
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == "videoRenderer" and isinstance(value, dict):
+                yield value
+            else:
+                yield from _iter_video_renderers(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from _iter_video_renderers(value)
+
+
+def _renderer_text(field):
+    """
+    Text of a youtube renderer field, that is either
+    {"simpleText": ...} or {"runs": [{"text": ...}, ...]}
+    """
+    if not isinstance(field, dict):
+        return None
+    if "simpleText" in field:
+        return field["simpleText"]
+    runs = field.get("runs")
+    if runs:
+        return "".join(run.get("text", "") for run in runs)
+    return None
+
+
+def video_list_from_initial_data(data, top_n=None):
+    """
+    Convert a decoded ``ytInitialData`` blob into the same
+    :class:'VideoCandidate' tuples :func:'find_youtube_videos_v3' returns
+
+    :param data: Decoded ``ytInitialData``, see
+        :func:'parse_yt_initial_data'
+    :type data: class:'dict'
+    :param top_n: Stop after the first top_n videos, None reads them all
+    :type top_n: class:'int'
+    :rtype: list
+    """
+    if VERBOSE:
+        print("\t_Videos-Status_")
+    video_list = list()
+    for i, renderer in enumerate(_iter_video_renderers(data)):
+        title = _renderer_text(renderer.get("title"))
+        channelname = _renderer_text(
+            renderer.get("ownerText") or renderer.get("longBylineText")
+            )
+        href = renderer.get("navigationEndpoint", {}) \
+            .get("commandMetadata", {}) \
+            .get("webCommandMetadata", {}) \
+            .get("url")
+        if href is None and renderer.get("videoId"):
+            href = "/watch?v=" + renderer["videoId"]
+        duration = parse_duration_text(
+            _renderer_text(renderer.get("lengthText"))
+            )
+        views = parse_view_count(_renderer_text(
+            renderer.get("viewCountText")
+            or renderer.get("shortViewCountText")
+            ))
+
+        if title and href and channelname:
+            video_list.append(VideoCandidate(
+                title, href, channelname, duration, views
+                ))
+            message = "# Successfully grabbed title of video({:02d})"
+        else:
+            message = "# Failed to determine title of entity({:02d})"
+        if VERBOSE:
+            print(message.format(i), end="\n")
+        if top_n is not None and len(video_list) >= top_n:
+            break
+    if VERBOSE:
+        print("\n")
+    return video_list
+
+
+def find_youtube_videos_http(search_query, session=None, timeout=10,
+                             top_n=None):
+    """
+    Browser-free counterpart of :func:'find_youtube_videos_v3'. The raw
+    results page that youtube serves over plain HTTP already carries the
+    search results as the ``ytInitialData`` JSON blob, which the rendered
+    page is built from, so a single request is enough and no WebDriver is
+    needed.
+
+    :param search_query: A string literal that contains the parsed searching
+        string that is joined with youtube search query URL
+    :type search_query: class:'str'
+    :param session: Session to send the request with, defaults to
+        :func:'get_http_session'
+    :type session: class:'requests.Session'
+    :param top_n: Only return the first top_n videos
+    :type top_n: class:'int'
+    :return: A list of :class:'VideoCandidate' tuples, empty if the page
+        has no ``ytInitialData``
+    :rtype: list
+    """
+    search_url = "{}/results?search_query={}".format(
+        YOUTUBE_BASE_URL, search_query
+    )
+    if VERBOSE:
+        print(search_url)
+    with METRICS.span("page_load"):
+        page = RATE_LIMITER.request(
+            "GET",
+            search_url,
+            session,
+            headers = YOUTUBE_HTTP_HEADERS,
+            cookies = YOUTUBE_HTTP_COOKIES,
+            timeout = timeout,
+            )
+        page.raise_for_status()
+        page_source = page.text
+
+    with METRICS.span("parse"):
+        data = parse_yt_initial_data(page_source)
+        if data is None:
+            print("# No ytInitialData in the results page")
+            return list()
+        return video_list_from_initial_data(data, top_n)
+
+
+def _search_http(search_query, headless=True, driver_pool=None, top_n=None):
+    return find_youtube_videos_http(search_query, top_n=top_n)
+
+
+# Search backends share the signature of find_youtube_videos_v3, more can be
+# registered by adding to this dictionary
+SEARCH_BACKENDS = {
+    "http": _search_http,
+    "selenium": find_youtube_videos_v3,
+}
+
+
+def find_youtube_videos(search_query, backend="auto", headless=True,
+                        driver_pool=None, top_n=None):
+    """
+    Search youtube with one of :data:'SEARCH_BACKENDS'. The "auto" backend
+    tries the browser-free "http" backend first and falls back to
+    "selenium" when the request fails or no video could be extracted.
+
+    :param search_query: A string literal that contains the parsed searching
+        string that is joined with youtube search query URL
+    :type search_query: class:'str'
+    :param backend: "auto" or a key of :data:'SEARCH_BACKENDS'
+    :type backend: class:'str'
+    :param top_n: Early exit after the first top_n videos
+    :type top_n: class:'int'
+    :return: A list of :class:'VideoCandidate' tuples
+    :rtype: list
+    """
+    if backend != "auto":
+        return SEARCH_BACKENDS[backend](
+            search_query, headless, driver_pool, top_n=top_n
+            )
+
+    import requests
+    try:
+        video_list = SEARCH_BACKENDS["http"](
+            search_query, headless, driver_pool, top_n=top_n
+            )
+    except (requests.RequestException, RateLimitError) as e:
+        print("# HTTP search failed ({}), falling back to selenium".format(e))
+        video_list = list()
+    if video_list:
+        return video_list
+    return SEARCH_BACKENDS["selenium"](
+        search_query, headless, driver_pool, top_n=top_n
+        )
+
+
+def difflib_similarity(query_text, video_text):
+    """
+    Similarity in [0, 1] of the two strings by :class:'difflib.SequenceMatcher'
+    """
+    return difflib.SequenceMatcher(None, query_text, video_text).ratio()
+
+
+def token_set_similarity(query_text, video_text):
+    """
+    Share of the query's words that appear among the video's words, in
+    [0, 1], insensitive to word order and to extra words in the video
+    """
+    query_words = set(query_text.split())
+    if not query_words:
+        return 0.0
+    return len(query_words & set(video_text.split())) / len(query_words)
+
+
+def _rapidfuzz_similarity(query_text, video_text):
+    from rapidfuzz import fuzz
+    return fuzz.token_set_ratio(query_text, video_text) / 100
+
+
+FUZZY_SCORERS = {
+    "difflib": difflib_similarity,
+    "token-set": token_set_similarity,
+}
+if importlib.util.find_spec("rapidfuzz"):
+    FUZZY_SCORERS["rapidfuzz"] = _rapidfuzz_similarity
+
+
+# A candidate video, tokenized once: text is the normalized title and
+# channel name, words its words and factor 1/len(words)
+_Candidate = collections.namedtuple(
+    "_Candidate", ["text", "words", "factor"]
+    )
+
+
+_NUMPY_AVAILABLE = None
+
+
+def _numpy_available():
+    """
+    Whether numpy can be imported, looked up once on first use rather than
+    on every batch :meth:'MatchScorer.best_many' scores
+    """
+    global _NUMPY_AVAILABLE
+    if _NUMPY_AVAILABLE is None:
+        _NUMPY_AVAILABLE = importlib.util.find_spec("numpy") is not None
+    return _NUMPY_AVAILABLE
+
+
+class MatchScorer:
+    """
+    Scores how well youtube videos match a search query.
+
+    The keyword score of a video is the larger of
+    - score1: how many keywords of the query are substrings of the video
+        title + channel name
+    - score2: how many words of the video title + channel name are
+        keywords
+    each divided by the number of words in the video title + channel name.
+    The normalizing regexes are compiled once, keywords are held in a set
+    and every candidate is tokenized once per query.
+
+    A fuzzy similarity scorer, e.g. one of :data:'FUZZY_SCORERS', can be
+    blended in with :param:'fuzzy_weight'.
+
+    :param fuzzy: Callable (query_text, video_text) -> similarity in [0, 1],
+        None scores by keywords only
+    :type fuzzy: class:'function'
+    :param fuzzy_weight: Weight of the fuzzy similarity in the final score,
+        the keyword score gets 1 - fuzzy_weight
+    :type fuzzy_weight: class:'float'
+    :param threshold: Score at which :func:'match_song_and_video' takes a
+        video without scoring the ones after it, None scores them all
+    :type threshold: class:'float'
+    :param duration_tolerance: Seconds the duration of a video may differ
+        from the song's before :meth:'prefilter' rejects it unscored, None
+        keeps every video
+    :type duration_tolerance: class:'float'
+    """
+
+    #"\'" is not removed, for correct french songs
+    _STRIP_RX = re.compile("[" + re.escape("-.\\/()") + "]")
+    _AMPERSAND_RX = re.compile("&(amp;)*")
+    _SPACES_RX = re.compile(r"(\s)\1+")
+
+    # Duration difference in seconds at which :meth:'confidence' is halved,
+    # a closer duration costs proportionally less
+    confidence_window = 30.0
+    # Share of the confidence kept when a duration is unknown
+    unknown_duration_factor = 0.75
+
+    def __init__(self, fuzzy=None, fuzzy_weight=0.5, threshold=None,
+                 duration_tolerance=None):
+        self.fuzzy = fuzzy
+        self.fuzzy_weight = fuzzy_weight
+        self.threshold = threshold
+        self.duration_tolerance = duration_tolerance
+
+    def cache_key(self, song_data):
+        """
+        Key of the matches this scorer makes for a song in
+        :class:'SearchCache': its settings and the song's duration, which
+        decide the match together with the search query
+        """
+        fuzzy = None
+        if self.fuzzy is not None:
+            fuzzy = getattr(self.fuzzy, "__name__", repr(self.fuzzy))
+        return json.dumps([
+            fuzzy,
+            self.fuzzy_weight if fuzzy is not None else None,
+            self.threshold,
+            self.duration_tolerance,
+            song_data.get("duration"),
+            ])
+
+    @classmethod
+    def normalize(cls, title, channelname):
+        """
+        Lower case title + channel name, with ampersands and the characters
+        in :attr:'_STRIP_RX' replaced by a space and runs of whitespace
+        reduced to one
+        """
+        video = title.lower() + " " + channelname.lower()
+        video = cls._AMPERSAND_RX.sub(" ", video)
+        video = cls._STRIP_RX.sub(" ", video)
+        return cls._SPACES_RX.sub(r"\1", video)
+
+    @classmethod
+    def candidate(cls, title, href, channelname):
+        text = cls.normalize(title, channelname)
+        words = text.split(" ")
+        return _Candidate(text, words, 1 / len(words))
+
+    @staticmethod
+    def keywords(search_query):
+        return search_query.lower().split("+")
+
+    @staticmethod
+    def duration_delta(song_data, video):
+        """
+        Seconds between the durations of the song and of a
+        :class:'VideoCandidate', None when either is unknown
+        """
+        song_duration = song_data.get("duration")
+        video_duration = video[3] if len(video) > 3 else None
+        if song_duration is None or video_duration is None:
+            return None
+        return abs(video_duration - song_duration)
+
+    def admits(self, song_data, video):
+        """
+        Whether a video is within :attr:'duration_tolerance' of the song,
+        videos and songs of unknown duration are
+        """
+        return self.duration_tolerance is None \
+            or (self.duration_delta(song_data, video) or 0) \
+            <= self.duration_tolerance
+
+    def prefilter(self, song_data, video_list):
+        """
+        The videos of video_list within :attr:'duration_tolerance' of the
+        song, in order, see :meth:'admits'
+
+        :rtype: list
+        """
+        return [
+            video for video in video_list if self.admits(song_data, video)
+            ]
+
+    def rank_key(self, song_data, video, score):
+        """
+        Sort key of a scored video, the best video has the largest: the
+        higher score, then the duration closest to the song's (unknown
+        last), then the most views
+        """
+        delta = self.duration_delta(song_data, video)
+        views = video[4] if len(video) > 4 else None
+        return (
+            score,
+            -delta if delta is not None else -float("inf"),
+            views if views is not None else -1,
+            )
+
+    def coverage(self, song_data, video):
+        """
+        Share of the words of the song name and of its first artist (of
+        the search query when the song is not known) that are found in a
+        video's title + channel name, in [0, 1]. Unlike the score it does
+        not depend on the length of the title, and the other artists are
+        left out as uploads often only name the main one.
+        """
+        if "song" in song_data:
+            artists = song_data.get("artists") or [""]
+            words = self.normalize(song_data["song"], artists[0]).split()
+        else:
+            words = self.keywords(song_data["search_query"])
+        if not words:
+            return 0.0
+        text = self.candidate(*video[:3]).text
+        return sum(word in text for word in words) / len(words)
+
+    def confidence(self, coverage, delta):
+        """
+        Confidence in [0, 1] that a video is the song, comparable across
+        songs: its :meth:'coverage' scaled down by the duration difference
+        (see :meth:'duration_delta'), by up to a half at
+        :attr:'confidence_window' seconds
+        """
+        confidence = min(1.0, max(0.0, coverage))
+        if delta is None:
+            return confidence * self.unknown_duration_factor
+        penalty = 0.5 * min(1.0, delta / self.confidence_window)
+        return confidence * (1 - penalty)
+
+    def score_parts(self, search_query, video_list):
+        """
+        :return: A (score1, score2, fuzzy, candidate) tuple per video,
+            fuzzy is None without a fuzzy scorer
+        :rtype: list
+        """
+        return list(self.iter_score_parts(search_query, video_list))
+
+    def iter_score_parts(self, search_query, video_list):
+        """
+        Lazy :meth:'score_parts', a video is only scored once the tuple of
+        the one before it was consumed
+        """
+        keywords = self.keywords(search_query)
+        keyword_set = frozenset(keywords)
+        query_text = " ".join(keywords)
+        for video in video_list:
+            candidate = self.candidate(*video[:3])
+            score1 = sum(keyword in candidate.text for keyword in keywords)
+            score2 = sum(word in keyword_set for word in candidate.words)
+            fuzzy = None
+            if self.fuzzy is not None:
+                fuzzy = self.fuzzy(query_text, candidate.text)
+            yield (
+                score1 * candidate.factor,
+                score2 * candidate.factor,
+                fuzzy,
+                candidate,
+                )
+
+    def combine(self, score1, score2, fuzzy=None):
+        score = max(score1, score2)
+        if fuzzy is None:
+            return score
+        return (1 - self.fuzzy_weight) * score + self.fuzzy_weight * fuzzy
+
+    def scores(self, search_query, video_list):
+        """
+        :return: The score of every video in video_list
+        :rtype: list
+        """
+        return [
+            self.combine(score1, score2, fuzzy)
+            for score1, score2, fuzzy, _ in self.score_parts(
+                search_query, video_list
+                )
+            ]
+
+    def best_many(self, search_queries, video_lists, song_datas=None):
+        """
+        Batch counterpart of :func:'best_video_match', for many songs at
+        once: the index of the best video of every (search_query,
+        video_list) pair, None when the list is empty or no video of it
+        passed :meth:'prefilter'. Videos are ranked by :meth:'rank_key'.
+        The keyword counts are gathered for all songs first and
+        normalized, combined and reduced in one numpy pass when numpy is
+        installed. :attr:'threshold' does not apply here, every video is
+        scored.
+
+        :param song_datas: Song details of every pair, for the duration
+            prefilter and tie-break; without them durations count as
+            unknown
+        :type song_datas: list
+        :rtype: list
+        """
+        counts1, counts2, factors, fuzzies = [], [], [], []
+        owners, positions, deltas, views = [], [], [], []
+        dropped = 0
+        for owner, (search_query, video_list) in enumerate(
+                zip(search_queries, video_lists)):
+            song_data = song_datas[owner] if song_datas else dict()
+            keywords = self.keywords(search_query)
+            keyword_set = frozenset(keywords)
+            query_text = " ".join(keywords)
+            for position, video in enumerate(video_list):
+                if not self.admits(song_data, video):
+                    dropped += 1
+                    continue
+                candidate = self.candidate(*video[:3])
+                counts1.append(
+                    sum(keyword in candidate.text for keyword in keywords)
+                    )
+                counts2.append(
+                    sum(word in keyword_set for word in candidate.words)
+                    )
+                factors.append(candidate.factor)
+                if self.fuzzy is not None:
+                    fuzzies.append(self.fuzzy(query_text, candidate.text))
+                # The tie-breaks of rank_key, without the score
+                delta, view = self.rank_key(song_data, video, None)[1:]
+                owners.append(owner)
+                positions.append(position)
+                deltas.append(delta)
+                views.append(view)
+        if dropped:
+            METRICS.incr("match_prefiltered", dropped)
+
+        best = [None] * len(video_lists)
+        if not owners:
+            return best
+        if not _numpy_available():
+            best_keys = [None] * len(video_lists)
+            for i, owner in enumerate(owners):
+                key = (
+                    self.combine(
+                        counts1[i] * factors[i],
+                        counts2[i] * factors[i],
+                        fuzzies[i] if fuzzies else None,
+                        ),
+                    deltas[i],
+                    views[i],
+                    )
+                # Strictly larger, an equal key keeps the earlier video
+                if best_keys[owner] is None or key > best_keys[owner]:
+                    best_keys[owner], best[owner] = key, positions[i]
+            return best
+
+        import numpy as np
+        factors = np.asarray(factors)
+        scores = np.maximum(np.asarray(counts1) * factors,
+                            np.asarray(counts2) * factors)
+        if fuzzies:
+            scores = (1 - self.fuzzy_weight) * scores \
+                + self.fuzzy_weight * np.asarray(fuzzies)
+        owners = np.asarray(owners)
+        positions = np.asarray(positions)
+        # Sort by owner, then by descending rank_key, then by position, so
+        # the first row of every owner is its best (and earliest) video
+        order = np.lexsort((
+            positions, -np.asarray(views, dtype=float),
+            -np.asarray(deltas), -scores, owners,
+            ))
+        firsts = order[np.r_[True, owners[order][1:] != owners[order][:-1]]]
+        for owner, position in zip(owners[firsts], positions[firsts]):
+            best[int(owner)] = int(position)
+        return best
+
+
+MATCH_SCORER = MatchScorer()
+
+
+def match_song_and_video(song_data, video_list, single=True, scorer=None):
+    """
+    Determine and grab the video that has the highest relevance to the 
+    original song name. This relevance is quantified by a calculated score
+    based on how many keywords in the search query appear in the video title
+    in relevance to the number of words in the video title string, see
+    :class:'MatchScorer'.
+
+    :param scorer: Scorer of the videos, defaults to :data:'MATCH_SCORER'
+    :type scorer: class:'MatchScorer'
+    :return: Youtube URL of the best matching video, None when no video
+        matched; for its score and confidence see :func:'best_video_match'
+    :rtype: class:'str'
+    """
+       
+    matched_video_url, _, _ = best_video_match(
+        song_data, video_list, scorer
+        )
+    
+    # If a single link is provided by the user at CLI as input
+    if single and matched_video_url is not None:
+        show_video(matched_video_url)
+
+    return matched_video_url
+
+
+def best_video_match(song_data, video_list, scorer=None):
+    """
+    The scoring of :func:'match_song_and_video', without showing the video
+
+    Videos whose duration is off by more than the tolerance of the scorer
+    are dropped before scoring, see :meth:'MatchScorer.prefilter'. Equal
+    scores go to the video closest in duration, then to the most viewed.
+
+    :return: The (matched_video_url, score, confidence) tuple, see
+        :meth:'MatchScorer.confidence'. (None, None, 0.0) when video_list
+        is empty or no video passed the prefilter.
+    :rtype: tuple
+    """
+    scoring_start = time.perf_counter()
+    scorer = scorer or MATCH_SCORER
+    search_query = song_data["search_query"]
+
+    candidates = scorer.prefilter(song_data, video_list)
+    if len(candidates) < len(video_list):
+        METRICS.incr("match_prefiltered", len(video_list) - len(candidates))
+        if VERBOSE:
+            print("# Dropped {} of {} videos off the duration {}s by more "
+                  "than {}s".format(
+                      len(video_list) - len(candidates), len(video_list),
+                      song_data.get("duration"), scorer.duration_tolerance,
+                      ))
+    video_list = candidates
+
+    if VERBOSE:
+        print("\t_Scores_")
+    scores_list = list()
+    parts = scorer.iter_score_parts(search_query, video_list)
+    for enum, (score1, score2, fuzzy, candidate) in enumerate(parts):
+        scores_list.append(scorer.combine(score1, score2, fuzzy))
+        if not VERBOSE:
+            pass
+        elif fuzzy is None:
+            print("{:02d}({:0.3f} {:0.3f}) - {}".format(
+                    enum,
+                    score1, 
+                    score2, 
+                    candidate.text
+                    )
+                ) 
+        else:
+            print("{:02d}({:0.3f} {:0.3f} ~{:0.3f}) - {}".format(
+                    enum, score1, score2, fuzzy, candidate.text
+                    )
+                )
+        if scorer.threshold is not None \
+                and scores_list[-1] >= scorer.threshold:
+            METRICS.incr("match_early_exit")
+            if VERBOSE:
+                print("# Score reached {:0.3f}, skipping the remaining {} "
+                      "videos".format(
+                          scorer.threshold, len(video_list) - enum - 1
+                          ))
+            break
+
+    if not scores_list:
+        METRICS.observe("scoring", time.perf_counter() - scoring_start)
+        return None, None, 0.0
+    ind = max(
+        range(len(scores_list)),
+        key = lambda i: scorer.rank_key(
+            song_data, video_list[i], scores_list[i]
+            ),
+        )
+    maxval = scores_list[ind]
+    confidence = scorer.confidence(
+        scorer.coverage(song_data, video_list[ind]),
+        scorer.duration_delta(song_data, video_list[ind]),
+        )
+    matched_video_title = video_list[ind][0]
+    matched_video_url = YOUTUBE_BASE_URL \
+                        + video_list[ind][1] # Add href
+    matched_video_uploader = video_list[ind][2]
+
+    if VERBOSE:
+        print("\n\t_ANS:BEST-GUESS_")
+        print("Index = {:02d} | Overall Score = {:0.3f} | Confidence = "
+              "{:0.3f}".format(ind, scores_list[ind], confidence)
+            )
+        print(
+            matched_video_title, 
+            "| upload by {}".format(matched_video_uploader)
+            )
+        print(matched_video_url)
+        print("\n")
+    METRICS.observe("scoring", time.perf_counter() - scoring_start)
+    return matched_video_url, maxval, confidence
+
+
+def match_songs_and_videos(search_queries, video_lists, scorer=None,
+                           song_datas=None):
+    """
+    Quiet batch counterpart of :func:'match_song_and_video' for many songs,
+    see :meth:'MatchScorer.best_many'. Given the song details it matches
+    the same videos as :func:'best_video_match' does one song at a time.
+
+    :return: The matched video URL of every song, None where no video of
+        its list matched
+    :rtype: list
+    """
+    scorer = scorer or MATCH_SCORER
+    best = scorer.best_many(search_queries, video_lists, song_datas)
+    return [
+        None if ind is None
+        else YOUTUBE_BASE_URL + video_list[ind][1]
+        for ind, video_list in zip(best, video_lists)
+        ]
+
+
+def show_video(matched_video_url):
+    """
+    Open the matched video in a visible browser for the user to check
+    """
+    driver = _new_chrome_driver(headless=False)  # Run chrome with UI
+    driver.get(matched_video_url)
+    input("# Press AnyKey to Leave")
+    driver.quit()
+
+
+class DownloadStatus(enum.Enum):
+    """
+    Outcome of a download job
+    """
+    OK = "ok"
+    FAILED = "failed"                   # Downloader exited non-zero
+    TIMEOUT = "timeout"                 # Killed after the job timeout
+    NO_DOWNLOADER = "no-downloader"     # Neither yt-dlp nor youtube-dl found
+    TRANSCODE_FAILED = "transcode-failed"   # ffmpeg failed, see stderr
+    ARCHIVED = "archived"               # Reused the file of an earlier run
+
+
+@dataclasses.dataclass
+class DownloadResult:
+    """
+    Structured result of :func:'download_youtube_song'
+
+    :ivar returncode: Exit code of the last attempt, None if the process
+        never exited by itself
+    :ivar attempts: Number of times the downloader was started
+    :ivar elapsed: Wall time of all attempts in seconds
+    :ivar stderr: Tail of the downloader's error output of the last attempt
+    :ivar path: The downloaded audio file, None if it could not be found
+    :ivar transcode_elapsed: Wall time of :func:'transcode_audio' in
+        seconds
+    :ivar acodec: Codec of the downloaded audio as yt-dlp names it, e.g.
+        "opus" or "mp4a.40.2", None when not known
+    """
+    url: str
+    status: DownloadStatus
+    returncode: int = None
+    attempts: int = 0
+    elapsed: float = 0.0
+    command: list = None
+    stderr: str = ""
+    path: str = None
+    transcode_elapsed: float = 0.0
+    acodec: str = None
+
+    @property
+    def ok(self):
+        return self.status in (DownloadStatus.OK, DownloadStatus.ARCHIVED)
+
+    def __str__(self):
+        return "{} (code={}, attempts={}, {:0.1f}s) {}".format(
+            self.status.value, self.returncode, self.attempts,
+            self.elapsed, self.url,
+            )
+
+
+# Only for videos whose ID is not known, see :func:'download_basename'
+DOWNLOAD_OUTPUT_TEMPLATE = "%(title)s.%(uploader)s.%(ext)s"
+
+_YOUTUBE_VIDEO_ID_RX = re.compile(
+    r"(?:[?&]v=|youtu\.be/|/shorts/|/embed/)([0-9A-Za-z_-]{11})"
+    )
+# Path separators, control and (for Windows) reserved characters
+_UNSAFE_FILENAME_RX = re.compile(r'[\x00-\x1f<>:"/\\|?*]')
+
+
+def youtube_video_id(url):
+    """
+    Video ID of a youtube URL, e.g. "dQw4w9WgXcQ" for
+    https://www.youtube.com/watch?v=dQw4w9WgXcQ
+
+    :return: The video ID, or None if :param:'url' has none
+    :rtype: class:'str'
+    """
+    match = _YOUTUBE_VIDEO_ID_RX.search(url)
+    return match.group(1) if match else None
+
+
+def download_basename(matched_video_url, song_data, max_length=180):
+    """
+    Deterministic file name (without extension) of a download, e.g.
+    "Song - Artist1, Artist2 [dQw4w9WgXcQ]". The same track and video
+    always get the same name, whatever the video title is.
+
+    :return: The name, None if the URL has no video ID
+    :rtype: class:'str'
+    """
+    video_id = youtube_video_id(matched_video_url)
+    if video_id is None:
+        return None
+    name_audio = song_data["song"] + " - " + ", ".join(song_data["artists"])
+    name_audio = _UNSAFE_FILENAME_RX.sub("_", name_audio).strip(" .")
+    return "{} [{}]".format(name_audio[:max_length] or "_", video_id)
+
+
+def download_output_template(matched_video_url, song_data, download_dir="."):
+    """
+    Output template of the downloader, see :func:'download_basename'
+    """
+    basename = download_basename(matched_video_url, song_data)
+    if basename is None:
+        return os.path.join(download_dir, DOWNLOAD_OUTPUT_TEMPLATE)
+    template = os.path.join(download_dir, basename) + ".%(ext)s"
+    return template.replace("%", "%%").replace("%%(ext)s", "%(ext)s")
+
+
+def find_download(download_dir, basename):
+    """
+    The finished file named :param:'basename' (with any extension) in
+    :param:'download_dir', None if there is none
+    """
+    paths = [
+        path
+        for path in glob.glob(os.path.join(glob.escape(download_dir),
+                                           glob.escape(basename) + ".*"))
+        if not path.endswith((".part", ".ytdl", ".temp"))
+    ]
+    return max(paths, key=os.path.getmtime) if paths else None
+
+# --audio-format -> (format selector of the downloader, ffmpeg arguments of
+# the transcode). The selector prefers a stream that already has the
+# wanted codec, so that it only has to be remuxed.
+AUDIO_FORMATS = {
+    "mp3": (
+        "bestaudio/best",
+        ["-f", "mp3", "-codec:a", "libmp3lame", "-q:a", "5"],
+        ),
+    "m4a": (
+        "bestaudio[ext=m4a]/bestaudio/best",
+        ["-f", "ipod", "-codec:a", "aac", "-b:a", "160k"],
+        ),
+    "opus": (
+        "bestaudio[acodec=opus]/bestaudio/best",
+        ["-f", "opus", "-codec:a", "libopus", "-b:a", "128k"],
+        ),
+    "native": ("bestaudio/best", None),
+}
+# --audio-format -> the codec of its files, as in yt-dlp's acodec field. A
+# download already in that codec is only remuxed, see transcode_audio.
+AUDIO_CODECS = {
+    "mp3": "mp3",
+    "m4a": "mp4a",
+    "opus": "opus",
+}
+
+
+def audio_only_selector(audio_format):
+    """
+    The format selector of :param:'audio_format' (see
+    :data:'AUDIO_FORMATS') without its fallbacks to formats with video
+    """
+    selector, _ = AUDIO_FORMATS[audio_format]
+    return "/".join(
+        choice for choice in selector.split("/")
+        if choice.startswith("bestaudio")
+        )
+
+
+def find_downloader():
+    """
+    Path of the downloader executable, yt-dlp is preferred over youtube-dl
+    for its faster downloads. None if neither is installed.
+    """
+    return shutil.which("yt-dlp") or shutil.which("youtube-dl")
+
+
+# What yt-dlp prints of a deferred download, the codec before the path as
+# it has no spaces
+DEFERRED_PRINT_TEMPLATE = "after_move:%(acodec)s %(filepath)s"
+
+
+def build_download_command(matched_video_url, downloader,
+                           output_template=DOWNLOAD_OUTPUT_TEMPLATE,
+                           audio_format="mp3", defer_transcode=False):
+    """
+    Argument vector that downloads the audio of a video in
+    :param:'audio_format', see :data:'AUDIO_FORMATS'. It is run without a
+    shell, and the URL is placed after "--" so that it can never be read as
+    an option by the downloader.
+
+    :param defer_transcode: Keep the native audio stream (remux only) and
+        print the path of the file and its codec, the transcode is then
+        left to :func:'transcode_audio'. Needs yt-dlp.
+    :type defer_transcode: class:'bool'
+    :rtype: list
+    """
+    selector, _ = AUDIO_FORMATS[audio_format]
+    cmd = [
+        downloader,
+        "--format", selector,
+        "--extract-audio",
+    ]
+    # Without --audio-format the downloader keeps the native codec
+    if audio_format != "native" and not defer_transcode:
+        cmd += ["--audio-format", audio_format]
+    if defer_transcode:
+        cmd += ["--print", DEFERRED_PRINT_TEMPLATE]
+    return cmd + [
+        "--output", output_template,
+        "--",
+        matched_video_url,
+    ]
+
+
+def needs_transcode(path, audio_format):
+    """
+    Whether the downloaded audio file :param:'path' is not yet in
+    :param:'audio_format'
+    """
+    if path is None or audio_format == "native":
+        return False
+    return os.path.splitext(path)[1].lower() != "." + audio_format
+
+
+def transcode_audio(result, audio_format, timeout=None):
+    """
+    Transcode the file of a deferred download (see
+    :func:'build_download_command') to :param:'audio_format' with ffmpeg.
+    Audio that already has the codec of the format (see
+    :data:'AUDIO_CODECS'), e.g. opus in a webm stream, is only remuxed.
+    The transcode is written next to the download and replaces it once
+    complete, a failed transcode keeps the native file.
+
+    :param result: An OK result whose :attr:'path' is the native file
+    :type result: class:'DownloadResult'
+    :param timeout: Seconds after which ffmpeg is killed, None waits forever
+    :type timeout: class:'float'
+    :return: :param:'result', updated
+    :rtype: class:'DownloadResult'
+    """
+    start = time.monotonic()
+    _, arguments = AUDIO_FORMATS[audio_format]
+    remux = result.acodec is not None \
+        and result.acodec.split(".")[0] == AUDIO_CODECS[audio_format]
+    if remux:
+        # The muxer of the format, with the audio stream copied
+        arguments = arguments[:2] + ["-codec:a", "copy"]
+    source = result.path
+    target = os.path.splitext(source)[0] + "." + audio_format
+    partial = target + ".part"
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        result.status = DownloadStatus.TRANSCODE_FAILED
+        result.stderr = "ffmpeg could not be found in PATH"
+    else:
+        cmd = [
+            ffmpeg, "-nostdin", "-loglevel", "error", "-y",
+            "-i", source, "-vn", "-map_metadata", "0",
+        ] + arguments + [partial]
+        try:
+            process = subprocess.run(
+                cmd,
+                stdout = subprocess.DEVNULL,
+                stderr = subprocess.PIPE,
+                timeout = timeout,
+                )
+            returncode, stderr = process.returncode, process.stderr
+        except subprocess.TimeoutExpired as e:
+            returncode, stderr = None, e.stderr
+        if returncode == 0:
+            os.replace(partial, target)
+            os.remove(source)
+            result.path = target
+        else:
+            result.status = DownloadStatus.TRANSCODE_FAILED
+            result.stderr = _stderr_tail(stderr) or "ffmpeg timed out"
+            if os.path.exists(partial):
+                os.remove(partial)
+
+    result.transcode_elapsed = time.monotonic() - start
+    METRICS.observe("transcode", result.transcode_elapsed)
+    if remux:
+        METRICS.incr("transcode_remuxed")
+    if not result.ok:
+        METRICS.incr("transcode_failed")
+        print("# Transcode of {} failed: {}".format(source, result.stderr),
+              file=sys.stderr)
+    return result
+
+
+def download_youtube_song(matched_video_url, song_data, timeout=None,
+                          retries=2, backoff=2.0, audio_format="mp3",
+                          defer_transcode=False, download_dir="."):
+    """
+    Download the audio of :param:'matched_video_url' with yt-dlp (or
+    youtube-dl) and convert it to :param:'audio_format' with ffmpeg, into
+    a file of :param:'download_dir' named by :func:'download_basename'.
+
+    :param matched_video_url: URL of the youtube video to download
+    :type matched_video_url: class:'str'
+    :param song_data: Song details, see :func:'get_song_details'
+    :type song_data: class:'dict'
+    :param timeout: Seconds after which a single attempt is killed, None
+        waits forever
+    :type timeout: class:'float'
+    :param retries: Extra attempts after a failed or timed out one
+    :type retries: class:'int'
+    :param backoff: Seconds to wait before the first retry, doubled for
+        every further retry
+    :type backoff: class:'float'
+    :param audio_format: A key of :data:'AUDIO_FORMATS'
+    :type audio_format: class:'str'
+    :param defer_transcode: Only download (and remux) the native audio and
+        leave the transcode to :func:'transcode_audio'. Ignored for
+        youtube-dl.
+    :type defer_transcode: class:'bool'
+    :param download_dir: Directory of the download
+    :type download_dir: class:'str'
+    :rtype: class:'DownloadResult'
+
+    :TODO:
+    - Check if it works in virtual machines,
+    - Check if it works in WSL and other emulator-like environments
+    """
+
+    if VERBOSE:
+        print("\t_Download-Status_")
+    name_song = song_data["song"]
+    name_artist = ", ".join(song_data["artists"])
+    name_audio = name_song + " - " + name_artist
+
+    downloader = find_downloader()
+    if downloader is None:
+        print("# Neither yt-dlp nor youtube-dl could be found in PATH",
+              file=sys.stderr)
+        return DownloadResult(matched_video_url, DownloadStatus.NO_DOWNLOADER)
+
+    # youtube-dl cannot report the path of the file it wrote
+    defer_transcode = defer_transcode and audio_format != "native" \
+        and os.path.basename(downloader).startswith("yt-dlp")
+    cmd = build_download_command(
+        matched_video_url,
+        downloader,
+        download_output_template(matched_video_url, song_data, download_dir),
+        audio_format = audio_format,
+        defer_transcode = defer_transcode,
+        )
+    result = DownloadResult(matched_video_url, DownloadStatus.FAILED,
+                            command=cmd)
+    start = time.monotonic()
+    throttled = False
+    for attempt in range(retries + 1):
+        if throttled:
+            time.sleep(RATE_LIMITER.backoff_delay(attempt - 1))
+        elif attempt:
+            time.sleep(backoff * 2 ** (attempt - 1))
+        # Only the rate is limited, downloads run as long as they need
+        RATE_LIMITER.wait(matched_video_url)
+        result.attempts += 1
+        try:
+            process = subprocess.run(
+                cmd,
+                stdout = subprocess.PIPE if defer_transcode \
+                    else subprocess.DEVNULL,
+                stderr = subprocess.PIPE,
+                timeout = timeout,
+                )
+        except subprocess.TimeoutExpired as e:
+            result.status = DownloadStatus.TIMEOUT
+            result.returncode = None
+            result.stderr = _stderr_tail(e.stderr)
+            continue
+        result.returncode = process.returncode
+        result.stderr = _stderr_tail(process.stderr)
+        throttled = "HTTP Error 429" in result.stderr
+        RATE_LIMITER.report(matched_video_url, throttled)
+        if process.returncode == 0:
+            result.status = DownloadStatus.OK
+            if defer_transcode:
+                lines = process.stdout.decode("utf-8", "replace").split("\n")
+                line = ([line for line in lines if line] or [""])[-1]
+                acodec, _, path = line.partition(" ")
+                result.path = path or None
+                # yt-dlp prints NA for a field it does not know
+                result.acodec = acodec if acodec not in ("", "NA") else None
+            elif download_basename(matched_video_url, song_data) is not None:
+                result.path = find_download(
+                    download_dir,
+                    download_basename(matched_video_url, song_data),
+                    )
+            break
+        result.status = DownloadStatus.FAILED
+
+    result.elapsed = time.monotonic() - start
+    METRICS.observe("download", result.elapsed)
+    METRICS.incr("download_" + result.status.value.replace("-", "_"))
+    if result.attempts > 1:
+        METRICS.incr("retries", result.attempts - 1)
+    if not result.ok:
+        print("# {}: {}".format(name_audio, result), file=sys.stderr)
+    elif VERBOSE:
+        print("# {}: {}".format(name_audio, result))
+    return result
+
+
+def _stderr_tail(stderr, lines=5):
+    if not stderr:
+        return ""
+    return "\n".join(
+        stderr.decode("utf-8", "replace").splitlines()[-lines:]
+        )
+
+
+# Range requests of a segmented download stay within these bounds. Media
+# hosts throttle long single responses, which is also why yt-dlp splits
+# its downloads into 10 MB chunks (--http-chunk-size).
+SEGMENT_MIN_BYTES = 256 * 1024
+SEGMENT_MAX_BYTES = 10 * 1024 * 1024
+# Progress of a segment is saved for resuming every this many bytes
+SEGMENT_CHECKPOINT_BYTES = 1024 * 1024
+
+_CONTENT_RANGE_RX = re.compile(r"bytes (\d+)-(\d+)/(\d+)")
+
+
+class SegmentedDownloadError(IOError):
+    """
+    The audio stream could not be resolved or fetched in ranges, or the
+    fetched file does not verify
+    """
+
+
+def resolve_audio_stream(matched_video_url, audio_format="native",
+                         timeout=None):
+    """
+    Direct URL of the audio-only stream of a video that the format
+    selector of :param:'audio_format' picks, see
+    :func:'audio_only_selector', resolved by yt-dlp without downloading
+    anything. A video without an audio-only stream fails to resolve.
+
+    :raises SegmentedDownloadError: yt-dlp could not resolve the stream
+    :raises subprocess.TimeoutExpired: yt-dlp ran longer than
+        :param:'timeout'
+    :return: The (media_url, ext, acodec, filesize) tuple, acodec and
+        filesize are None when the stream does not tell
+    :rtype: tuple
+    """
+    cmd = [
+        shutil.which("yt-dlp") or "yt-dlp",
+        "--format", audio_only_selector(audio_format),
+        "--print", "ext",
+        "--print", "acodec",
+        "--print", "filesize",
+        "--print", "url",
+        "--",
+        matched_video_url,
+    ]
+    process = subprocess.run(
+        cmd,
+        stdout = subprocess.PIPE,
+        stderr = subprocess.PIPE,
+        timeout = timeout,
+        )
+    lines = process.stdout.decode("utf-8", "replace").split("\n")
+    lines = [line.strip() for line in lines if line.strip()]
+    if process.returncode != 0 or len(lines) < 4:
+        raise SegmentedDownloadError(
+            _stderr_tail(process.stderr)
+            or "yt-dlp could not resolve the audio of " + matched_video_url
+            )
+    ext, acodec, filesize, media_url = lines[-4:]
+    return (
+        media_url,
+        ext,
+        acodec if acodec not in ("none", "NA") else None,
+        int(filesize) if filesize.isdigit() else None,
+        )
+
+
+def plan_segments(size, segments=4):
+    """
+    Split :param:'size' bytes into [start, end) ranges, about one per
+    segment, each between :data:'SEGMENT_MIN_BYTES' and
+    :data:'SEGMENT_MAX_BYTES'
+
+    :rtype: list
+    """
+    piece = -(-size // max(1, segments))
+    piece = min(SEGMENT_MAX_BYTES, max(SEGMENT_MIN_BYTES, piece))
+    return [[start, min(size, start + piece)]
+            for start in range(0, size, piece)]
+
+
+def _content_range(response):
+    """
+    The (start, end, size) of a 206 response, end exclusive, None if it has
+    no valid Content-Range
+    """
+    match = _CONTENT_RANGE_RX.fullmatch(
+        response.headers.get("Content-Range", "").strip()
+        )
+    if match is None:
+        return None
+    first, last, size = (int(group) for group in match.groups())
+    return first, last + 1, size
+
+
+def _read_segment_state(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_segment_state(path, state):
+    partial = path + ".tmp"
+    with open(partial, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(partial, path)
+
+
+def _preallocate(fd, size):
+    try:
+        os.posix_fallocate(fd, 0, size)
+    except (AttributeError, OSError):
+        # Not supported by the platform or the file system
+        os.ftruncate(fd, size)
+
+
+def _segments_written(state):
+    """
+    Bytes written to the ranges of a segmented download from its start,
+    counting a range only when it is complete and the ranges only when
+    they tile the file
+    """
+    written = end = 0
+    for (start, stop), done in zip(state["ranges"], state["done"]):
+        if start != end:
+            return written
+        end = stop
+        if done == stop - start:
+            written += done
+    return written if end == state["size"] else 0
+
+
+def fetch_segmented(media_url, path, segments=4, timeout=None,
+                    expected_size=None, session=None):
+    """
+    Download :param:'media_url' into :param:'path' with parallel HTTP
+    Range requests over the keep-alive connections of the shared session.
+
+    The file is preallocated as "<path>.part" and every range is written
+    straight to its offset, so no piece is buffered or copied. The
+    progress of every range is saved to "<path>.part.segments.json" (after
+    the data is synced) and an interrupted download resumes every range
+    where it stopped, as long as the server still has the same file: its
+    size must match and, given an ETag or Last-Modified, the ranges are
+    asked with If-Range. Every response must cover exactly its range of a
+    file of that size, and before the file is renamed to :param:'path' the
+    bytes written to its ranges (counted from the writes, the preallocated
+    file has its final size from the start) must add up to all of that
+    size (and :param:'expected_size', if given). Servers without range
+    support are read in one go.
+
+    :param segments: Number of ranges fetched at once
+    :type segments: class:'int'
+    :param timeout: Seconds to wait for the server before a request fails
+    :type timeout: class:'float'
+    :param expected_size: Size announced by other means, e.g. yt-dlp
+    :type expected_size: class:'int'
+    :raises SegmentedDownloadError: The server does not serve the ranges
+        as asked, or the file does not verify
+    :return: The size of the file in bytes
+    :rtype: class:'int'
+    """
+    session = session or get_http_session()
+    partial = path + ".part"
+    sidecar = partial + ".segments.json"
+
+    # One byte tells the size, the validator and whether ranges are served
+    response = RATE_LIMITER.request(
+        "GET", media_url, session,
+        headers = {"Range": "bytes=0-0"},
+        timeout = timeout,
+        stream = True,
+        )
+    with response:
+        response.raise_for_status()
+        if response.status_code != 206:
+            return _fetch_whole(response, path, expected_size)
+        content_range = _content_range(response)
+    if content_range is None:
+        raise SegmentedDownloadError(
+            "{} answered a range without Content-Range".format(media_url)
+            )
+    size = content_range[2]
+    validator = response.headers.get("ETag") \
+        or response.headers.get("Last-Modified")
+    if expected_size is not None and size != expected_size:
+        raise SegmentedDownloadError(
+            "{} has {} bytes instead of {}".format(media_url, size,
+                                                   expected_size)
+            )
+
+    state = _read_segment_state(sidecar)
+    resumed = state is not None and os.path.exists(partial) \
+        and state.get("size") == size \
+        and state.get("validator") == validator \
+        and os.path.getsize(partial) == size
+    if not resumed:
+        state = {
+            "size": size,
+            "validator": validator,
+            "ranges": plan_segments(size, segments),
+        }
+        state["done"] = [0] * len(state["ranges"])
+    else:
+        METRICS.incr("segments_resumed", sum(
+            0 < done < end - start
+            for (start, end), done in zip(state["ranges"], state["done"])
+            ))
+
+    fd = os.open(partial, os.O_RDWR | os.O_CREAT, 0o644)
+    lock = threading.Lock()
+    saved = list(state["done"])
+
+    def save(index, done, force=False):
+        with lock:
+            state["done"][index] = done
+            if force or done - saved[index] >= SEGMENT_CHECKPOINT_BYTES:
+                # The data must be on disk before it is marked as done
+                os.fsync(fd)
+                _write_segment_state(sidecar, state)
+                saved[index] = done
+
+    def fetch(index):
+        start, end = state["ranges"][index]
+        offset = start + state["done"][index]
+        if offset >= end:
+            return
+        headers = {"Range": "bytes={}-{}".format(offset, end - 1)}
+        if validator:
+            headers["If-Range"] = validator
+        response = RATE_LIMITER.request(
+            "GET", media_url, session,
+            headers = headers,
+            timeout = timeout,
+            stream = True,
+            )
+        with response:
+            response.raise_for_status()
+            if response.status_code != 206 \
+                    or _content_range(response) != (offset, end, size):
+                raise SegmentedDownloadError(
+                    "{} did not serve bytes {}-{} of {} (HTTP {}, {}), "
+                    "the file may have changed".format(
+                        media_url, offset, end - 1, size,
+                        response.status_code,
+                        response.headers.get("Content-Range"),
+                        ))
+            try:
+                for chunk in response.iter_content(64 * 1024):
+                    if offset + len(chunk) > end:
+                        raise SegmentedDownloadError(
+                            "{} sent more than bytes {}-{}".format(
+                                media_url, start, end - 1
+                                ))
+                    chunk = memoryview(chunk)
+                    while chunk:
+                        # A write may be short, only what it wrote counts
+                        written = os.pwrite(fd, chunk, offset)
+                        chunk = chunk[written:]
+                        offset += written
+                        save(index, offset - start)
+            finally:
+                save(index, offset - start, force=True)
+        if offset != end:
+            raise SegmentedDownloadError(
+                "{} ended bytes {}-{} at {}".format(
+                    media_url, start, end - 1, offset
+                    ))
+
+    try:
+        if not resumed:
+            os.ftruncate(fd, 0)
+            _preallocate(fd, size)
+            _write_segment_state(sidecar, state)
+        pending = [
+            index for index, ((start, end), done) in enumerate(
+                zip(state["ranges"], state["done"])
+                )
+            if start + done < end
+        ]
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers = max(1, min(segments, len(pending))),
+                thread_name_prefix = "segment") as executor:
+            futures = [executor.submit(fetch, index) for index in pending]
+            errors = [future.exception() for future in futures]
+        for error in errors:
+            if error is not None:
+                raise error
+        os.fsync(fd)
+        written = _segments_written(state)
+        if written != size:
+            raise SegmentedDownloadError(
+                "{} got {} of its {} bytes".format(partial, written, size)
+                )
+    finally:
+        os.close(fd)
+    os.replace(partial, path)
+    os.remove(sidecar)
+    METRICS.incr("download_bytes", size)
+    return size
+
+
+def _fetch_whole(response, path, expected_size=None):
+    """
+    The fallback of :func:'fetch_segmented' for a server that answers a
+    range request with the whole file
+    """
+    partial = path + ".part"
+    if os.path.exists(partial + ".segments.json"):
+        os.remove(partial + ".segments.json")
+    size = 0
+    with open(partial, "wb") as f:
+        for chunk in response.iter_content(64 * 1024):
+            f.write(chunk)
+            size += len(chunk)
+    length = response.headers.get("Content-Length")
+    for expected in (int(length) if length else None, expected_size):
+        if expected is not None and size != expected:
+            os.remove(partial)
+            raise SegmentedDownloadError(
+                "{} has {} bytes instead of {}".format(path, size, expected)
+                )
+    os.replace(partial, path)
+    METRICS.incr("download_bytes", size)
+    return size
+
+
+def download_youtube_song_segmented(matched_video_url, song_data,
+                                    timeout=None, retries=2, backoff=2.0,
+                                    audio_format="mp3", defer_transcode=False,
+                                    download_dir=".", segments=4):
+    """
+    Counterpart of :func:'download_youtube_song' that only asks yt-dlp for
+    the URL of the audio-only stream (see :func:'resolve_audio_stream') and
+    fetches the stream itself, in :param:'segments' parallel ranges, see
+    :func:'fetch_segmented'. A single connection of youtube is throttled
+    far below the link, several are not. A retry resumes the ranges of the
+    failed attempt, and so does a later run.
+
+    The native stream is kept, and transcoded (or, in the codec of
+    :param:'audio_format' already, remuxed) with :func:'transcode_audio'
+    unless :param:'defer_transcode'.
+
+    :param timeout: Seconds to wait for yt-dlp or the media server before
+        an attempt fails
+    :type timeout: class:'float'
+    :param segments: Number of ranges fetched at once
+    :type segments: class:'int'
+    :rtype: class:'DownloadResult'
+    """
+    import requests
+
+    if VERBOSE:
+        print("\t_Download-Status_")
+    name_audio = song_data["song"] + " - " + ", ".join(song_data["artists"])
+    if shutil.which("yt-dlp") is None:
+        print("# yt-dlp could not be found in PATH", file=sys.stderr)
+        return DownloadResult(matched_video_url, DownloadStatus.NO_DOWNLOADER)
+
+    basename = download_basename(matched_video_url, song_data) \
+        or _UNSAFE_FILENAME_RX.sub("_", name_audio).strip(" .")
+    result = DownloadResult(matched_video_url, DownloadStatus.FAILED)
+    start = time.monotonic()
+    throttled = False
+    for attempt in range(retries + 1):
+        if throttled:
+            time.sleep(RATE_LIMITER.backoff_delay(attempt - 1))
+        elif attempt:
+            time.sleep(backoff * 2 ** (attempt - 1))
+        RATE_LIMITER.wait(matched_video_url)
+        result.attempts += 1
+        try:
+            media_url, ext, result.acodec, filesize = resolve_audio_stream(
+                matched_video_url, audio_format, timeout
+                )
+            path = os.path.join(download_dir, basename + "." + ext)
+            fetch_segmented(media_url, path, segments, timeout, filesize)
+        except subprocess.TimeoutExpired as e:
+            result.status = DownloadStatus.TIMEOUT
+            result.returncode = None
+            result.stderr = _stderr_tail(e.stderr)
+            continue
+        except (SegmentedDownloadError, RateLimitError,
+                requests.RequestException, OSError) as e:
+            result.status = DownloadStatus.FAILED
+            result.returncode = None
+            result.stderr = str(e)
+            throttled = isinstance(e, RateLimitError) \
+                or "HTTP Error 429" in result.stderr
+            RATE_LIMITER.report(matched_video_url, throttled)
+            continue
+        RATE_LIMITER.report(matched_video_url, False)
+        result.status = DownloadStatus.OK
+        result.returncode = 0
+        result.path = path
+        break
+
+    result.elapsed = time.monotonic() - start
+    METRICS.observe("download", result.elapsed)
+    METRICS.incr("download_" + result.status.value.replace("-", "_"))
+    if result.attempts > 1:
+        METRICS.incr("retries", result.attempts - 1)
+    if result.ok and not defer_transcode \
+            and needs_transcode(result.path, audio_format):
+        transcode_audio(result, audio_format, timeout)
+    if not result.ok:
+        print("# {}: {}".format(name_audio, result), file=sys.stderr)
+    elif VERBOSE:
+        print("# {}: {}".format(name_audio, result))
+    return result
+
+
+# Downloaders share the signature of download_youtube_song, more can be
+# registered by adding to this dictionary, see --downloader
+DOWNLOADERS = {
+    "ytdlp": download_youtube_song,
+    "segmented": download_youtube_song_segmented,
+}
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    """
+    Hex SHA-256 digest of the content of :param:'path'
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def link_download(source, target):
+    """
+    Make :param:'target' the same file as :param:'source', a hard link
+    where the file system allows it and a relative symlink otherwise. A
+    file already at :param:'target' is replaced.
+
+    :return: :param:'target'
+    :rtype: class:'str'
+    """
+    if os.path.abspath(source) == os.path.abspath(target):
+        return target
+    if os.path.lexists(target):
+        if os.path.exists(target) and os.path.samefile(source, target):
+            return target
+        os.remove(target)
+    try:
+        os.link(source, target)
+    except OSError:     # Another file system, or no hard links at all
+        os.symlink(
+            os.path.relpath(source, os.path.dirname(os.path.abspath(target))),
+            target,
+            )
+    return target
+
+
+DOWNLOAD_ARCHIVE_NAME = ".spotify2youtube-archive.sqlite3"
+
+
+class DownloadArchive:
+    """
+    Persistent record of the downloaded audio files, so that the videos of
+    earlier runs (or of other playlists with the same songs) are never
+    downloaded again. Files are keyed by youtube video ID and audio format,
+    and every Spotify track that asked for one is recorded with the name
+    (link) it got, see :meth:'DownloadScheduler.for_track'.
+
+    A file is only reused while it is unchanged: its size has to match, and
+    its SHA-256 checksum too once its modification time changed. An
+    instance can be shared between threads.
+
+    :param path: Database file, created with its directory when missing
+    :type path: class:'str'
+    """
+
+    def __init__(self, path):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)),
+                        exist_ok=True)
+        self.path = path
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(path, timeout=30,
+                                   check_same_thread=False)
+        with self._lock, self._db:
+            if path != ":memory:":
+                # Readers do not block the writer, e.g. sharded workers
+                self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS videos ("
+                "video_id TEXT NOT NULL, "
+                "audio_format TEXT NOT NULL, "
+                "path TEXT NOT NULL, "
+                "size INTEGER NOT NULL, "
+                "mtime REAL NOT NULL, "
+                "sha256 TEXT NOT NULL, "
+                "created_at REAL NOT NULL, "
+                "used_at REAL NOT NULL, "
+                "PRIMARY KEY (video_id, audio_format))"
+                )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS tracks ("
+                "track_id TEXT NOT NULL, "
+                "audio_format TEXT NOT NULL, "
+                "video_id TEXT NOT NULL, "
+                "path TEXT NOT NULL, "
+                "used_at REAL NOT NULL, "
+                "PRIMARY KEY (track_id, audio_format))"
+                )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM videos"
+                ).fetchone()[0]
+
+    def _unchanged(self, path, size, mtime, sha256):
+        """
+        Whether the file at :param:'path' is still the one archived, the
+        checksum is only computed when the modification time changed
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        if stat.st_size != size:
+            return False
+        if stat.st_mtime == mtime:
+            return True
+        if file_sha256(path) != sha256:
+            return False
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE videos SET mtime = ? WHERE path = ?",
+                (stat.st_mtime, path),
+                )
+        return True
+
+    def lookup(self, video_id, audio_format):
+        """
+        Path of the archived, unchanged file of a video. An entry whose
+        file is gone or changed is dropped.
+
+        :return: The path, None if the video has to be downloaded
+        :rtype: class:'str'
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT path, size, mtime, sha256 FROM videos "
+                "WHERE video_id = ? AND audio_format = ?",
+                (video_id, audio_format),
+                ).fetchone()
+        if row is None:
+            return None
+        if not self._unchanged(*row):
+            METRICS.incr("archive_stale")
+            with self._lock, self._db:
+                self._db.execute(
+                    "DELETE FROM videos "
+                    "WHERE video_id = ? AND audio_format = ?",
+                    (video_id, audio_format),
+                    )
+            return None
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE videos SET used_at = ? "
+                "WHERE video_id = ? AND audio_format = ?",
+                (time.time(), video_id, audio_format),
+                )
+        return row[0]
+
+    def record(self, video_id, audio_format, path):
+        """
+        Archive the downloaded file :param:'path' of a video
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        sha256 = file_sha256(path)
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO videos "
+                "(video_id, audio_format, path, size, mtime, sha256, "
+                "created_at, used_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (video_id, audio_format, path, stat.st_size, stat.st_mtime,
+                 sha256, now, now),
+                )
+
+    def record_track(self, track_id, audio_format, video_id, path):
+        """
+        Remember that Spotify track :param:'track_id' got the video's file
+        under :param:'path'
+        """
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO tracks "
+                "(track_id, audio_format, video_id, path, used_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (track_id, audio_format, video_id, os.path.abspath(path),
+                 time.time()),
+                )
+
+    def track(self, track_id, audio_format):
+        """
+        The (video_id, path) a Spotify track got, or None
+        """
+        with self._lock:
+            return self._db.execute(
+                "SELECT video_id, path FROM tracks "
+                "WHERE track_id = ? AND audio_format = ?",
+                (track_id, audio_format),
+                ).fetchone()
+
+    def prune(self, unused_for=None):
+        """
+        Drop the entries whose files are gone or changed, and the track
+        entries of dropped videos.
+
+        :param unused_for: Seconds, also delete the files (and the track
+            links to them) of videos no track asked for in this long
+        :type unused_for: class:'float'
+        :return: Number of dropped video entries and of deleted files
+        :rtype: tuple
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT video_id, audio_format, path, size, mtime, sha256, "
+                "used_at FROM videos"
+                ).fetchall()
+        dropped, deleted = 0, 0
+        for video_id, audio_format, path, size, mtime, sha256, used_at \
+                in rows:
+            unused = unused_for is not None \
+                and time.time() - used_at > unused_for
+            if self._unchanged(path, size, mtime, sha256) and not unused:
+                continue
+            with self._lock, self._db:
+                links = [
+                    link for link, in self._db.execute(
+                        "SELECT path FROM tracks "
+                        "WHERE video_id = ? AND audio_format = ?",
+                        (video_id, audio_format),
+                        )
+                ]
+                self._db.execute(
+                    "DELETE FROM tracks "
+                    "WHERE video_id = ? AND audio_format = ?",
+                    (video_id, audio_format),
+                    )
+                self._db.execute(
+                    "DELETE FROM videos "
+                    "WHERE video_id = ? AND audio_format = ?",
+                    (video_id, audio_format),
+                    )
+            dropped += 1
+            if unused:
+                for link in set(links + [path]):
+                    if os.path.lexists(link):
+                        os.remove(link)
+                        deleted += 1
+        return dropped, deleted
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def open_download_archive(cli_args):
+    """
+    The :class:'DownloadArchive' configured by the CLI, None with
+    --no-archive
+    """
+    if cli_args.no_archive:
+        return None
+    return DownloadArchive(cli_args.archive)
+
+
+def prune_download_archive(cli_args):
+    """
+    Run --prune-archive
+    """
+    unused_for = cli_args.prune_unused * 24 * 3600 \
+        if cli_args.prune_unused is not None else None
+    with DownloadArchive(cli_args.archive) as archive:
+        dropped, deleted = archive.prune(unused_for)
+        print("# Pruned {} entries and {} files of {}, {} entries left".format(
+            dropped, deleted, cli_args.archive, len(archive)
+            ))
+
+
+class DownloadScheduler:
+    """
+    Worker pool that runs many :func:'download_youtube_song' jobs (or jobs
+    of another of :data:'DOWNLOADERS') at once. Every job is an external
+    downloader process or network I/O, so threads are enough to keep all
+    cores and the network link busy.
+
+    Downloads that need a transcode only fetch the native audio, the ffmpeg
+    transcode then runs in a second, bounded pool. A slow transcode never
+    holds a download slot, so the network and the CPUs are busy at the
+    same time.
+
+    Given an :class:'DownloadArchive', videos it already has are not
+    scheduled at all, and finished downloads are added to it.
+
+    Usage::
+
+        with DownloadScheduler(workers=8) as scheduler:
+            futures = [scheduler.submit(url, song_data) for ...]
+            results = [future.result() for future in futures]
+
+    :param workers: Number of concurrent downloads, defaults to the number
+        of CPUs
+    :type workers: class:'int'
+    :param timeout: Per attempt timeout in seconds
+    :type timeout: class:'float'
+    :param retries: Extra attempts per job
+    :type retries: class:'int'
+    :param audio_format: A key of :data:'AUDIO_FORMATS'
+    :type audio_format: class:'str'
+    :param transcode_workers: Number of concurrent transcodes, defaults to
+        the number of CPUs
+    :type transcode_workers: class:'int'
+    :param download_dir: Directory of the downloads
+    :type download_dir: class:'str'
+    :param archive: Archive of the downloads, None downloads every video
+    :type archive: class:'DownloadArchive'
+    :param downloader: A key of :data:'DOWNLOADERS'
+    :type downloader: class:'str'
+    :param segments: Parallel ranges of every download of the "segmented"
+        downloader
+    :type segments: class:'int'
+    """
+
+    def __init__(self, workers=None, timeout=None, retries=2,
+                 audio_format="mp3", transcode_workers=None,
+                 download_dir=".", archive=None, downloader="ytdlp",
+                 segments=4):
+        self.workers = workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self.retries = retries
+        self.audio_format = audio_format
+        self.download_dir = os.path.abspath(download_dir)
+        self.archive = archive
+        self.download = DOWNLOADERS[downloader]
+        if downloader == "segmented":
+            self.download = functools.partial(self.download,
+                                              segments=segments)
+        os.makedirs(self.download_dir, exist_ok=True)
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers = self.workers,
+            thread_name_prefix = "download",
+            )
+        self.transcode_workers = 0
+        self._transcoder = None
+        if AUDIO_FORMATS[audio_format][1] is not None:
+            self.transcode_workers = transcode_workers or os.cpu_count() or 1
+            self._transcoder = concurrent.futures.ThreadPoolExecutor(
+                max_workers = self.transcode_workers,
+                thread_name_prefix = "transcode",
+                )
+
+    @property
+    def capacity(self):
+        """
+        Number of jobs that can be in progress at once, downloading or
+        transcoding
+        """
+        return self.workers + self.transcode_workers
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def for_track(self, result, song_data, track_id=None):
+        """
+        :param:'result' of a video for a track: the video's file is linked
+        under the name of this track (see :func:'download_basename'), e.g.
+        for a duplicate of the batch or an archived video that an earlier
+        track asked for
+
+        :param track_id: Spotify track ID, recorded in the archive
+        :type track_id: class:'str'
+        :rtype: class:'DownloadResult'
+        """
+        basename = download_basename(result.url, song_data)
+        if not result.ok or result.path is None or basename is None:
+            return result
+        path = os.path.join(
+            self.download_dir, basename + os.path.splitext(result.path)[1]
+            )
+        if os.path.abspath(result.path) != path:
+            result = dataclasses.replace(
+                result, path=link_download(result.path, path)
+                )
+        if self.archive is not None and track_id is not None:
+            self.archive.record_track(
+                track_id, self.audio_format, youtube_video_id(result.url),
+                result.path,
+                )
+        return result
+
+    def archived(self, matched_video_url, song_data, track_id=None):
+        """
+        The result of a video the archive already has, None when it has to
+        be downloaded
+
+        :rtype: class:'DownloadResult'
+        """
+        video_id = youtube_video_id(matched_video_url)
+        if self.archive is None or video_id is None:
+            return None
+        path = self.archive.lookup(video_id, self.audio_format)
+        if path is None:
+            return None
+        METRICS.incr("download_archived")
+        return self.for_track(
+            DownloadResult(matched_video_url, DownloadStatus.ARCHIVED,
+                           path=path),
+            song_data,
+            track_id,
+            )
+
+    def submit(self, matched_video_url, song_data, track_id=None):
+        """
+        Schedule a download, unless the archive has the video
+
+        :param track_id: Spotify track ID, recorded in the archive
+        :type track_id: class:'str'
+        :rtype: class:'concurrent.futures.Future' of
+            class:'DownloadResult'
+        """
+        future = concurrent.futures.Future()
+        result = self.archived(matched_video_url, song_data, track_id)
+        if result is not None:
+            future.set_result(result)
+            return future
+
+        def finish(result):
+            video_id = youtube_video_id(matched_video_url)
+            if self.archive is not None and result.ok \
+                    and result.path is not None and video_id is not None:
+                self.archive.record(video_id, self.audio_format, result.path)
+                result = self.for_track(result, song_data, track_id)
+            future.set_result(result)
+
+        def transcoded(transcode):
+            try:
+                finish(transcode.result())
+            except Exception as e:
+                future.set_exception(e)
+
+        def downloaded(download):
+            try:
+                result = download.result()
+                if self._transcoder is None or not result.ok \
+                        or not needs_transcode(result.path, self.audio_format):
+                    finish(result)
+                    return
+                METRICS.incr("transcode_deferred")
+                self._transcoder.submit(
+                    transcode_audio, result, self.audio_format, self.timeout
+                    ).add_done_callback(transcoded)
+            except Exception as e:
+                future.set_exception(e)
+
+        self._executor.submit(
+            self.download,
+            matched_video_url,
+            song_data,
+            timeout = self.timeout,
+            retries = self.retries,
+            audio_format = self.audio_format,
+            defer_transcode = self._transcoder is not None,
+            download_dir = self.download_dir,
+            ).add_done_callback(downloaded)
+        return future
+
+    def map(self, jobs):
+        """
+        Download every (matched_video_url, song_data) pair of
+        :param:'jobs' and return the results in the same order
+
+        :rtype: list
+        """
+        futures = [self.submit(*job) for job in jobs]
+        return [future.result() for future in futures]
+
+    def close(self, wait=True):
+        # Finished downloads still hand their transcode over
+        self._executor.shutdown(wait=wait)
+        if self._transcoder is not None:
+            self._transcoder.shutdown(wait=wait)
+
+
+def configure_rate_limiter(cli_args):
+    """
+    Replace :data:'RATE_LIMITER' with one configured by the CLI
+    """
+    global RATE_LIMITER
+    rates = dict(RATE_LIMITER.rates)
+    for rate_limit in cli_args.rate_limit:
+        host, _, rate = rate_limit.partition("=")
+        rates[host.lower()] = float(rate)
+    # Workers of --workers share the machine's address, and its limits
+    rates = {host: rate * cli_args.rate_share for host, rate in rates.items()}
+    RATE_LIMITER = HostRateLimiter(
+        rates = rates,
+        max_concurrency = cli_args.max_per_host,
+        max_retries = cli_args.max_retries,
+        )
+
+
+def configure_match_scorer(cli_args):
+    """
+    Replace :data:'MATCH_SCORER' with one configured by the CLI
+    """
+    global MATCH_SCORER
+    MATCH_SCORER = MatchScorer(
+        fuzzy = FUZZY_SCORERS.get(cli_args.fuzzy),
+        fuzzy_weight = cli_args.fuzzy_weight,
+        threshold = cli_args.match_threshold,
+        duration_tolerance = cli_args.duration_tolerance
+            if cli_args.duration_tolerance > 0 else None,
+        )
+
+
+def open_metadata_cache(cli_args):
+    """
+    The :class:'MetadataCache' configured by the CLI, None with --no-cache
+    """
+    if cli_args.no_cache:
+        return None
+    return MetadataCache(
+        cli_args.cache_path,
+        ttl = cli_args.cache_ttl * 24 * 3600,
+        max_entries = cli_args.cache_max_entries,
+        )
+
+
+def open_search_cache(cli_args):
+    """
+    The :class:'SearchCache' configured by the CLI, None with --no-cache
+    """
+    if cli_args.no_cache:
+        return None
+    return SearchCache(
+        cli_args.cache_path,
+        ttl = cli_args.search_cache_ttl * 24 * 3600,
+        max_entries = cli_args.cache_max_entries,
+        )
+
+
+def cached_youtube_search(search_query, cli_args, driver_pool=None,
+                          search_cache=None, match_key=None):
+    """
+    :func:'find_youtube_videos' behind the search cache
+
+    :param match_key: Key of the song's match in the cache, see
+        :meth:'MatchScorer.cache_key'. None only looks for the videos.
+    :type match_key: class:'str'
+    :return: The (video_list, cached_match) pair, cached_match is the
+        :class:'CachedMatch' of :param:'match_key' or None when the video
+        list still has to be scored. video_list is None when the match was
+        cached.
+    :rtype: tuple
+    """
+    if search_cache is not None and not cli_args.refresh:
+        if match_key is not None:
+            cached_match = search_cache.get_match_details(
+                search_query, match_key
+                )
+            if cached_match is not None:
+                METRICS.incr("match_cache_hit")
+                return None, cached_match
+        video_list = search_cache.get_videos(search_query)
+        if video_list is not None:
+            METRICS.incr("search_cache_hit")
+            return video_list, None
+        METRICS.incr("search_cache_miss")
+
+    video_list = find_youtube_videos(
+        search_query,
+        cli_args.search_backend,
+        cli_args.headless,
+        driver_pool,
+        top_n = cli_args.top_n,
+        )
+    if search_cache is not None and video_list:
+        search_cache.put_videos(search_query, video_list)
+    return video_list, None
+
+
+def spotify2youtube(url, cli_args, driver_pool=None, metadata_cache=None,
+                    search_cache=None):
+    """
+    Given a Spotify song URL, find and retrieve the most relevant video to the song,
+    from Youtube.
+
+    :param url: Spotify URL of an individual song
+    :type url: class:'str'
+    :param driver_pool: Pool of warm WebDrivers shared between searches
+    :type driver_pool: class:'WebDriverPool'
+    :param metadata_cache: Cache of Spotify song details
+    :type metadata_cache: class:'MetadataCache'
+    :param search_cache: Cache of youtube searches and matches
+    :type search_cache: class:'SearchCache'
+    :return: Youtube URL of the most relevant video to the song in Spotify URL
+    :rtype: class:'str'
+
+    :REVIEW:
+    This may be implemented not as functional programming but as a 
+    class like :class:'VideoMatcher' or :class:'spotify2youtube' with
+    internal methods. The functional programming method may be more beneficial
+    if a programmer wants to import indiviual functions for their own use.
+    """
+
+    song_data = get_song_details(url, metadata_cache, cli_args.refresh)
+    search_query = parse_search_query(song_data)
+    # video_list = find_youtube_videos(search_query)
+    match_key = MATCH_SCORER.cache_key(song_data)
+    video_list, cached_match = cached_youtube_search(
+        search_query, cli_args, driver_pool, search_cache, match_key
+        )
+    if cached_match is None:
+        matched_video_url, score, confidence = best_video_match(
+            song_data, video_list
+            )
+        if search_cache is not None and matched_video_url is not None:
+            search_cache.put_match(
+                search_query, matched_video_url, score, confidence,
+                match_key,
+                )
+    else:
+        matched_video_url = cached_match.url
+    # If a single link is provided by the user at CLI as input
+    if cli_args.single and matched_video_url is not None:
+        show_video(matched_video_url)
+    return matched_video_url, song_data
+
+
+def result_format(path):
+    """
+    Format of a results file by its extension, e.g. "results.csv" -> "csv",
+    see :data:'RESULT_FORMATS'. jsonl for stdout and unknown extensions.
+    """
+    extension = os.path.splitext(path)[1].lstrip(".").lower()
+    if extension in RESULT_FORMATS:
+        return extension
+    return {"json": "jsonl", "ndjson": "jsonl", "pq": "parquet"}.get(
+        extension, "jsonl"
+        )
+
+
+RESULT_FORMATS = ("csv", "jsonl", "parquet")
+
+RESULT_FIELDS = [
+    "index", "url", "song", "artists", "duration", "isrc", "search_query",
+    "matched_video_url", "score", "confidence", "status", "failed_stage",
+    "error", "download_status", "timings",
+]
+
+
+def result_row(record):
+    """
+    Flat row of :data:'RESULT_FIELDS' for a finished pipeline record. The
+    status is "ok", "failed" or "low-confidence" for a match that was not
+    downloaded, see --min-confidence.
+    """
+    song_data = record["song_data"] or dict()
+    download = record["download"]
+    status = "ok"
+    if record["error"] is not None:
+        status = "failed"
+    elif record["low_confidence"]:
+        status = "low-confidence"
+    return {
+        "index": record["index"],
+        "url": record["url"],
+        "song": song_data.get("song"),
+        "artists": song_data.get("artists"),
+        "duration": song_data.get("duration"),
+        "isrc": song_data.get("isrc"),
+        "search_query": record["search_query"],
+        "matched_video_url": record["matched_video_url"],
+        "score": record["score"],
+        "confidence": record["confidence"],
+        "status": status,
+        "failed_stage": record["failed_stage"],
+        "error": record["error"],
+        "download_status": download.status.value if download else None,
+        "timings": {
+            name: round(seconds, 6)
+            for name, seconds in record["timings"].items()
+        },
+    }
+
+
+class ResultWriter:
+    """
+    Writes a row per URL (see :func:'result_row') as soon as the URL is
+    finished, so the results of a long run are available while it runs and
+    none are kept in memory. jsonl and csv rows are flushed one by one,
+    parquet rows are buffered into row groups of :param:'row_group_size'.
+    In csv, artists are joined with ", " and timings are a JSON object.
+
+    :param path: File to write, "-" for stdout
+    :type path: class:'str'
+    :param format: One of :data:'RESULT_FORMATS', guessed from the
+        extension of :param:'path' when None
+    :type format: class:'str'
+    """
+
+    def __init__(self, path, format=None, row_group_size=1000):
+        self.path = path
+        self.format = format or result_format(path)
+        if self.format not in RESULT_FORMATS:
+            raise ValueError("Unknown result format {!r}".format(self.format))
+        self.row_group_size = row_group_size
+        self._lock = threading.Lock()
+        self._rows = list()
+        self._parquet = None
+        self._owns_file = path != "-"
+        if path == "-":
+            if self.format == "parquet":
+                raise ValueError("parquet results cannot go to stdout")
+            self._file = sys.stdout
+        else:
+            mode = "wb" if self.format == "parquet" else "w"
+            self._file = open(path, mode, **(
+                dict() if mode == "wb" else dict(encoding="utf-8", newline="")
+                ))
+        if self.format == "csv":
+            self._csv = csv.DictWriter(self._file, fieldnames=RESULT_FIELDS)
+            self._csv.writeheader()
+            self._file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def write(self, record):
+        self.write_row(result_row(record))
+
+    def write_row(self, row):
+        """
+        Write a row of :data:'RESULT_FIELDS' as returned by
+        :func:'result_row' or :func:'read_result_rows'
+        """
+        row = dict(row)
+        with self._lock:
+            if self.format == "jsonl":
+                self._file.write(json.dumps(row, ensure_ascii=False) + "\n")
+                self._file.flush()
+            elif self.format == "csv":
+                row["artists"] = ", ".join(row["artists"] or [])
+                row["timings"] = json.dumps(row["timings"])
+                self._csv.writerow(row)
+                self._file.flush()
+            else:
+                self._rows.append(row)
+                if len(self._rows) >= self.row_group_size:
+                    self._flush_parquet()
+
+    def _flush_parquet(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        if not self._rows:
+            return
+        for row in self._rows:
+            row["timings"] = json.dumps(row["timings"])
+        table = pa.Table.from_pylist(self._rows, schema=self._schema(pa))
+        if self._parquet is None:
+            self._parquet = pq.ParquetWriter(self._file, table.schema)
+        self._parquet.write_table(table)
+        self._rows = list()
+
+    @staticmethod
+    def _schema(pa):
+        return pa.schema([
+            ("index", pa.int64()),
+            ("url", pa.string()),
+            ("song", pa.string()),
+            ("artists", pa.list_(pa.string())),
+            ("duration", pa.int64()),
+            ("isrc", pa.string()),
+            ("search_query", pa.string()),
+            ("matched_video_url", pa.string()),
+            ("score", pa.float64()),
+            ("confidence", pa.float64()),
+            ("status", pa.string()),
+            ("failed_stage", pa.string()),
+            ("error", pa.string()),
+            ("download_status", pa.string()),
+            ("timings", pa.string()),
+        ])
+
+    def close(self):
+        with self._lock:
+            if self.format == "parquet":
+                self._flush_parquet()
+                if self._parquet is not None:
+                    self._parquet.close()
+            if self._owns_file:
+                self._file.close()
+
+
+def read_result_rows(path):
+    """
+    Read back the rows of a results file written by :class:'ResultWriter',
+    in the form :func:'result_row' returns them
+
+    :return: Generator of rows
+    """
+    format = result_format(path)
+    if format == "parquet":
+        import pyarrow.parquet as pq
+        parquet = pq.ParquetFile(path)
+        for batch in parquet.iter_batches():
+            for row in batch.to_pylist():
+                row["timings"] = json.loads(row["timings"] or "{}")
+                yield row
+        return
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if format == "jsonl":
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+            return
+        for row in csv.DictReader(f):
+            row = {key: (value if value != "" else None)
+                   for key, value in row.items()}
+            row["index"] = int(row["index"])
+            for key, convert in (("duration", int), ("score", float),
+                                 ("confidence", float)):
+                # Files written before a field was added lack its column
+                if row.get(key) is not None:
+                    row[key] = convert(row[key])
+            row["artists"] = row["artists"].split(", ") if row["artists"] \
+                else None
+            row["timings"] = json.loads(row["timings"] or "{}")
+            yield row
+
+
+class JobJournal:
+    """
+    Append-only JSONL log of the progress of a batch run, one line per
+    finished (or failed) stage of a URL. Every line is written with a
+    single write(2) on a file opened with O_APPEND, so a line is either
+    fully in the journal or, if the process is killed mid-write, a torn
+    last line that :meth:'load' ignores. Completed lines survive even a
+    kill -9, and with :param:'fsync' also a power loss.
+
+    :param path: Journal file, created when missing
+    :type path: class:'str'
+    :param fsync: Flush every line to disk before returning
+    :type fsync: class:'bool'
+    """
+
+    def __init__(self, path, fsync=False):
+        self.path = path
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+                           0o644)
+        # Terminate a torn last line, so that it does not swallow the next
+        size = os.fstat(self._fd).st_size
+        if size:
+            with open(path, "rb") as f:
+                f.seek(size - 1)
+                if f.read(1) != b"\n":
+                    os.write(self._fd, b"\n")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def record(self, url, stage, status, **fields):
+        """
+        Append the outcome of a stage of a URL
+
+        :param status: "ok" or "failed"
+        :type status: class:'str'
+        :param fields: JSON serializable results of the stage
+        """
+        entry = {"time": time.time(), "url": url, "stage": stage,
+                 "status": status}
+        entry.update(fields)
+        line = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            written = 0
+            while written < len(line):
+                written += os.write(self._fd, line[written:])
+            if self.fsync:
+                os.fsync(self._fd)
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+    @staticmethod
+    def load(path):
+        """
+        Replay a journal into the latest known results of each URL
+
+        :return: URL -> dict of the results of its successful stages, e.g.
+            "song_data", "search_query", "matched_video_url" and "download",
+            an empty dict if the journal does not exist
+        :rtype: class:'dict'
+        """
+        state = dict()
+        if not os.path.exists(path):
+            return state
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue    # Torn line of a killed run
+                if entry.get("status") != "ok":
+                    continue
+                fields = state.setdefault(entry["url"], dict())
+                for key, value in entry.items():
+                    if key not in ("time", "url", "stage", "status"):
+                        fields[key] = value
+        return state
+
+
+def _journal_fields(name, record):
+    """
+    Results of stage :param:'name' that are needed to resume after it
+    """
+    if name == "metadata":
+        return {
+            "song_data": {
+                key: value for key, value in record["song_data"].items()
+                if key != "search_query"
+            },
+            "search_query": record["search_query"],
+        }
+    if name == "search":
+        # The candidate list is not journaled, it is only needed to match
+        if record["matched_video_url"] is None:
+            return dict()
+        return {"matched_video_url": record["matched_video_url"]}
+    if name in ("match", "retry"):
+        if record["matched_video_url"] is None:
+            return dict()
+        return {
+            key: record[key]
+            for key in ("matched_video_url", "score", "confidence")
+        }
+    if name == "download":
+        return {"download": {
+            "status": record["download"].status.value,
+            "returncode": record["download"].returncode,
+        }}
+    return dict()
+
+
+def _resume_record(record, state, min_confidence=None):
+    """
+    Fill a fresh pipeline record with the results a journal recorded for
+    its URL, so that completed stages are skipped. Whether a restored match
+    is too poor to download is judged again against :param:'min_confidence',
+    see :func:'is_low_confidence'.
+    """
+    if "song_data" in state:
+        record["song_data"] = dict(state["song_data"])
+        record["song_data"]["search_query"] = state["search_query"]
+        record["search_query"] = state["search_query"]
+    if "matched_video_url" in state:
+        record["matched_video_url"] = state["matched_video_url"]
+        record["score"] = state.get("score")
+        record["confidence"] = state.get("confidence")
+        record["low_confidence"] = is_low_confidence(record, min_confidence)
+    download = state.get("download")
+    if download is not None and download["status"] in ("ok", "archived"):
+        record["download"] = DownloadResult(
+            record["matched_video_url"],
+            DownloadStatus(download["status"]),
+            returncode = download["returncode"],
+            )
+
+
+class Coalescer:
+    """
+    Collapses duplicate work of a batch: the first caller of :meth:'run'
+    for a key does the work, callers with the same key that arrive while it
+    is in flight wait for and share its result (or exception). Successful
+    results of the last :param:'max_done' keys are kept, so a duplicate
+    that arrives later shares the result as well; failures are not kept
+    and a later duplicate tries again. A result :param:'keep' rejects is a
+    failure as well, the duplicates that waited for it try once more
+    themselves.
+
+    :param name: Name used in the metrics, coalesced_<name>
+    :type name: class:'str'
+    :param max_done: Number of finished results kept
+    :type max_done: class:'int'
+    :param keep: Tells a successful result from a failed one that is
+        returned rather than raised, every result is successful without
+    :type keep: class:'function'
+    """
+
+    def __init__(self, name, max_done=4096, keep=None):
+        self.name = name
+        self.max_done = max_done
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._inflight = dict()     # key -> concurrent.futures.Future
+        self._done = collections.OrderedDict()
+
+    def run(self, key, func, *args, **kwargs):
+        """
+        func(*args, **kwargs), unless a call with the same key is in flight
+        or finished recently, then its result
+        """
+        return self._run(key, func, args, kwargs, retry=True)
+
+    def _kept(self, result):
+        return self.keep is None or self.keep(result)
+
+    def _run(self, key, func, args, kwargs, retry):
+        with self._lock:
+            if key in self._done:
+                self._done.move_to_end(key)
+                METRICS.incr("coalesced_" + self.name)
+                return self._done[key]
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = concurrent.futures.Future()
+        if not owner:
+            METRICS.incr("coalesced_" + self.name)
+            result = future.result()
+            if retry and not self._kept(result):
+                return self._run(key, func, args, kwargs, retry=False)
+            return result
+
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            with self._lock:
+                del self._inflight[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            del self._inflight[key]
+            if self._kept(result):
+                self._done[key] = result
+                while len(self._done) > self.max_done:
+                    self._done.popitem(last=False)
+        future.set_result(result)
+        return result
+
+
+# Sentinel that tells the workers of a pipeline stage to stop
+_PIPELINE_DONE = object()
+
+
+def new_record(index, url):
+    """
+    Empty pipeline record of a URL, see :func:'run_pipeline'
+    """
+    return {
+        "index": index,
+        "url": url,
+        "song_data": None,
+        "search_query": None,
+        "video_list": None,
+        "matched_video_url": None,
+        "score": None,
+        "confidence": None,
+        "low_confidence": False,
+        "download": None,
+        "error": None,
+        "failed_stage": None,
+        "timings": dict(),
+    }
+
+
+def pipeline_context(cli_args, driver_pool=None, download_scheduler=None,
+                     metadata_cache=None, search_cache=None, prefetched=None,
+                     journal=None, max_done=4096):
+    """
+    The shared state the pipeline stages run with, see :func:'run_pipeline'
+
+    :param max_done: Finished results each :class:'Coalescer' keeps, 0
+        only coalesces work that is in flight
+    :type max_done: class:'int'
+    """
+    return types.SimpleNamespace(
+        cli_args = cli_args,
+        driver_pool = driver_pool,
+        download_scheduler = download_scheduler,
+        metadata_cache = metadata_cache,
+        search_cache = search_cache,
+        prefetched = prefetched if prefetched is not None else dict(),
+        journal = journal,
+        # Duplicate tracks, searches and downloads of the batch share one
+        coalescers = {
+            "metadata": Coalescer("metadata", max_done),
+            "search": Coalescer("search", max_done),
+            # A failed download is returned, not raised
+            "download": Coalescer("download", max_done,
+                                  keep = lambda result: result.ok),
+        },
+        )
+
+
+def _stage_metadata(record, context):
+    track_id = spotify_track_id(record["url"]) or record["url"]
+    song_data = context.prefetched.pop(track_id, None)
+    if song_data is None:
+        song_data = context.coalescers["metadata"].run(
+            track_id,
+            get_song_details,
+            record["url"],
+            context.metadata_cache,
+            context.cli_args.refresh,
+            )
+    song_data = dict(song_data)     # Searching adds to the dict
+    record["search_query"] = parse_search_query(song_data)
+    record["song_data"] = song_data
+
+
+def _stage_search(record, context):
+    match_key = MATCH_SCORER.cache_key(record["song_data"])
+    # Tracks with the same query share the search, and a cached match
+    # only when it was made for the same key
+    record["video_list"], cached_match = context.coalescers["search"].run(
+        (normalize_search_query(record["search_query"]), match_key),
+        cached_youtube_search,
+        record["search_query"],
+        context.cli_args,
+        context.driver_pool,
+        context.search_cache,
+        match_key,
+        )
+    if cached_match is not None:
+        record["matched_video_url"], record["score"], \
+            record["confidence"] = cached_match
+        record["low_confidence"] = is_low_confidence(
+            record, context.cli_args.min_confidence
+            )
+
+
+def is_low_confidence(record, min_confidence=None):
+    """
+    Whether the match of a pipeline record is too poor to download: no
+    video passed the duration prefilter, or the confidence of the match is
+    below :param:'min_confidence'. A match without a confidence passes.
+    """
+    if record["matched_video_url"] is None:
+        return True
+    return min_confidence is not None \
+        and record["confidence"] is not None \
+        and record["confidence"] < min_confidence
+
+
+def retry_search_query(song_data):
+    """
+    The second search query of a song that matched poorly: its ISRC when
+    known, which finds the uploads of the recording whatever their title,
+    otherwise the first query narrowed to audio uploads
+    """
+    if song_data.get("isrc"):
+        return song_data["isrc"]
+    return song_data["search_query"] + "+audio"
+
+
+def _stage_match(record, context):
+    record["matched_video_url"], record["score"], record["confidence"] = \
+        best_video_match(record["song_data"], record["video_list"])
+    record["low_confidence"] = is_low_confidence(
+        record, context.cli_args.min_confidence
+        )
+    if record["matched_video_url"] is None:
+        print("# No video matched {}, none found or none within the "
+              "duration tolerance".format(record["url"]), file=sys.stderr)
+    # A poor match is not cached, so a later run searches again
+    if context.search_cache is not None and not record["low_confidence"]:
+        context.search_cache.put_match(
+            record["search_query"], record["matched_video_url"],
+            record["score"], record["confidence"],
+            MATCH_SCORER.cache_key(record["song_data"]),
+            )
+
+
+def _stage_retry(record, context):
+    if not record["low_confidence"]:
+        return
+    cli_args = context.cli_args
+    retry_query = retry_search_query(record["song_data"])
+    video_list, _ = context.coalescers["search"].run(
+        normalize_search_query(retry_query),
+        cached_youtube_search,
+        retry_query,
+        cli_args,
+        context.driver_pool,
+        context.search_cache,
+        )
+    METRICS.incr("match_retried")
+    url = None
+    if video_list:
+        # Scored against the first query, the retry only brings candidates
+        url, score, confidence = best_video_match(
+            record["song_data"], video_list
+            )
+    if url is not None and (record["matched_video_url"] is None
+                            or confidence > record["confidence"]):
+        METRICS.incr("match_retry_improved")
+        record["matched_video_url"] = url
+        record["score"], record["confidence"] = score, confidence
+    record["low_confidence"] = is_low_confidence(
+        record, cli_args.min_confidence
+        )
+    if record["low_confidence"]:
+        METRICS.incr("low_confidence")
+        print("# Low confidence match of {} ({:0.3f}), not downloading"
+              .format(record["url"], record["confidence"] or 0.0),
+              file=sys.stderr)
+    elif context.search_cache is not None:
+        context.search_cache.put_match(
+            record["search_query"], record["matched_video_url"],
+            record["score"], record["confidence"],
+            MATCH_SCORER.cache_key(record["song_data"]),
+            )
+
+
+def _stage_download(record, context):
+    if record["low_confidence"]:
+        return
+    track_id = spotify_track_id(record["url"])
+    result = context.coalescers["download"].run(
+        record["matched_video_url"],
+        lambda: context.download_scheduler.submit(
+            record["matched_video_url"], record["song_data"], track_id
+            ).result(),
+        )
+    # Tracks of the batch that matched the same video share its file
+    record["download"] = context.download_scheduler.for_track(
+        result, record["song_data"], track_id
+        )
+
+
+def _pipeline_stages(context):
+    """
+    The ordered (name, function, concurrency) stages of the batch pipeline
+    """
+    cli_args = context.cli_args
+    search_workers = cli_args.search_workers or cli_args.pool_size
+    stages = [
+        ("metadata", _stage_metadata, cli_args.metadata_workers),
+        ("search", _stage_search, search_workers),
+        ("match", _stage_match, 1),
+    ]
+    if cli_args.min_confidence is not None:
+        # Low-confidence matches of the batch are searched again together
+        stages.append(("retry", _stage_retry, search_workers))
+    if context.download_scheduler is not None:
+        stages.append((
+            "download",
+            _stage_download,
+            context.download_scheduler.capacity,
+            ))
+    return stages
+
+
+def _stage_satisfied(name, record):
+    """
+    Whether the output of stage :param:'name' is already in the record,
+    e.g. from a cache or a resumed journal, so the stage can be skipped
+    """
+    if name == "metadata":
+        return record["song_data"] is not None
+    if name == "search":
+        return record["video_list"] is not None \
+            or record["matched_video_url"] is not None
+    if name == "match":
+        return record["matched_video_url"] is not None
+    if name == "download":
+        return record["download"] is not None and record["download"].ok
+    return False
+
+
+def _run_stage(name, func, record, context):
+    """
+    Run a stage on a record and note the outcome in the journal
+    """
+    journal = context.journal
+    start = time.perf_counter()
+    try:
+        if PROFILER is not None:
+            PROFILER.call(func, record, context)
+        else:
+            func(record, context)
+    except Exception as e:
+        record["timings"][name] = time.perf_counter() - start
+        record["error"] = "{}: {}".format(type(e).__name__, e)
+        record["failed_stage"] = name
+        METRICS.incr("failures")
+        METRICS.incr("failures_" + name)
+        if journal is not None:
+            journal.record(record["url"], name, "failed",
+                           error=record["error"])
+        raise
+    record["timings"][name] = time.perf_counter() - start
+    if journal is not None:
+        journal.record(record["url"], name, "ok", **_journal_fields(
+            name, record
+            ))
+
+
+async def _pipeline_worker(name, func, inbox, outbox, executor, context):
+    import asyncio
+    loop = asyncio.get_running_loop()
+    while True:
+        record = await inbox.get()
+        if record is _PIPELINE_DONE:
+            return
+        # A record that failed in an earlier stage is passed through
+        if record["error"] is None and not _stage_satisfied(name, record):
+            try:
+                await loop.run_in_executor(
+                    executor, _run_stage, name, func, record, context
+                    )
+            except Exception:
+                print("# Stage '{}' failed for {} ({})".format(
+                    name, record["url"], record["error"]
+                    ), file=sys.stderr)
+        # The candidates are only needed up to the match, dropping them
+        # keeps the memory of a run independent of its length
+        if name == "match":
+            record["video_list"] = None
+        await outbox.put(record)
+
+
+async def _pipeline_stage(name, func, concurrency, inbox, outbox, executor,
+                          context, downstream):
+    """
+    Run :param:'concurrency' workers of a single stage, then tell the
+    :param:'downstream' workers of the next stage to stop
+    """
+    import asyncio
+    await asyncio.gather(*[
+        _pipeline_worker(name, func, inbox, outbox, executor, context)
+        for _ in range(concurrency)
+    ])
+    for _ in range(downstream):
+        await outbox.put(_PIPELINE_DONE)
+
+
+async def run_pipeline(urls, cli_args, driver_pool=None,
+                       download_scheduler=None, metadata_cache=None,
+                       search_cache=None, prefetched=None, journal=None,
+                       resume_state=None, on_result=None, shard=None):
+    """
+    Convert many Spotify URLs concurrently. Every step of
+    :func:'spotify2youtube' (and the download) is a stage with its own
+    number of workers, stages are connected by bounded queues and the
+    blocking work of each stage runs in a thread pool, so that metadata
+    fetches, searches and downloads of different tracks overlap.
+
+    Repeated work is done once per batch, see :class:'Coalescer': metadata
+    by track ID, searches by normalized search query and downloads by
+    matched video URL. Every URL still gets its own record.
+
+    :param urls: Spotify URLs of individual songs, an iterable that is
+        consumed lazily (in a worker thread), as the first stage has room.
+        An error raised by it is raised here, once the URLs read before it
+        have finished.
+    :type urls: iterable
+    :param cli_args: Parsed CLI arguments, see :func:'read_cli_inputs'
+    :type cli_args: class:'argparse.Namespace'
+    :param driver_pool: Pool of warm WebDrivers used by the search stage
+    :type driver_pool: class:'WebDriverPool'
+    :param download_scheduler: Scheduler the download stage hands matched
+        videos to, nothing is downloaded when None
+    :type download_scheduler: class:'DownloadScheduler'
+    :param metadata_cache: Cache of Spotify song details
+    :type metadata_cache: class:'MetadataCache'
+    :param search_cache: Cache of youtube searches and matches
+    :type search_cache: class:'SearchCache'
+    :param prefetched: Song details already known by track ID, e.g. from
+        :func:'expand_spotify_urls'
+    :type prefetched: class:'dict'
+    :param journal: Journal the outcome of every stage is appended to
+    :type journal: class:'JobJournal'
+    :param resume_state: Results of a previous run, see
+        :meth:'JobJournal.load'. Stages completed in it are skipped, failed
+        and unfinished ones run again.
+    :type resume_state: class:'dict'
+    :param on_result: Called with every record as soon as it finished, in
+        completion order. Records are then not collected, so memory stays
+        constant however many URLs there are, and an empty list is returned.
+    :type on_result: class:'function'
+    :param shard: (index, count) pair, only the URLs of shard index (see
+        :func:'shard_of') are processed, the others are skipped. Record
+        indices stay positions in the whole of :param:'urls'.
+    :type shard: class:'tuple'
+    :return: One record per URL, in input order, in the form
+        dict_['index'] = :int:'position in urls'
+        dict_['url'] = :str:'url'
+        dict_['song_data'] = :dict:'song_data'
+        dict_['search_query'] = :str:'search_query'
+        dict_['video_list'] = None (dropped after matching)
+        dict_['matched_video_url'] = :str:'matched_video_url'
+        dict_['score'] = :float:'score of the match' or None
+        dict_['download'] = :class:'DownloadResult' or None
+        dict_['error'] = :str:'error' or None
+        dict_['failed_stage'] = :str:'stage name' or None
+        dict_['timings'] = :dict:'stage name -> seconds'
+    :rtype: list
+    """
+    import asyncio
+
+    context = pipeline_context(
+        cli_args, driver_pool, download_scheduler, metadata_cache,
+        search_cache, prefetched, journal,
+        )
+    resume_state = resume_state or dict()
+    stages = _pipeline_stages(context)
+    concurrencies = [concurrency for _, _, concurrency in stages]
+    # Queue in front of each stage, and the results queue at the end. The
+    # bound keeps a fast stage from running far ahead of a slow one.
+    queues = [asyncio.Queue(maxsize=2 * n) for n in concurrencies]
+    queues.append(asyncio.Queue())
+
+    executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=sum(concurrencies)
+        )
+    reader = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    with executor, reader:
+        tasks = list()
+        for i, (name, func, concurrency) in enumerate(stages):
+            downstream = concurrencies[i + 1] if i + 1 < len(stages) else 1
+            tasks.append(asyncio.create_task(_pipeline_stage(
+                name, func, concurrency, queues[i], queues[i + 1],
+                executor, context, downstream,
+                )))
+
+        async def feed():
+            # Reading the next URL may block on a file, stdin or the
+            # expansion of a playlist, so it is done off the event loop.
+            # When it fails the stages are still shut down, so the records
+            # already fed finish, and the error is raised by the gather
+            # below.
+            loop = asyncio.get_running_loop()
+            index = 0
+            try:
+                url_iter = iter(urls)
+                while True:
+                    url = await loop.run_in_executor(
+                        reader, next, url_iter, _PIPELINE_DONE
+                        )
+                    if url is _PIPELINE_DONE:
+                        break
+                    if shard is not None \
+                            and shard_of(url, shard[1]) != shard[0]:
+                        # Details prefetched by another shard's playlist
+                        context.prefetched.pop(
+                            spotify_track_id(url) or url, None
+                            )
+                        index += 1
+                        continue
+                    record = new_record(index, url)
+                    index += 1
+                    if url in resume_state:
+                        _resume_record(
+                            record, resume_state[url],
+                            context.cli_args.min_confidence,
+                            )
+                    await queues[0].put(record)
+            finally:
+                for _ in range(concurrencies[0]):
+                    await queues[0].put(_PIPELINE_DONE)
+
+        tasks.append(asyncio.create_task(feed()))
+
+        records = list()
+        while True:
+            record = await queues[-1].get()
+            if record is _PIPELINE_DONE:
+                break
+            if on_result is not None:
+                on_result(record)
+            else:
+                records.append(record)
+        await asyncio.gather(*tasks)
+
+    records.sort(key=lambda record: record["index"])
+    return records
+
+
+def _journal_entries(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue    # Torn line of a killed run
+
+
+def merge_shards(paths, output=None, output_format=None, journal=None):
+    """
+    Combine the per-shard results and journals of a sharded run, see
+    --shard and --workers. Results files are merged into :param:'output'
+    in input order (rows are sorted by index, which is a position in the
+    whole input), journals are appended to :param:'journal' in time order.
+    Journals are told apart from results by their "stage" field, empty
+    files are skipped.
+
+    :param paths: Results and journal files of the shards
+    :type paths: list
+    :param output: Merged results file, "-" for stdout
+    :type output: class:'str'
+    :param journal: Journal the shard journals are appended to
+    :type journal: class:'str'
+    """
+    results, journals = list(), list()
+    for path in paths:
+        if os.path.getsize(path) == 0:
+            continue    # A shard that had nothing to do
+        if result_format(path) == "jsonl":
+            with open(path, "r", encoding="utf-8") as f:
+                first = f.readline()
+            try:
+                is_journal = "stage" in json.loads(first)
+            except ValueError:
+                is_journal = False
+            if is_journal:
+                journals.append(path)
+                continue
+        results.append(path)
+
+    if results and output is None:
+        raise ValueError("Results files to merge but no output given")
+    if journals and journal is None:
+        raise ValueError("Journals to merge but no journal given")
+
+    if results:
+        rows = [row for path in results for row in read_result_rows(path)]
+        rows.sort(key=lambda row: row["index"])
+        with ResultWriter(output, output_format) as writer:
+            for row in rows:
+                writer.write_row(row)
+        print("# Merged {} rows of {} shards into {}".format(
+            len(rows), len(results), output
+            ))
+    if journals:
+        entries = heapq.merge(
+            *[_journal_entries(path) for path in journals],
+            key=lambda entry: entry.get("time", 0),
+            )
+        count = 0
+        with open(journal, "a", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                count += 1
+        print("# Merged {} journal lines of {} shards into {}".format(
+            count, len(journals), journal
+            ))
+
+
+def _run_shard(cli_args):
+    """
+    Entry point of a --workers process
+    """
+    main(input_urls(cli_args), cli_args)
+
+
+def _seed_shard_journal(journal, shard_journal, index, count):
+    """
+    Start the journal of a shard with the lines of the shard's URLs in the
+    unsharded journal, so that no history is lost when the journal is
+    rewritten from the shard journals
+    """
+    if os.path.exists(shard_journal) or not os.path.exists(journal):
+        return
+    with open(shard_journal, "w", encoding="utf-8") as f:
+        for entry in _journal_entries(journal):
+            if shard_of(entry["url"], count) == index:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+def run_local_shards(cli_args):
+    """
+    Run the CLI as :attr:'cli_args.workers' processes on this machine, one
+    per shard, each with its own browsers, caches connections and per-shard
+    --output, --journal, --metrics and --profile files. The per-shard
+    results and journals are merged into --output and --journal once every
+    worker exited, and are kept so that --resume can pick up each shard.
+
+    :return: Exit code, 0 if every worker succeeded
+    :rtype: class:'int'
+    """
+    import multiprocessing
+
+    count = cli_args.workers
+    # A fresh interpreter per worker, nothing (e.g. a driver) is inherited
+    context = multiprocessing.get_context("spawn")
+    processes, outputs, journals = list(), list(), list()
+    for index in range(count):
+        shard_args = argparse.Namespace(**vars(cli_args))
+        shard_args.workers = None
+        shard_args.shard = (index, count)
+        shard_args.rate_share = cli_args.rate_share / count
+        for name in ("output", "journal", "metrics", "profile"):
+            path = getattr(cli_args, name)
+            if path is not None:
+                setattr(shard_args, name, shard_path(path, index, count))
+        if shard_args.output is not None:
+            outputs.append(shard_args.output)
+        if shard_args.journal is not None:
+            journals.append(shard_args.journal)
+            _seed_shard_journal(cli_args.journal, shard_args.journal,
+                                index, count)
+        process = context.Process(
+            target = _run_shard,
+            args = (shard_args,),
+            name = "shard{}-of-{}".format(index, count),
+            )
+        process.start()
+        processes.append(process)
+
+    failed = list()
+    for process in processes:
+        process.join()
+        if process.exitcode != 0:
+            failed.append(process.name)
+    if failed:
+        print("# Workers failed: {}".format(", ".join(failed)))
+
+    outputs = [path for path in outputs if os.path.exists(path)]
+    journals = [path for path in journals if os.path.exists(path)]
+    if outputs:
+        merge_shards(outputs, cli_args.output, cli_args.output_format)
+    if journals:
+        # Rewritten from the shard journals, which hold every shard's
+        # complete history
+        if os.path.exists(cli_args.journal):
+            os.remove(cli_args.journal)
+        merge_shards(journals, journal=cli_args.journal)
+    return 1 if failed else 0
+
+
+class ResolverJob:
+    """
+    A batch of URLs submitted to the :class:'ResolverService', run by
+    :func:'run_pipeline' in a thread of its own
+    """
+
+    def __init__(self, urls, download=False):
+        self.id = uuid.uuid4().hex
+        self.urls = urls
+        self.download = download
+        self.status = "queued"
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self.rows = list()
+        self._lock = threading.Lock()
+
+    def add(self, record):
+        row = result_row(record)
+        with self._lock:
+            self.rows.append(row)
+
+    def to_json(self, results=True):
+        with self._lock:
+            rows = sorted(self.rows, key=lambda row: row["index"])
+        document = {
+            "id": self.id,
+            "status": self.status,
+            "error": self.error,
+            "created": self.created,
+            "finished": self.finished,
+            "submitted": len(self.urls),
+            "completed": len(rows),
+            "failed": sum(row["status"] == "failed" for row in rows),
+            "low_confidence": sum(
+                row["status"] == "low-confidence" for row in rows
+                ),
+        }
+        if results:
+            document["results"] = rows
+        return document
+
+
+class ResolverService:
+    """
+    Keeps the WebDriver pool, HTTP session, caches and download scheduler
+    of the process warm and resolves Spotify URLs on request, see
+    :func:'serve'. Endpoints, all JSON:
+
+    - GET /health: liveness and the number of jobs
+    - POST /resolve {"url": ..., "download": false}: resolve a single track
+        and answer with its result row, see :func:'result_row'
+    - POST /jobs {"urls": [...], "download": false}: submit a batch, track,
+        playlist and album URLs, answers 202 with the job's id
+    - GET /jobs/<id>: status and, as they complete, results of a job
+    - GET /metrics: stage timings and counters as Prometheus text
+
+    :param max_jobs: Finished jobs kept for polling, the oldest are dropped
+    :type max_jobs: class:'int'
+    :param job_workers: Jobs run at the same time, the rest wait queued
+    :type job_workers: class:'int'
+    """
+
+    def __init__(self, cli_args, driver_pool=None, download_scheduler=None,
+                 metadata_cache=None, search_cache=None, max_jobs=1000,
+                 job_workers=2):
+        self.cli_args = cli_args
+        self.driver_pool = driver_pool
+        self.download_scheduler = download_scheduler
+        self.metadata_cache = metadata_cache
+        self.search_cache = search_cache
+        self.max_jobs = max_jobs
+        # Concurrent requests for the same track share its work
+        self._contexts = {
+            download: pipeline_context(
+                cli_args, driver_pool,
+                download_scheduler if download else None,
+                metadata_cache, search_cache, max_done=0,
+                )
+            for download in (False, True)
+        }
+        self._jobs = collections.OrderedDict()
+        self._jobs_lock = threading.Lock()
+        self._job_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=job_workers, thread_name_prefix="job"
+            )
+
+    def close(self):
+        self._job_executor.shutdown(wait=False, cancel_futures=True)
+
+    def warm_up(self):
+        """
+        Launch a browser now rather than on the first search that needs it
+        """
+        if self.driver_pool is not None \
+                and self.cli_args.search_backend == "selenium":
+            with self.driver_pool.driver():
+                pass
+        get_http_session()
+
+    def _download(self, payload):
+        download = bool(payload.get("download", self.cli_args.download))
+        if download and self.download_scheduler is None:
+            raise ValueError("Downloads are disabled, start with -d")
+        return download
+
+    def resolve(self, url, download=False):
+        """
+        Run the stages of the pipeline for one track URL in the calling
+        thread
+
+        :rtype: dict
+        """
+        kind, _ = spotify_url_kind(url)
+        if kind != "track":
+            raise ValueError("Not a Spotify track URL, submit playlists "
+                             "and albums as a job: {}".format(url))
+        context = self._contexts[download]
+        record = new_record(0, url)
+        for name, func, _ in _pipeline_stages(context):
+            if _stage_satisfied(name, record):
+                continue
+            try:
+                _run_stage(name, func, record, context)
+            except Exception:
+                break
+        return result_row(record)
+
+    def submit(self, urls, download=False):
+        job = ResolverJob(urls, download)
+        with self._jobs_lock:
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.max_jobs:
+                oldest = next(iter(self._jobs.values()))
+                if oldest.status in ("queued", "running"):
+                    break
+                self._jobs.popitem(last=False)
+        self._job_executor.submit(self._run_job, job)
+        return job
+
+    def job(self, job_id):
+        with self._jobs_lock:
+            return self._jobs.get(job_id)
+
+    def _run_job(self, job):
+        import asyncio
+        job.status = "running"
+        try:
+            prefetched = dict()
+            asyncio.run(run_pipeline(
+                expand_spotify_urls(job.urls, prefetched, self.metadata_cache),
+                self.cli_args,
+                self.driver_pool,
+                self.download_scheduler if job.download else None,
+                self.metadata_cache,
+                self.search_cache,
+                prefetched,
+                on_result = job.add,
+                ))
+        except Exception as e:
+            job.error = "{}: {}".format(type(e).__name__, e)
+            job.status = "failed"
+        else:
+            job.status = "done"
+        job.finished = time.time()
+
+    def handle(self, method, path, payload=None):
+        """
+        Answer an API request
+
+        :return: The (HTTP status, JSON document or text) pair
+        :rtype: tuple
+        """
+        path = urllib.parse.urlsplit(path).path.rstrip("/") or "/"
+        try:
+            if method == "GET" and path == "/health":
+                with self._jobs_lock:
+                    jobs = len(self._jobs)
+                return 200, {"status": "ok", "jobs": jobs}
+            if method == "GET" and path == "/metrics":
+                return 200, METRICS.to_prometheus()
+            if method == "POST" and path == "/resolve":
+                url = (payload or dict()).get("url")
+                if not isinstance(url, str):
+                    return 400, {"error": "expected {\"url\": ...}"}
+                return 200, self.resolve(url, self._download(payload))
+            if method == "POST" and path == "/jobs":
+                urls = (payload or dict()).get("urls")
+                if not isinstance(urls, list) or not urls \
+                        or not all(isinstance(url, str) for url in urls):
+                    return 400, {"error": "expected {\"urls\": [...]}"}
+                job = self.submit(urls, self._download(payload))
+                return 202, job.to_json(results=False)
+            if method == "GET" and path.startswith("/jobs/"):
+                job = self.job(path[len("/jobs/"):])
+                if job is None:
+                    return 404, {"error": "no such job"}
+                return 200, job.to_json()
+        except ValueError as e:
+            return 400, {"error": str(e)}
+        return 404, {"error": "no route for {} {}".format(method, path)}
+
+
+def make_server(address, service):
+    """
+    HTTP server of :param:'service' listening on :param:'address', either
+    "HOST:PORT" or "unix:/path/to/socket"
+    """
+    import http.server
+    import socketserver
+
+    class _ResolverRequestHandler(http.server.BaseHTTPRequestHandler):
+        server_version = "spotify2youtube"
+
+        def address_string(self):
+            # Unix socket peers have no address
+            return self.client_address[0] if self.client_address else "unix"
+
+        def log_message(self, format, *args):
+            if VERBOSE:
+                super().log_message(format, *args)
+
+        def _respond(self, status, document):
+            if isinstance(document, str):
+                body = document.encode("utf-8")
+                content_type = "text/plain; version=0.0.4"
+            else:
+                body = json.dumps(document, ensure_ascii=False).encode("utf-8")
+                content_type = "application/json"
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            self._respond(*self.server.service.handle("GET", self.path))
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            try:
+                payload = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                self._respond(400, {"error": "request body is not JSON"})
+                return
+            if not isinstance(payload, dict):
+                self._respond(400, {"error": "request body is not an object"})
+                return
+            self._respond(
+                *self.server.service.handle("POST", self.path, payload)
+                )
+
+
+    class _ThreadingUnixHTTPServer(socketserver.ThreadingMixIn,
+                                   socketserver.UnixStreamServer):
+        daemon_threads = True
+
+    if address.startswith("unix:"):
+        path = address[len("unix:"):]
+        if os.path.exists(path):
+            os.remove(path)     # Left over by a killed server
+        server = _ThreadingUnixHTTPServer(path, _ResolverRequestHandler)
+    else:
+        host, _, port = address.rpartition(":")
+        server = http.server.ThreadingHTTPServer(
+            (host or "127.0.0.1", int(port)), _ResolverRequestHandler
+            )
+    server.service = service
+    return server
+
+
+def serve(address, service):
+    """
+    Serve the API of :param:'service' until interrupted
+    """
+    server = make_server(address, service)
+    service.warm_up()
+    print("# Serving on {}".format(address))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if address.startswith("unix:") and os.path.exists(address[5:]):
+            os.remove(address[5:])
+
+
+def main(urls, cli_args):
+    """
+    Run the script for the URLs given in the CLI, see
+    :func:'read_cli_inputs'
+    """
+    global VERBOSE, PROFILER
+    VERBOSE = not cli_args.quiet
+    configure_rate_limiter(cli_args)
+    configure_match_scorer(cli_args)
+    if cli_args.profile is not None:
+        PROFILER = ThreadProfiler()
+    driver_pool = WebDriverPool(
+        size = cli_args.pool_size,
+        headless = cli_args.headless,
+        max_pages = cli_args.driver_max_pages,
+        max_memory_mb = cli_args.driver_max_memory,
+        lean = cli_args.top_n is not None,
+        )
+    download = cli_args.download
+    download_archive = open_download_archive(cli_args) if download else None
+    download_scheduler = DownloadScheduler(
+        workers = cli_args.download_workers,
+        timeout = cli_args.download_timeout,
+        retries = cli_args.download_retries,
+        audio_format = cli_args.audio_format,
+        transcode_workers = cli_args.transcode_workers,
+        download_dir = cli_args.download_dir,
+        archive = download_archive,
+        downloader = cli_args.downloader,
+        segments = cli_args.segments,
+        ) if download else None
+    metadata_cache = open_metadata_cache(cli_args)
+    search_cache = open_search_cache(cli_args)
+    # :TODO: cli_args should be fully redirected into spotify2youtube
+    with contextlib.ExitStack() as stack:
+        if PROFILER is not None:
+            stack.callback(PROFILER.dump, cli_args.profile)
+            stack.enter_context(PROFILER.profiling())
+        if cli_args.metrics is not None:
+            stack.callback(METRICS.write, cli_args.metrics)
+        stack.enter_context(driver_pool)
+        # The archive is closed after the last download finished
+        for resource in (download_archive, download_scheduler,
+                         metadata_cache, search_cache):
+            if resource is not None:
+                stack.enter_context(resource)
+
+        if cli_args.serve is not None:
+            serve(cli_args.serve, ResolverService(
+                cli_args, driver_pool, download_scheduler, metadata_cache,
+                search_cache,
+                ))
+            return
+
+        # Playlists, albums, shards and structured output are batches too
+        batch = cli_args.file is not None or cli_args.output is not None \
+            or cli_args.shard is not None or any(
+                spotify_url_kind(url)[0] in ("playlist", "album")
+                for url in urls
+                )
+        if batch:
+            prefetched = dict()
+            # Expanded lazily as the pipeline asks for more URLs
+            urls = expand_spotify_urls(urls, prefetched, metadata_cache)
+            journal, resume_state = None, None
+            if cli_args.journal is not None:
+                if cli_args.resume:
+                    resume_state = JobJournal.load(cli_args.journal)
+                journal = stack.enter_context(JobJournal(cli_args.journal))
+            writer = None
+            if cli_args.output is not None:
+                writer = stack.enter_context(ResultWriter(
+                    cli_args.output, cli_args.output_format
+                    ))
+                if cli_args.output == "-":
+                    # stdout carries the results only, the rest goes to
+                    # stderr
+                    stack.enter_context(
+                        contextlib.redirect_stdout(sys.stderr)
+                        )
+
+            def on_result(record):
+                if writer is not None:
+                    writer.write(record)
+                    if cli_args.output == "-":
+                        return
+                if record["error"] is not None:
+                    print(record["url"], "-> FAILED at {} ({})".format(
+                        record["failed_stage"], record["error"]
+                        ))
+                    return
+                print(record["url"], "->", record["matched_video_url"])
+                if record["download"] is not None:
+                    print(record["download"])
+
+            import asyncio
+            if VERBOSE:
+                print("\t_Pipeline-Results_")
+            asyncio.run(run_pipeline(
+                urls, cli_args, driver_pool, download_scheduler,
+                metadata_cache, search_cache, prefetched, journal,
+                resume_state, on_result, cli_args.shard,
+                ))
+        else:
+            for url in urls:
+                matched_video_url, song_data = spotify2youtube(
+                    url, cli_args, driver_pool, metadata_cache, search_cache
+                    )
+                if matched_video_url is None:
+                    print("# No video matched {}, none found or none "
+                          "within the duration tolerance".format(url),
+                          file=sys.stderr)
+                elif cli_args.download:
+                    result = download_scheduler.submit(
+                        matched_video_url, song_data, spotify_track_id(url)
+                        ).result()
+                    print(result)
+
+
+if __name__ == '__main__':
+
+    skip = 0   # Debug Mode
+
+    urls, cli_args = read_cli_inputs(skip)  
+    if cli_args.merge is not None:
+        merge_shards(cli_args.merge, cli_args.output, cli_args.output_format,
+                     cli_args.journal)
+    elif cli_args.prune_archive:
+        prune_download_archive(cli_args)
+    elif cli_args.workers is not None:
+        sys.exit(run_local_shards(cli_args))
+    else:
+        main(urls, cli_args)
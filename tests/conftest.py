@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, "benchmarks"))
+
+import retrieve_songs  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def quiet(monkeypatch):
+    """
+    Run every test without the per-video console output and with fresh
+    metrics
+    """
+    monkeypatch.setattr(retrieve_songs, "VERBOSE", False)
+    monkeypatch.setattr(retrieve_songs, "METRICS", retrieve_songs.Metrics())
@@ -0,0 +1,53 @@
+import os
+
+import pytest
+
+from retrieve_songs import DownloadArchive
+
+VIDEO_ID = "dQw4w9WgXcQ"
+
+
+@pytest.fixture
+def archive(tmp_path):
+    with DownloadArchive(str(tmp_path / "archive.sqlite3")) as archive:
+        yield archive
+
+
+def write(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+    return str(path)
+
+
+def test_archive_reuses_unchanged_files(archive, tmp_path):
+    path = write(tmp_path / "song.opus", b"audio" * 100)
+    archive.record(VIDEO_ID, "opus", path)
+    assert len(archive) == 1
+    assert archive.lookup(VIDEO_ID, "opus") == path
+    assert archive.lookup(VIDEO_ID, "mp3") is None
+    # Touched but the same content is still reused
+    os.utime(path, (1, 1))
+    assert archive.lookup(VIDEO_ID, "opus") == path
+
+
+@pytest.mark.parametrize("change", ["remove", "size", "content"])
+def test_archive_drops_changed_files(archive, tmp_path, change):
+    path = write(tmp_path / "song.opus", b"audio" * 100)
+    archive.record(VIDEO_ID, "opus", path)
+    if change == "remove":
+        os.remove(path)
+    elif change == "size":
+        write(path, b"audio" * 101)
+    else:
+        write(path, b"AUDIO" * 100)
+        os.utime(path, (1, 1))
+    assert archive.lookup(VIDEO_ID, "opus") is None
+    assert len(archive) == 0
+
+
+def test_archive_tracks(archive, tmp_path):
+    path = write(tmp_path / "song.opus", b"audio")
+    archive.record_track("64f5bf2jyAkrsucnG9FXot", "opus", VIDEO_ID, path)
+    assert archive.track("64f5bf2jyAkrsucnG9FXot", "opus") \
+        == (VIDEO_ID, path)
+    assert archive.track("64f5bf2jyAkrsucnG9FXot", "mp3") is None
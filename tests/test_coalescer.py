@@ -0,0 +1,90 @@
+import threading
+import time
+
+import pytest
+
+from retrieve_songs import Coalescer
+
+
+def test_coalescer_runs_concurrent_duplicates_once():
+    coalescer = Coalescer("test")
+    calls = list()
+    started = threading.Event()
+
+    def work(key):
+        calls.append(key)
+        started.set()
+        time.sleep(0.2)
+        return key.upper()
+
+    results = list()
+    threads = [
+        threading.Thread(target=lambda: results.append(
+            coalescer.run("a", work, "a")
+            ))
+        for _ in range(4)
+    ]
+    threads[0].start()
+    started.wait()
+    for thread in threads[1:]:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert calls == ["a"] and results == ["A"] * 4
+    # Finished results are shared too
+    assert coalescer.run("a", work, "a") == "A" and calls == ["a"]
+
+
+def test_coalescer_does_not_keep_failures():
+    coalescer = Coalescer("test", max_done=1)
+    attempts = list()
+
+    def flaky():
+        attempts.append(None)
+        if len(attempts) == 1:
+            raise OSError("first attempt fails")
+        return len(attempts)
+
+    with pytest.raises(OSError):
+        coalescer.run("a", flaky)
+    assert coalescer.run("a", flaky) == 2
+    # Only the last max_done results are kept
+    coalescer.run("b", lambda: "b")
+    assert coalescer.run("a", flaky) == 3
+
+
+def test_coalescer_retries_rejected_results_once():
+    coalescer = Coalescer("test", keep=lambda result: result != "failed")
+    attempts = list()
+    started = threading.Event()
+
+    def download():
+        attempts.append(None)
+        started.set()
+        time.sleep(0.2)
+        return "failed" if len(attempts) == 1 else "ok"
+
+    results = list()
+    threads = [
+        threading.Thread(target=lambda: results.append(
+            coalescer.run("a", download)
+            ))
+        for _ in range(3)
+    ]
+    threads[0].start()
+    started.wait()
+    for thread in threads[1:]:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # The leader's failure is not shared, the waiters try once more together
+    assert len(attempts) == 2
+    assert sorted(results) == ["failed", "ok", "ok"]
+    assert coalescer.run("a", download) == "ok" and len(attempts) == 2
+
+
+def test_coalescer_does_not_keep_rejected_results():
+    coalescer = Coalescer("test", keep=lambda result: result != "failed")
+    results = iter(["failed", "ok"])
+    assert coalescer.run("a", lambda: next(results)) == "failed"
+    assert coalescer.run("a", lambda: next(results)) == "ok"
@@ -0,0 +1,71 @@
+import pytest
+
+import retrieve_songs
+from retrieve_songs import DownloadResult, DownloadStatus, JobJournal
+
+URL = "https://open.spotify.com/track/64f5bf2jyAkrsucnG9FXot"
+VIDEO_URL = retrieve_songs.YOUTUBE_BASE_URL + "/watch?v=dQw4w9WgXcQ"
+
+
+def finished_record(confidence=0.9):
+    record = retrieve_songs.new_record(0, URL)
+    record["song_data"] = {"song": "Song", "artists": ["Artist"],
+                           "duration": 200, "search_query": "song+artist"}
+    record["search_query"] = "song+artist"
+    record["matched_video_url"] = VIDEO_URL
+    record["score"] = 0.5
+    record["confidence"] = confidence
+    record["download"] = DownloadResult(VIDEO_URL, DownloadStatus.OK,
+                                        returncode=0)
+    return record
+
+
+def journal_run(path, record, stages):
+    with JobJournal(path) as journal:
+        for stage in stages:
+            journal.record(URL, stage, "ok",
+                           **retrieve_songs._journal_fields(stage, record))
+
+
+def test_resume_round_trip(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    journal_run(path, finished_record(),
+                ["metadata", "search", "match", "download"])
+    # A torn last line of a killed run is skipped
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"url": "' + URL + '", "stage": "dow')
+
+    record = retrieve_songs.new_record(0, URL)
+    retrieve_songs._resume_record(record, JobJournal.load(path)[URL])
+    assert record["song_data"] == finished_record()["song_data"]
+    assert record["search_query"] == "song+artist"
+    assert (record["matched_video_url"], record["score"],
+            record["confidence"]) == (VIDEO_URL, 0.5, 0.9)
+    assert record["download"].ok
+    for stage in ("metadata", "search", "match", "download"):
+        assert retrieve_songs._stage_satisfied(stage, record)
+
+
+def test_failed_stages_run_again(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    journal_run(path, finished_record(), ["metadata"])
+    with JobJournal(path) as journal:
+        journal.record(URL, "search", "failed", error="TimeoutError: ")
+
+    record = retrieve_songs.new_record(0, URL)
+    retrieve_songs._resume_record(record, JobJournal.load(path)[URL])
+    assert retrieve_songs._stage_satisfied("metadata", record)
+    assert not retrieve_songs._stage_satisfied("search", record)
+
+
+@pytest.mark.parametrize("min_confidence, low", [
+    (None, False), (0.5, False), (0.95, True),
+])
+def test_resume_judges_confidence_again(tmp_path, min_confidence, low):
+    path = str(tmp_path / "journal.jsonl")
+    journal_run(path, finished_record(confidence=0.9),
+                ["metadata", "match"])
+    record = retrieve_songs.new_record(0, URL)
+    retrieve_songs._resume_record(record, JobJournal.load(path)[URL],
+                                  min_confidence)
+    assert record["low_confidence"] is low
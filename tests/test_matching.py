@@ -0,0 +1,131 @@
+import random
+
+import pytest
+
+import retrieve_songs
+from retrieve_songs import MatchScorer, VideoCandidate
+
+WORDS = "love night song blue fire dream heart light".split()
+
+
+def random_songs(count, seed=2022):
+    """
+    Songs with candidate lists full of near duplicates, equal scores and
+    unknown durations and views, where the tie-breaks decide
+    """
+    rng = random.Random(seed)
+    songs = list()
+    for index in range(count):
+        song = " ".join(rng.sample(WORDS, 2)).title()
+        artist = "Artist{}".format(rng.randint(0, 3))
+        song_data = {
+            "song": song,
+            "artists": [artist],
+            "duration": rng.choice([None, 200, 240]),
+            "search_query": (song + " " + artist).lower().replace(" ", "+"),
+        }
+        video_list = [
+            VideoCandidate(
+                rng.choice([song, song + " live",
+                            " ".join(rng.sample(WORDS, 2))]),
+                "/watch?v={}_{}".format(index, position),
+                rng.choice([artist, "Other"]),
+                rng.choice([None, 195, 200, 205, 240, 300]),
+                rng.choice([None, 10, 1000, 1000]),
+                )
+            for position in range(rng.randint(0, 8))
+        ]
+        songs.append((song_data, video_list))
+    return songs
+
+
+@pytest.fixture(params=["numpy", "python"])
+def batch_path(request, monkeypatch):
+    """
+    Run MatchScorer.best_many with numpy, and with numpy hidden
+    """
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    monkeypatch.setattr(retrieve_songs, "_NUMPY_AVAILABLE",
+                        request.param == "numpy")
+    return request.param
+
+
+@pytest.mark.parametrize("duration_tolerance", [None, 20.0])
+def test_batch_matches_single(batch_path, duration_tolerance):
+    scorer = MatchScorer(duration_tolerance=duration_tolerance)
+    songs = random_songs(300)
+    single = [
+        retrieve_songs.best_video_match(song_data, video_list, scorer)[0]
+        for song_data, video_list in songs
+    ]
+    batch = retrieve_songs.match_songs_and_videos(
+        [song_data["search_query"] for song_data, _ in songs],
+        [video_list for _, video_list in songs],
+        scorer,
+        [song_data for song_data, _ in songs],
+        )
+    assert batch == single
+    assert None in single and any(url is not None for url in single)
+
+
+def test_batch_scores_with_numpy(monkeypatch):
+    np = pytest.importorskip("numpy")
+    monkeypatch.setattr(retrieve_songs, "_NUMPY_AVAILABLE", None)
+    assert retrieve_songs._numpy_available()
+    calls = list()
+    asarray = np.asarray
+    monkeypatch.setattr(
+        np, "asarray",
+        lambda *args, **kwargs: calls.append(None) or asarray(*args, **kwargs),
+        )
+    songs = random_songs(20)
+    batch = retrieve_songs.match_songs_and_videos(
+        [song_data["search_query"] for song_data, _ in songs],
+        [video_list for _, video_list in songs],
+        MatchScorer(),
+        [song_data for song_data, _ in songs],
+        )
+    assert calls
+    assert batch == [
+        retrieve_songs.best_video_match(song_data, video_list)[0]
+        for song_data, video_list in songs
+    ]
+
+
+def test_empty_video_list():
+    song_data = {"song": "Song", "artists": ["Artist"],
+                 "search_query": "song+artist"}
+    assert retrieve_songs.best_video_match(song_data, []) == (None, None, 0.0)
+    assert retrieve_songs.match_songs_and_videos(
+        ["song+artist"], [[]], None, [song_data]
+        ) == [None]
+
+
+def test_ties_go_to_closest_duration_then_most_views():
+    song_data = {"song": "Song", "artists": ["Artist"], "duration": 200,
+                 "search_query": "song+artist"}
+    video_list = [
+        VideoCandidate("Song", "/watch?v=far", "Artist", 230, 10**6),
+        VideoCandidate("Song", "/watch?v=few", "Artist", 201, 10),
+        VideoCandidate("Song", "/watch?v=many", "Artist", 199, 10**4),
+        VideoCandidate("Song", "/watch?v=unknown", "Artist"),
+    ]
+    url, _, _ = retrieve_songs.best_video_match(song_data, video_list)
+    assert url == retrieve_songs.YOUTUBE_BASE_URL + "/watch?v=many"
+
+
+def test_prefilter_drops_videos_off_the_duration():
+    scorer = MatchScorer(duration_tolerance=20.0)
+    song_data = {"song": "Song", "artists": ["Artist"], "duration": 200,
+                 "search_query": "song+artist"}
+    video_list = [
+        VideoCandidate("Song Artist", "/watch?v=long", "Artist", 600),
+        VideoCandidate("Song", "/watch?v=close", "Other", 210),
+        VideoCandidate("Song", "/watch?v=unknown", "Other"),
+    ]
+    assert [video.href for video in scorer.prefilter(song_data, video_list)] \
+        == ["/watch?v=close", "/watch?v=unknown"]
+    url, _, _ = retrieve_songs.best_video_match(song_data, video_list[:1],
+                                                scorer)
+    assert url is None
@@ -0,0 +1,49 @@
+import types
+
+import pytest
+
+from retrieve_songs import HostRateLimiter
+
+
+def response(url, status_code=200, redirects=()):
+    """
+    Stand-in of a requests.Response that was redirected from redirects
+    """
+    return types.SimpleNamespace(
+        url = url,
+        status_code = status_code,
+        history = [
+            types.SimpleNamespace(headers={"Location": location})
+            for location in redirects
+        ],
+        )
+
+
+@pytest.mark.parametrize("status_code", HostRateLimiter.THROTTLE_STATUS)
+def test_throttle_status(status_code):
+    assert HostRateLimiter().is_throttled(response(
+        "https://www.youtube.com/results?search_query=song", status_code
+        ))
+
+
+@pytest.mark.parametrize("url, redirects", [
+    ("https://www.google.com/sorry/index?continue=https://www.youtube.com/",
+     ()),
+    ("https://www.youtube.com/results?search_query=song",
+     ["https://www.google.com/sorry/index?continue=x"]),
+    ("https://www.youtube.com/das_captcha?next=/results", ()),
+])
+def test_captcha_pages_are_throttled(url, redirects):
+    assert HostRateLimiter().is_throttled(response(url, 200, redirects))
+
+
+@pytest.mark.parametrize("url", [
+    # The markers in a query or in a path of another host are not captchas
+    "https://www.youtube.com/results?search_query=captcha+sorry+song",
+    "https://www.youtube.com/results?search_query=das_captcha",
+    "https://open.spotify.com/track/1JYxCgv4Jlx2X4SYNtXgkB?si=/sorry/",
+    "https://www.youtube.com/sorry/index",
+    "https://www.example.com/sorry/",
+])
+def test_normal_pages_are_not_throttled(url):
+    assert not HostRateLimiter().is_throttled(response(url))
@@ -0,0 +1,25 @@
+import argparse
+
+import pytest
+
+from retrieve_songs import ResolverService
+
+
+@pytest.fixture
+def service():
+    # Started without -d, i.e. without a download scheduler
+    service = ResolverService(argparse.Namespace(download=False))
+    yield service
+    service.close()
+
+
+@pytest.mark.parametrize("path, payload", [
+    ("/resolve", {"url": "https://open.spotify.com/track/x",
+                  "download": True}),
+    ("/jobs", {"urls": ["https://open.spotify.com/track/x"],
+               "download": True}),
+])
+def test_downloads_are_refused_without_a_scheduler(service, path, payload):
+    status, document = service.handle("POST", path, payload)
+    assert status == 400
+    assert document == {"error": "Downloads are disabled, start with -d"}
@@ -0,0 +1,76 @@
+import argparse
+
+import retrieve_songs
+from retrieve_songs import CachedMatch, MatchScorer, SearchCache, \
+    VideoCandidate
+
+QUERY = "song+artist"
+VIDEOS = [
+    VideoCandidate("Song (Extended)", "/watch?v=extended", "Artist", 420),
+    VideoCandidate("Song", "/watch?v=radio", "Artist", 200),
+]
+
+
+def song(duration):
+    return {"song": "Song", "artists": ["Artist"], "duration": duration,
+            "search_query": QUERY}
+
+
+def test_matches_are_kept_per_key(tmp_path):
+    scorer = MatchScorer(duration_tolerance=20.0)
+    with SearchCache(str(tmp_path / "cache.sqlite3")) as cache:
+        cache.put_videos(QUERY, VIDEOS)
+        cache.put_match(QUERY, "https://www.youtube.com/watch?v=radio",
+                        0.5, 0.9, scorer.cache_key(song(200)))
+
+        assert cache.get_match_details(QUERY, scorer.cache_key(song(200))) \
+            == CachedMatch("https://www.youtube.com/watch?v=radio", 0.5, 0.9)
+        # Another duration or other scorer settings match again
+        assert cache.get_match(QUERY, scorer.cache_key(song(420))) is None
+        assert cache.get_match(
+            QUERY, MatchScorer().cache_key(song(200))
+            ) is None
+        # The videos stay shared by every key
+        assert cache.get_videos(QUERY) == VIDEOS
+
+
+def test_cached_search_scores_again_for_another_key(tmp_path, monkeypatch):
+    monkeypatch.setattr(retrieve_songs, "MATCH_SCORER",
+                        MatchScorer(duration_tolerance=20.0))
+    cli_args = argparse.Namespace(refresh=False)
+    with SearchCache(str(tmp_path / "cache.sqlite3")) as cache:
+        cache.put_videos(QUERY, VIDEOS)
+        key = retrieve_songs.MATCH_SCORER.cache_key(song(200))
+        cache.put_match(QUERY, "https://www.youtube.com/watch?v=radio",
+                        0.5, 0.9, key)
+
+        video_list, cached_match = retrieve_songs.cached_youtube_search(
+            QUERY, cli_args, search_cache=cache, match_key=key
+            )
+        assert video_list is None and cached_match.confidence == 0.9
+
+        other = retrieve_songs.MATCH_SCORER.cache_key(song(420))
+        video_list, cached_match = retrieve_songs.cached_youtube_search(
+            QUERY, cli_args, search_cache=cache, match_key=other
+            )
+        assert cached_match is None and video_list == VIDEOS
+        url, _, _ = retrieve_songs.best_video_match(song(420), video_list)
+        assert url.endswith("/watch?v=extended")
+
+
+def test_cached_match_is_judged_by_min_confidence(tmp_path):
+    cli_args = argparse.Namespace(refresh=False, min_confidence=0.95)
+    with SearchCache(str(tmp_path / "cache.sqlite3")) as cache:
+        record = retrieve_songs.new_record(0, "https://open.spotify.com/"
+                                              "track/1JYxCgv4Jlx2X4SYNtXgkB")
+        record["song_data"], record["search_query"] = song(200), QUERY
+        cache.put_videos(QUERY, VIDEOS)
+        cache.put_match(QUERY, "https://www.youtube.com/watch?v=radio",
+                        0.5, 0.9,
+                        retrieve_songs.MATCH_SCORER.cache_key(song(200)))
+
+        context = retrieve_songs.pipeline_context(cli_args,
+                                                  search_cache=cache)
+        retrieve_songs._stage_search(record, context)
+        assert record["confidence"] == 0.9
+        assert record["low_confidence"]
@@ -0,0 +1,97 @@
+import hashlib
+import os
+import threading
+
+import pytest
+
+import retrieve_songs
+import standin_server
+from retrieve_songs import SegmentedDownloadError
+
+VIDEO_ID = "dQw4w9WgXcQ"
+MEDIA_KB = 1024
+
+
+def write(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+    return str(path)
+
+
+@pytest.fixture(scope="module")
+def server():
+    """
+    standin_server.py in a thread, serving MEDIA_KB of media per video
+    """
+    options = standin_server.build_argparser().parse_args([
+        "--port", "0", "--inject", "", "--media-kb", str(MEDIA_KB),
+        ])
+    server = standin_server.StandinServer(("127.0.0.1", 0), options)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def media(video_id=VIDEO_ID):
+    return standin_server.media_bytes(video_id, 0, MEDIA_KB * 1024)
+
+
+def media_url(server, video_id=VIDEO_ID):
+    return "{}/watch?v={}".format(server.url, video_id)
+
+
+def test_fetch_segmented(server, tmp_path):
+    path = str(tmp_path / "song.webm")
+    size = retrieve_songs.fetch_segmented(
+        media_url(server), path, segments=4, timeout=10,
+        expected_size=MEDIA_KB * 1024,
+        )
+    assert size == MEDIA_KB * 1024
+    with open(path, "rb") as f:
+        assert f.read() == media()
+    assert os.listdir(str(tmp_path)) == ["song.webm"]
+
+
+def test_fetch_segmented_resumes(server, tmp_path):
+    path = str(tmp_path / "song.webm")
+    partial = path + ".part"
+    size = MEDIA_KB * 1024
+    ranges = retrieve_songs.plan_segments(size, 4)
+    # A killed run that finished the first range and half of the second
+    done = [ranges[0][1] - ranges[0][0],
+            (ranges[1][1] - ranges[1][0]) // 2] + [0] * (len(ranges) - 2)
+    data = bytearray(size)
+    for (start, _), count in zip(ranges, done):
+        data[start:start + count] = media()[start:start + count]
+    write(partial, bytes(data))
+    etag = '"{}-{}"'.format(
+        hashlib.sha256(VIDEO_ID.encode("utf-8")).hexdigest()[:16], size
+        )
+    retrieve_songs._write_segment_state(partial + ".segments.json", {
+        "size": size, "validator": etag, "ranges": ranges, "done": done,
+        })
+
+    retrieve_songs.fetch_segmented(media_url(server), path, timeout=10)
+    with open(path, "rb") as f:
+        assert f.read() == media()
+    counters = retrieve_songs.METRICS.summary()["counters"]
+    assert counters["segments_resumed"] == 1
+
+
+def test_fetch_segmented_checks_the_size(server, tmp_path):
+    with pytest.raises(SegmentedDownloadError):
+        retrieve_songs.fetch_segmented(
+            media_url(server), str(tmp_path / "song.webm"), timeout=10,
+            expected_size=MEDIA_KB * 1024 + 1,
+            )
+
+
+def test_segments_written_counts_complete_tiling_ranges():
+    state = {"size": 10, "ranges": [[0, 5], [5, 10]], "done": [5, 4]}
+    assert retrieve_songs._segments_written(state) == 5
+    state["done"] = [5, 5]
+    assert retrieve_songs._segments_written(state) == 10
+    state["ranges"] = [[0, 5], [6, 10]]
+    assert retrieve_songs._segments_written(state) != 10
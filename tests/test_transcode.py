@@ -0,0 +1,80 @@
+import json
+import os
+import sys
+
+import pytest
+
+import retrieve_songs
+from retrieve_songs import DownloadScheduler
+
+VIDEO_URL = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+SONG_DATA = {"song": "Song", "artists": ["Artist"]}
+
+# Writes the file of the output template and prints the template of --print,
+# like yt-dlp does for a video whose best audio is opus in webm
+YT_DLP = """#!{python}
+import sys
+args = sys.argv[1:]
+path = args[args.index("--output") + 1] % {{"ext": "webm"}}
+with open(path, "wb") as f:
+    f.write(b"opus in webm")
+template = args[args.index("--print") + 1]
+print(template[len("after_move:"):] % {{"acodec": "opus", "filepath": path}})
+"""
+
+# Records its arguments and copies the input to the output
+FFMPEG = """#!{python}
+import json, shutil, sys
+args = sys.argv[1:]
+with open({log!r}, "a") as f:
+    f.write(json.dumps(args) + "\\n")
+shutil.copyfile(args[args.index("-i") + 1], args[-1])
+"""
+
+
+def write_executable(path, text):
+    with open(path, "w") as f:
+        f.write(text)
+    os.chmod(path, 0o755)
+
+
+@pytest.fixture
+def ffmpeg_log(tmp_path, monkeypatch):
+    """
+    yt-dlp and ffmpeg stand-ins first on the PATH, the arguments ffmpeg
+    was run with are logged to the returned file
+    """
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    log = str(tmp_path / "ffmpeg.log")
+    write_executable(bin_dir / "yt-dlp", YT_DLP.format(python=sys.executable))
+    write_executable(bin_dir / "ffmpeg",
+                     FFMPEG.format(python=sys.executable, log=log))
+    monkeypatch.setenv("PATH", str(bin_dir) + os.pathsep
+                       + os.environ.get("PATH", ""))
+    return log
+
+
+def ffmpeg_runs(log):
+    with open(log) as f:
+        return [json.loads(line) for line in f]
+
+
+@pytest.mark.skipif(os.name == "nt", reason="the stand-ins run by their shebang")
+@pytest.mark.parametrize("audio_format, remuxed", [
+    ("opus", True),
+    ("mp3", False),
+])
+def test_deferred_download_remuxes_audio_in_the_codec(ffmpeg_log, tmp_path,
+                                                      audio_format, remuxed):
+    with DownloadScheduler(workers=1, retries=0, audio_format=audio_format,
+                           transcode_workers=1,
+                           download_dir=str(tmp_path / "music")) as scheduler:
+        result = scheduler.submit(VIDEO_URL, SONG_DATA).result()
+    assert result.ok and result.acodec == "opus"
+    assert result.path.endswith("." + audio_format)
+    assert os.path.exists(result.path)
+    (arguments,) = ffmpeg_runs(ffmpeg_log)
+    assert ("copy" in arguments) == remuxed
+    counters = retrieve_songs.METRICS.summary()["counters"]
+    assert counters.get("transcode_remuxed", 0) == int(remuxed)